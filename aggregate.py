@@ -0,0 +1,221 @@
+#!/usr/bin/env python3.6
+
+"""
+Group-by aggregation of result CSVs.
+
+The rows of a test case are grouped once by their parameter columns.  Within each group the values of a result
+column are sorted once, so the percentiles of all groups are computed together by indexing into the sorted values,
+and bootstrap resamples are drawn as indices into the sorted values for all groups at once.  NaN values (e.g.
+removed outliers) are excluded from the statistics of their column only.
+
+Query the results of a test case from the command line:
+
+    python3.6 aggregate.py raw/<timestamp>_repo_hopping.csv --by lease_time --where routing_interval=0.1
+"""
+
+from typing import Dict, List, Sequence, Tuple, Union
+
+import argparse
+import sys
+
+import numpy as np
+
+import results
+
+
+# Columns of the result CSVs, parameters first
+COLUMNS: Dict[str, List[str]] = {
+    'scaling': ['n', 'interval', 'time', 'ok'],
+    'repo_hopping': ['routing_interval', 'hopping_interval', 'lease_time', 'success', 'success_ooo', 'duration'],
+    'overhead': ['n', 'interval', 'prefixes', 'packets', 'bytes', 'cpu', 'ok'],
+    'throughput': ['n', 'consumers', 'offered', 'throughput', 'p50', 'p99', 'loss', 'ok'],
+    'failure': ['n', 'interval', 'gap', 'withdrawal', 'alternate', 'lost', 'sent', 'ok'],
+}
+PARAMS: Dict[str, List[str]] = {
+    'scaling': ['n', 'interval'],
+    'repo_hopping': ['routing_interval', 'hopping_interval', 'lease_time'],
+    'overhead': ['n', 'interval', 'prefixes'],
+    'throughput': ['n', 'consumers'],
+    'failure': ['n', 'interval'],
+}
+
+PERCENTILES = [5, 25, 50, 75, 95]
+
+# Upper bound for the number of resampled values held in memory at once
+_BOOTSTRAP_CHUNK = 1 << 22
+
+
+class Aggregation(object):
+
+    def __init__(self, rows: np.ndarray, columns: List[str]):
+        self.rows = rows
+        self.columns = columns
+
+    def column(self, name: str) -> np.ndarray:
+        return self.rows[:, self.columns.index(name)]
+
+    def where(self, **conditions: float) -> 'Aggregation':
+        """The rows whose columns equal the given values."""
+        mask = np.ones(len(self.rows), dtype=bool)
+        for name, value in conditions.items():
+            mask &= self.column(name) == float(value)
+        return Aggregation(self.rows[mask], self.columns)
+
+    def groupby(self, *by: str) -> 'Groups':
+        return Groups(self, list(by))
+
+
+class Groups(object):
+
+    def __init__(self, aggregation: Aggregation, by: List[str]):
+        self.aggregation = aggregation
+        self.by = by
+        rows = aggregation.rows
+        if len(rows) == 0:
+            self.keys = np.zeros((0, len(by)))
+            self._inverse = np.zeros(0, dtype=np.int64)
+        else:
+            self.keys, inverse = np.unique(rows[:, [aggregation.columns.index(b) for b in by]], axis=0,
+                                           return_inverse=True)
+            self._inverse = inverse.reshape(-1)
+        self.size = np.bincount(self._inverse, minlength=len(self.keys))
+        self._start = np.concatenate([[0], np.cumsum(self.size)[:-1]]).astype(np.int64)
+        # column -> (values sorted by group and value, number of non-NaN values per group)
+        self._sorted: Dict[str, Tuple[np.ndarray, np.ndarray]] = dict()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _values(self, column: str) -> Tuple[np.ndarray, np.ndarray]:
+        if column not in self._sorted:
+            v = self.aggregation.column(column)
+            # NaN sorts last, so the valid values of a group are at the start of its range.
+            order = np.lexsort((v, self._inverse))
+            count = np.bincount(self._inverse, weights=~np.isnan(v), minlength=len(self.keys)).astype(np.int64)
+            self._sorted[column] = v[order], count
+        return self._sorted[column]
+
+    def count(self, column: str) -> np.ndarray:
+        return self._values(column)[1]
+
+    def values(self, column: str) -> List[np.ndarray]:
+        """The sorted non-NaN values of each group, e.g. as boxplot input."""
+        v, count = self._values(column)
+        return [v[s:s + c] for s, c in zip(self._start, count)]
+
+    def mean(self, column: str) -> np.ndarray:
+        v, count = self._values(column)
+        sums = np.bincount(np.sort(self._inverse), weights=np.nan_to_num(v), minlength=len(self.keys))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(count > 0, sums / np.maximum(count, 1), np.nan)
+
+    def percentile(self, column: str, q: Union[float, Sequence[float]]) -> np.ndarray:
+        """Linearly interpolated percentiles of each group: shape (groups,) for a scalar q, else (len(q), groups)."""
+        v, count = self._values(column)
+        return _percentile(v, self._start, count, q)
+
+    def median(self, column: str) -> np.ndarray:
+        return self.percentile(column, 50)
+
+    def min(self, column: str) -> np.ndarray:
+        return self.percentile(column, 0)
+
+    def max(self, column: str) -> np.ndarray:
+        return self.percentile(column, 100)
+
+    def bootstrap_ci(self, column: str, statistic: Union[str, float] = 'median', level: float = 0.95,
+                     resamples: int = 1000, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Percentile bootstrap confidence interval of a statistic of each group.
+        :param statistic: 'mean', 'median', or a percentile
+        :return: The lower and upper bounds, NaN for groups without values
+        """
+        v, count = self._values(column)
+        q = 50 if statistic == 'median' else statistic
+        nonempty = np.flatnonzero(count > 0)
+        low = np.full(len(self.keys), np.nan)
+        high = np.full(len(self.keys), np.nan)
+        if len(nonempty) == 0:
+            return low, high
+        counts = count[nonempty]
+        # Position of each group's values in a resample, and the group each resampled value belongs to
+        offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        owner = np.repeat(np.arange(len(nonempty)), counts)
+        base = self._start[nonempty][owner]
+        rng = np.random.RandomState(seed)
+        stats = np.empty((resamples, len(nonempty)))
+        chunk = max(1, _BOOTSTRAP_CHUNK // len(owner))
+        for b in range(0, resamples, chunk):
+            n = min(chunk, resamples - b)
+            idx = base + (rng.random_sample((n, len(owner))) * counts[owner]).astype(np.int64)
+            if q == 'mean':
+                stats[b:b + n] = np.add.reduceat(v[idx], offsets, axis=1) / counts
+            else:
+                # The groups occupy disjoint, ascending ranges of the sorted values: sorting the indices sorts the
+                # resampled values within each group and keeps the groups in place.
+                idx.sort(axis=1)
+                stats[b:b + n] = _percentile(v[idx], offsets, counts, q)
+        alpha = (1.0 - level) / 2 * 100
+        low[nonempty], high[nonempty] = np.percentile(stats, [alpha, 100 - alpha], axis=0)
+        return low, high
+
+    def table(self, column: str, percentiles: Sequence[float] = PERCENTILES, ci: bool = True,
+              **bootstrap) -> Tuple[List[str], np.ndarray]:
+        """Summary of a column per group: the group keys, count, mean, percentiles and a CI of the median."""
+        header = self.by + ['count', 'mean'] + [f'p{p:g}' for p in percentiles]
+        data = [self.keys, self.count(column)[:, None], self.mean(column)[:, None],
+                self.percentile(column, list(percentiles)).T]
+        if ci:
+            header += ['ci_low', 'ci_high']
+            data += [np.stack(self.bootstrap_ci(column, **bootstrap), axis=1)]
+        return header, np.concatenate(data, axis=1)
+
+
+def _percentile(v: np.ndarray, start: np.ndarray, count: np.ndarray, q: Union[float, Sequence[float]]) -> np.ndarray:
+    """Percentiles of the sorted ranges v[start:start+count] along the last axis of v."""
+    q = np.asarray(q, dtype=np.float64)
+    pos = q[..., None] / 100.0 * np.maximum(count - 1, 0)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.minimum(lo + 1, np.maximum(count - 1, 0))
+    frac = pos - lo
+    a = np.take(v, start + lo, axis=-1)
+    b = np.take(v, start + hi, axis=-1)
+    result = a + (b - a) * frac
+    return np.where(count > 0, result, np.nan)
+
+
+def write_table(filename: str, header: List[str], rows: np.ndarray):
+    with open(filename, 'w') as f:
+        f.write(','.join(header) + '\n')
+        for row in rows:
+            f.write(','.join('' if np.isnan(x) else f'{x:.6g}' for x in row) + '\n')
+
+
+def load(filename: str, case: str) -> Aggregation:
+    columns = COLUMNS[case]
+    return Aggregation(results.load_csv(filename, len(columns)), columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(sys.argv[0], description='Summarize a result CSV per parameter group')
+    parser.add_argument('csv', nargs='+')
+    parser.add_argument('--case', choices=COLUMNS.keys(), default=None,
+                        help='Column layout, default: guessed from the file name')
+    parser.add_argument('--by', nargs='+', default=None, help='Group by these columns, default: all parameters')
+    parser.add_argument('--where', nargs='*', default=[], metavar='COLUMN=VALUE')
+    parser.add_argument('--value', default=None, help='Result column, default: the first one')
+    parser.add_argument('--sort', default='p50', help='Sort the groups by this summary column, descending')
+    args = parser.parse_args()
+    case = args.case or next((c for c in ['repo_hopping', 'overhead', 'throughput', 'failure'] if c in args.csv[0]),
+                             'scaling')
+    columns = COLUMNS[case]
+    agg = Aggregation(np.concatenate([results.load_csv(f, len(columns)) for f in args.csv]), columns)
+    agg = agg.where(**dict(w.split('=', 1) for w in args.where))
+    groups = agg.groupby(*(args.by or PARAMS[case]))
+    header, rows = groups.table(args.value or columns[len(PARAMS[case])])
+    rows = rows[np.argsort(-rows[:, header.index(args.sort)], kind='stable')]
+    write_table('/dev/stdout', header, rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,530 @@
+#!/usr/bin/env python3.6
+
+"""
+Microbenchmarks of PiCN's routing and forwarding data structures, and of the packet encoding every stack goes
+through.
+
+The `rib` suite times one operation on a structure filled with N synthetic prefixes:
+
+- `insert`: inserting the N prefixes into an empty RIB or FIB, per prefix
+- `lookup`: longest-prefix lookups in the FIB of names one to three components longer than a prefix, per lookup
+- `ageing`: one ageing sweep over the RIB
+- `build_fib`: building the FIB entries from the RIB
+
+The RIB is benchmarked as the default RIB of an ICNForwarder and as TreeRoutingInformationBase.  In `local` mode the
+structures are plain objects; in `manager` mode they are kept in a Manager dict like a forwarder's data_structs, so
+every operation fetches a copy of the structure through the proxy, and every modifying operation stores it back.
+The manager mode thus measures the cost of pickling the whole structure per operation, which is what the forwarders
+pay, but also what limits it to MANAGER_MAX_SIZE entries: that limit is an artifact of the benchmark, not of the
+structures.
+
+The `store` suite compares the backends of the structures the repo hopping test cases keep in shared state, the dict
+proxies of a Manager (`manager`) and the dicts in shared memory of shmstore (`shm`), with N entries:
+
+- `dict/set`, `dict/get`: storing and reading N entries of a plain dict, per entry
+- `tree_rib/insert`, `tree_rib/ageing`, `tree_rib/build_fib`: TreeRoutingInformationBase created on the backend,
+  as above
+- `repository/add`, `repository/get`: SimpleMemoryRepository created on the backend, adding N content objects, and
+  checking for and fetching them, per object
+
+The `encoding` suite times NdnTlvEncoder and BasicChunkLayer on a single core:
+
+- `encode`/`decode`: Interests and Content objects with names of 1 to 16 components and payloads of 1 byte up to the
+  MTU, per packet
+- `chunk`: BasicChunkLayer passing an Interest down and its Content up (the cost every client stack pays per
+  packet), and splitting Content objects larger than its chunk size into chunks, per packet handed to the layer
+
+Besides the time, it records the memory allocated and still referenced per packet, i.e. the size of the encoded or
+decoded packets, with tracemalloc.
+
+The results are saved in `bench/<PiCN commit>.json` and compared with a baseline, by default the results of the
+closest ancestor of the PiCN commit in `bench/`.  A benchmark whose median time per operation exceeds the baseline's by more than `--threshold` is
+reported as a regression, and the exit status is 1:
+
+    env PYTHONPATH="$(realpath ./picn)" python3.6 benchmark.py [--sizes 10 100 ...] [--baseline COMMIT]
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tracemalloc
+from time import perf_counter
+
+import PiCN
+from PiCN.Layers.ChunkLayer import BasicChunkLayer
+from PiCN.Layers.PacketEncodingLayer.Encoder import NdnTlvEncoder
+from PiCN.Layers.RepositoryLayer.Repository import SimpleMemoryRepository
+from PiCN.Layers.RoutingLayer.RoutingInformationBase import TreeRoutingInformationBase
+from PiCN.Packets import Content, Interest, Name
+from PiCN.ProgramLibs.ICNForwarder import ICNForwarder
+
+from shmstore import SharedMemoryManager
+
+
+BASELINE_DIR = 'bench'
+SIZES = [10, 100, 1000, 10000, 100000, 1000000]
+# Name components and payload sizes of the encoding suite, up to the payload of a 1500 byte Ethernet MTU
+DEPTHS = [1, 4, 16]
+PAYLOADS = [1, 64, 512, 1400]
+# Chunk size of the chunk layer, PiCN's default, and the content sizes handed to it
+CHUNK_SIZE = 4096
+CHUNKED_PAYLOADS = [1400, 16384, 262144]
+# Fetching a structure through the Manager proxy pickles all of it, so the manager mode is limited to small sizes.
+MANAGER_MAX_SIZE = 1000
+# Every operation on a Manager dict is a round trip to the manager's process, which limits the sizes of the store suite.
+STORE_MAX_SIZE = 10000
+
+# benchmark key -> seconds per operation of each repetition
+Results = Dict[str, List[float]]
+# benchmark key -> bytes allocated and still referenced per operation
+Allocations = Dict[str, float]
+
+
+def picn_path() -> str:
+    """The PiCN checkout on the path."""
+    return os.path.dirname(os.path.dirname(os.path.abspath(PiCN.__file__)))
+
+
+def picn_commit() -> str:
+    """The git commit of the PiCN checkout on the path, with a `-dirty` suffix if it has local changes."""
+    path = picn_path()
+    try:
+        commit = subprocess.check_output(['git', '-C', path, 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL)
+        dirty = subprocess.check_output(['git', '-C', path, 'status', '--porcelain', '--untracked-files=no'],
+                                        stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit.decode().strip() + ('-dirty' if len(dirty.strip()) > 0 else '')
+
+
+def prefixes(n: int) -> List[Name]:
+    """N distinct prefixes of four components, sharing their first components like a real namespace."""
+    return [Name(f'/bench/a{i % 16}/b{i % 256}/p{i}') for i in range(n)]
+
+
+def lookup_names(names: List[Name], count: int, seed: int = 0) -> List[Name]:
+    """Names one to three components longer than randomly chosen prefixes."""
+    rng = random.Random(seed)
+    lookups = []
+    for _ in range(count):
+        prefix = rng.choice(names).to_string()
+        lookups.append(Name(prefix + ''.join(f'/c{j}' for j in range(rng.randint(1, 3)))))
+    return lookups
+
+
+class Structures(object):
+    """Factories of the structures under test, and the Manager dict of the manager mode."""
+
+    def __init__(self, manager):
+        self.manager = manager
+        # Take the RIB and FIB classes from a forwarder, so the benchmark measures what the forwarders use.
+        forwarder = ICNForwarder(0, encoder=NdnTlvEncoder(), routing=True, peers=[])
+        self._rib_type = type(forwarder.data_structs['rib'])
+        self._fib_type = type(forwarder.data_structs['fib'])
+        forwarder.linklayer.sock.close()
+        self.data_structs = manager.dict()
+
+    def create(self, structure: str):
+        if structure == 'rib':
+            return self._rib_type()
+        if structure == 'tree_rib':
+            return TreeRoutingInformationBase(self.manager, shortest_only=False)
+        return self._fib_type()
+
+
+def _store(data_structs, structure: str, ds, mode: str):
+    if mode == 'manager':
+        data_structs[structure] = ds
+
+
+def _fill(ds, structure: str, names: List[Name]):
+    if structure == 'fib':
+        for i, name in enumerate(names):
+            ds.add_fib_entry(name, i % 8, static=False)
+    else:
+        for i, name in enumerate(names):
+            ds.insert(name, i % 8, i % 5 + 1)
+
+
+def bench_insert(structs: Structures, structure: str, mode: str, names: List[Name]) -> Tuple[float, int]:
+    ds = structs.create(structure)
+    _store(structs.data_structs, structure, ds, mode)
+    start = perf_counter()
+    for i, name in enumerate(names):
+        if mode == 'manager':
+            ds = structs.data_structs[structure]
+        if structure == 'fib':
+            ds.add_fib_entry(name, i % 8, static=False)
+        else:
+            ds.insert(name, i % 8, i % 5 + 1)
+        _store(structs.data_structs, structure, ds, mode)
+    return perf_counter() - start, len(names)
+
+
+def bench_lookup(structs: Structures, structure: str, mode: str, names: List[Name], lookups: List[Name]
+                 ) -> Tuple[float, int]:
+    ds = structs.create(structure)
+    _fill(ds, structure, names)
+    _store(structs.data_structs, structure, ds, mode)
+    start = perf_counter()
+    for name in lookups:
+        if mode == 'manager':
+            ds = structs.data_structs[structure]
+        ds.find_fib_entry(name)
+    return perf_counter() - start, len(lookups)
+
+
+def bench_ageing(structs: Structures, structure: str, mode: str, names: List[Name]) -> Tuple[float, int]:
+    ds = structs.create(structure)
+    _fill(ds, structure, names)
+    _store(structs.data_structs, structure, ds, mode)
+    start = perf_counter()
+    if mode == 'manager':
+        ds = structs.data_structs[structure]
+    ds.ageing()
+    _store(structs.data_structs, structure, ds, mode)
+    return perf_counter() - start, 1
+
+
+def bench_build_fib(structs: Structures, structure: str, mode: str, names: List[Name]) -> Tuple[float, int]:
+    ds = structs.create(structure)
+    _fill(ds, structure, names)
+    _store(structs.data_structs, structure, ds, mode)
+    start = perf_counter()
+    if mode == 'manager':
+        ds = structs.data_structs[structure]
+    ds.build_fib()
+    return perf_counter() - start, 1
+
+
+# (structure, operation) -> benchmark
+BENCHMARKS: Dict[Tuple[str, str], Callable] = {
+    ('rib', 'insert'): bench_insert,
+    ('tree_rib', 'insert'): bench_insert,
+    ('fib', 'insert'): bench_insert,
+    ('fib', 'lookup'): bench_lookup,
+    ('rib', 'ageing'): bench_ageing,
+    ('tree_rib', 'ageing'): bench_ageing,
+    ('rib', 'build_fib'): bench_build_fib,
+    ('tree_rib', 'build_fib'): bench_build_fib,
+}
+
+
+def run(sizes: List[int], modes: List[str], repeat: int, lookups: int, only: Optional[List[str]] = None) -> Results:
+    results: Results = dict()
+    with multiprocessing.Manager() as manager:
+        structs = Structures(manager)
+        for size in sizes:
+            names = prefixes(size)
+            lookup = lookup_names(names, lookups)
+            for mode in modes:
+                if mode == 'manager' and size > MANAGER_MAX_SIZE:
+                    continue
+                for (structure, operation), bench in BENCHMARKS.items():
+                    key = f'{structure}/{operation}/{mode}/{size}'
+                    if only is not None and not any(o in key for o in only):
+                        continue
+                    times = []
+                    for _ in range(repeat):
+                        args = (structs, structure, mode, names) + ((lookup,) if operation == 'lookup' else ())
+                        elapsed, ops = bench(*args)
+                        times.append(elapsed / ops)
+                    results[key] = times
+                    print(f'{key:40s} {statistics.median(times) * 1e6:12.3f} us/op')
+                    sys.stdout.flush()
+    return results
+
+
+def bench_store_dict(backend, operation: str, names: List[Name]) -> Tuple[float, int]:
+    d = backend.dict()
+    if operation == 'get':
+        for i, name in enumerate(names):
+            d[name.to_string()] = i
+    start = perf_counter()
+    if operation == 'set':
+        for i, name in enumerate(names):
+            d[name.to_string()] = i
+    else:
+        for name in names:
+            d[name.to_string()]
+    return perf_counter() - start, len(names)
+
+
+def bench_store_tree_rib(backend, operation: str, names: List[Name]) -> Tuple[float, int]:
+    rib = TreeRoutingInformationBase(backend, shortest_only=False)
+    if operation == 'insert':
+        start = perf_counter()
+        _fill(rib, 'tree_rib', names)
+        return perf_counter() - start, len(names)
+    _fill(rib, 'tree_rib', names)
+    start = perf_counter()
+    if operation == 'ageing':
+        rib.ageing()
+    else:
+        rib.build_fib()
+    return perf_counter() - start, 1
+
+
+def bench_store_repository(backend, operation: str, names: List[Name]) -> Tuple[float, int]:
+    repository = SimpleMemoryRepository(Name('/bench'), backend)
+    if operation == 'get':
+        for i, name in enumerate(names):
+            repository.add_content(name, f'content {i}')
+    start = perf_counter()
+    if operation == 'add':
+        for i, name in enumerate(names):
+            repository.add_content(name, f'content {i}')
+    else:
+        for name in names:
+            if repository.is_content_available(name):
+                repository.get_content(name)
+    return perf_counter() - start, len(names)
+
+
+# (structure, operation) -> benchmark of the store suite
+STORE_BENCHMARKS: Dict[Tuple[str, str], Callable] = {
+    ('dict', 'set'): bench_store_dict,
+    ('dict', 'get'): bench_store_dict,
+    ('tree_rib', 'insert'): bench_store_tree_rib,
+    ('tree_rib', 'ageing'): bench_store_tree_rib,
+    ('tree_rib', 'build_fib'): bench_store_tree_rib,
+    ('repository', 'add'): bench_store_repository,
+    ('repository', 'get'): bench_store_repository,
+}
+
+
+def run_store(sizes: List[int], repeat: int, only: Optional[List[str]] = None) -> Results:
+    results: Results = dict()
+    with multiprocessing.Manager() as manager:
+        for size in sizes:
+            if size > STORE_MAX_SIZE:
+                continue
+            names = prefixes(size)
+            for backend in ['manager', 'shm']:
+                for (structure, operation), bench in STORE_BENCHMARKS.items():
+                    key = f'store/{backend}/{structure}/{operation}/{size}'
+                    if only is not None and not any(o in key for o in only):
+                        continue
+                    times = []
+                    for _ in range(repeat):
+                        # Fresh shared memory for each repetition, with room for the tree RIB's nodes of all prefixes
+                        shm = SharedMemoryManager(manager, slots=1 << max(10, (8 * size).bit_length()))
+                        elapsed, ops = bench(shm if backend == 'shm' else manager, operation, names)
+                        shm.close()
+                        times.append(elapsed / ops)
+                    results[key] = times
+                    print(f'{key:40s} {statistics.median(times) * 1e6:12.3f} us/op')
+                    sys.stdout.flush()
+    return results
+
+
+class _Sink(list):
+    """Stands in for the queues of a layer called directly."""
+
+    def put(self, item, *args, **kwargs):
+        self.append(item)
+
+
+def packet_name(depth: int, i: int = 0) -> Name:
+    return Name('/' + '/'.join(f'c{j}' for j in range(depth - 1)) + f'/p{i}')
+
+
+def bench_encoding(operation: Callable, packets: List, count: int) -> Tuple[float, float]:
+    """Seconds and bytes allocated per packet of encoding or decoding the packets, cycling through them."""
+    inputs = [packets[i % len(packets)] for i in range(count)]
+    outputs = []
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for packet in inputs:
+        outputs.append(operation(packet))
+    allocated = (tracemalloc.get_traced_memory()[0] - before) / count
+    tracemalloc.stop()
+    del outputs[:]
+    start = perf_counter()
+    for packet in inputs:
+        operation(packet)
+    return (perf_counter() - start) / count, allocated
+
+
+def bench_chunk_layer(size: int, count: int) -> Tuple[float, float]:
+    """
+    Seconds and bytes allocated per Content object of `size` bytes: with a payload below the chunk size, an Interest
+    passed down and its Content passed up the chunk layer of a client; above it, the Content chunked by the layer of
+    a repository.
+    """
+    names = [Name(f'/bench/chunk/p{i}') for i in range(count)]
+    payload = 'x' * size
+
+    def handle(layer, to_lower, to_higher):
+        for name in names:
+            if size < CHUNK_SIZE:
+                layer.data_from_higher(to_lower, to_higher, [0, Interest(name)])
+                layer.data_from_lower(to_lower, to_higher, [0, Content(name, payload)])
+            else:
+                layer.data_from_higher(to_lower, to_higher, [0, Content(name, payload)])
+
+    # The first pass measures the allocations, including what the layer keeps in its tables.
+    layer, to_lower, to_higher = BasicChunkLayer(chunk_size=CHUNK_SIZE), _Sink(), _Sink()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    handle(layer, to_lower, to_higher)
+    allocated = (tracemalloc.get_traced_memory()[0] - before) / count
+    tracemalloc.stop()
+    layer, to_lower, to_higher = BasicChunkLayer(chunk_size=CHUNK_SIZE), _Sink(), _Sink()
+    start = perf_counter()
+    handle(layer, to_lower, to_higher)
+    return (perf_counter() - start) / count, allocated
+
+
+def run_encoding(repeat: int, count: int, only: Optional[List[str]] = None) -> Tuple[Results, Allocations]:
+    results: Results = dict()
+    allocations: Allocations = dict()
+    encoder = NdnTlvEncoder()
+    jobs: List[Tuple[str, Callable[[], Tuple[float, float]]]] = []
+    for depth in DEPTHS:
+        interests = [Interest(packet_name(depth, i)) for i in range(100)]
+        wire = [encoder.encode(p) for p in interests]
+        jobs.append((f'encoding/encode/interest/{depth}',
+                     lambda i=interests: bench_encoding(encoder.encode, i, count)))
+        jobs.append((f'encoding/decode/interest/{depth}',
+                     lambda w=wire: bench_encoding(encoder.decode, w, count)))
+        for payload in PAYLOADS:
+            contents = [Content(packet_name(depth, i), 'x' * payload) for i in range(100)]
+            wire = [encoder.encode(p) for p in contents]
+            jobs.append((f'encoding/encode/content/{depth}/{payload}',
+                         lambda c=contents: bench_encoding(encoder.encode, c, count)))
+            jobs.append((f'encoding/decode/content/{depth}/{payload}',
+                         lambda w=wire: bench_encoding(encoder.decode, w, count)))
+    for payload in CHUNKED_PAYLOADS:
+        # Large objects are chunked into many packets, so fewer of them make up a repetition.
+        n = max(10, min(count, count * 1400 // payload))
+        jobs.append((f'encoding/chunk/content/{payload}', lambda p=payload, n=n: bench_chunk_layer(p, n)))
+    for key, bench in jobs:
+        if only is not None and not any(o in key for o in only):
+            continue
+        times = []
+        for _ in range(repeat):
+            t, allocated = bench()
+            times.append(t)
+        results[key] = times
+        allocations[key] = allocated
+        t = statistics.median(times)
+        print(f'{key:40s} {t * 1e6:12.3f} us/op {1 / t:12.0f} packets/s {allocated:10.0f} B/op')
+        sys.stdout.flush()
+    return results, allocations
+
+
+def find_baseline(commit: str, baseline: Optional[str]) -> Optional[str]:
+    """
+    The baseline file: given as a commit or path, else the one of the closest ancestor of the PiCN checkout's commit
+    (or of the commit itself, if the checkout has local changes), else this commit's.
+    """
+    if baseline is not None:
+        return baseline if os.path.exists(baseline) else os.path.join(BASELINE_DIR, f'{baseline}.json')
+    own = os.path.join(BASELINE_DIR, f'{commit}.json')
+    try:
+        # In history order, not by the mtime of the files, as benchmarks of older commits may be run later.
+        ancestors = subprocess.check_output(['git', '-C', picn_path(), 'rev-list', 'HEAD'],
+                                            stderr=subprocess.DEVNULL).decode().split()
+    except (OSError, subprocess.CalledProcessError):
+        ancestors = []
+    for ancestor in ancestors:
+        filename = os.path.join(BASELINE_DIR, f'{ancestor}.json')
+        if filename != own and os.path.exists(filename):
+            return filename
+    return own if os.path.exists(own) else None
+
+
+def compare(results: Results, baseline: Dict, threshold: float) -> List[str]:
+    """The benchmarks whose median is more than `threshold` times the baseline's median."""
+    regressions = []
+    for key, times in sorted(results.items()):
+        if key not in baseline['results']:
+            continue
+        old = baseline['results'][key]['median']
+        new = statistics.median(times)
+        if old > 0 and new > old * threshold:
+            regressions.append(f'{key}: {old * 1e6:.3f} -> {new * 1e6:.3f} us/op ({new / old:.2f}x)')
+    return regressions
+
+
+def save(results: Results, allocations: Allocations, commit: str, args: argparse.Namespace) -> str:
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    filename = os.path.join(BASELINE_DIR, f'{commit}.json')
+    data = {
+        'commit': commit,
+        'python': platform.python_version(),
+        'host': platform.node(),
+        'repeat': args.repeat,
+        'results': {key: {'median': statistics.median(times), 'min': min(times), 'times': times}
+                    for key, times in sorted(results.items())},
+    }
+    for key, allocated in allocations.items():
+        data['results'][key]['bytes'] = allocated
+    # Keep the results of benchmarks that weren't run this time.
+    if os.path.exists(filename):
+        with open(filename, 'r') as f:
+            old = json.load(f)
+        data['results'] = dict(old.get('results', dict()), **data['results'])
+    tmp = f'{filename}.{os.getpid()}'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(tmp, filename)
+    return filename
+
+
+def main():
+    parser = argparse.ArgumentParser(sys.argv[0], description='Microbenchmarks of the RIB, FIB, their shared state '
+                                                         'and packet encoding')
+    parser.add_argument('--suites', nargs='+', choices=['rib', 'store', 'encoding'],
+                        default=['rib', 'store', 'encoding'])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='Numbers of prefixes')
+    parser.add_argument('--modes', nargs='+', choices=['local', 'manager'], default=['local', 'manager'])
+    parser.add_argument('--only', nargs='+', default=None, metavar='SUBSTRING',
+                        help='Only run the benchmarks whose key contains one of these, e.g. fib/lookup')
+    parser.add_argument('--repeat', type=int, default=5, help='Repetitions of each benchmark')
+    parser.add_argument('--lookups', type=int, default=10000, help='Lookups per repetition')
+    parser.add_argument('--packets', type=int, default=10000, help='Packets per repetition of the encoding suite')
+    parser.add_argument('--baseline', default=None, help='PiCN commit or file to compare with')
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help='Report benchmarks slower than this factor times the baseline')
+    parser.add_argument('--no-save', action='store_true', help="Don't save the results as this commit's baseline")
+    args = parser.parse_args()
+
+    commit = picn_commit()
+    print(f'PiCN commit {commit}')
+    baseline_file = find_baseline(commit, args.baseline)
+    results: Results = dict()
+    allocations: Allocations = dict()
+    if 'rib' in args.suites:
+        results.update(run(args.sizes, args.modes, args.repeat, args.lookups, args.only))
+    if 'store' in args.suites:
+        results.update(run_store(args.sizes, args.repeat, args.only))
+    if 'encoding' in args.suites:
+        encoding, allocations = run_encoding(args.repeat, args.packets, args.only)
+        results.update(encoding)
+    regressions = []
+    if baseline_file is not None and os.path.exists(baseline_file):
+        with open(baseline_file, 'r') as f:
+            baseline = json.load(f)
+        print(f'Compared with {baseline_file} (PiCN commit {baseline["commit"]})')
+        regressions = compare(results, baseline, args.threshold)
+        for r in regressions:
+            print(f'Regression: {r}')
+        if len(regressions) == 0:
+            print('No regressions')
+    if not args.no_save:
+        print(f'Wrote results to {save(results, allocations, commit, args)}')
+    exit(1 if len(regressions) > 0 else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3.6
+
+"""
+Adaptive search for the success boundary of the repo hopping test cases.
+
+The success rate grows with the hopping interval: the fewer hops per minute, the fewer interests are lost while the
+network learns the repo's new location.  So instead of sampling a full grid, the hopping interval at which the
+success rate reaches each target rate is bisected along every line of fixed routing interval and lease factor (lease
+time / hopping interval), on a logarithmic scale:
+
+- the first round samples both ends of the hopping interval range on every line
+- the bracket of a target is the smallest sampled hopping interval reaching it, and the largest sampled one below
+  that which doesn't
+- each following round samples the geometric mean of every bracket that is wider than the tolerance
+- the boundary is interpolated linearly in the logarithm of the hopping interval between the ends of the bracket
+
+The targets of a line share its samples.  Each round is planned from all samples so far, so an interrupted search
+continues where it stopped.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import math
+
+
+# A line of the search: routing interval and lease factor
+Line = Tuple[float, float]
+# A sampled parameter point: routing interval, hopping interval and lease time
+Point = Tuple[float, float, float]
+
+
+def lease_time(hopping_interval: float, lease_factor: float) -> float:
+    # Rounded like in the sweep grid
+    return round(hopping_interval * lease_factor, 2)
+
+
+class BoundarySearch(object):
+
+    def __init__(self, routing_intervals: List[float], lease_factors: List[float], targets: List[float],
+                 low: float, high: float, tolerance: float = 0.1):
+        self.lines: List[Line] = [(r, f) for r in routing_intervals for f in lease_factors]
+        self.targets = sorted(targets)
+        self.low = low
+        self.high = high
+        self.tolerance = tolerance
+        # Success rates of the runs of each sampled point
+        self.samples: Dict[Point, List[float]] = dict()
+
+    def add(self, routing_interval: float, hopping_interval: float, lease: float, success: float):
+        self.samples.setdefault((routing_interval, hopping_interval, lease), []).append(success)
+
+    def means(self, line: Line) -> List[Tuple[float, float]]:
+        """(hopping interval, mean success rate) of the points sampled on a line, by hopping interval."""
+        r, f = line
+        means = []
+        for (sr, h, l), values in self.samples.items():
+            if sr == r and l == lease_time(h, f) and len(values) > 0:
+                means.append((h, sum(values) / len(values)))
+        return sorted(means)
+
+    def bracket(self, line: Line, target: float) -> Tuple[Optional[Tuple[float, float]],
+                                                           Optional[Tuple[float, float]]]:
+        """
+        The (hopping interval, success rate) samples enclosing the boundary of a target: the largest one below the
+        target, None if the boundary is below the range, and the smallest one reaching it, None if the boundary is
+        above the range.
+        """
+        means = self.means(line)
+        above = next((i for i, (_, s) in enumerate(means) if s >= target), None)
+        if above is None:
+            return (means[-1] if len(means) > 0 else None), None
+        below = next((means[i] for i in range(above - 1, -1, -1) if means[i][1] < target), None)
+        return below, means[above]
+
+    def proposals(self) -> List[Point]:
+        """The points to sample next: the ends of the range on new lines, and the middle of each wide bracket."""
+        points = []
+        for line in self.lines:
+            r, f = line
+            sampled = [h for h, _ in self.means(line)]
+            hs = [h for h in [self.low, self.high] if h not in sampled]
+            if len(hs) == 0:
+                for target in self.targets:
+                    below, above = self.bracket(line, target)
+                    if below is None or above is None or above[0] / below[0] <= 1.0 + self.tolerance:
+                        continue
+                    h = round(math.sqrt(below[0] * above[0]), 2)
+                    if below[0] < h < above[0] and h not in sampled:
+                        hs.append(h)
+            for h in hs:
+                point = (r, h, lease_time(h, f))
+                if point not in points:
+                    points.append(point)
+        return points
+
+    def boundary(self, line: Line, target: float) -> Tuple[float, float, float]:
+        """
+        The estimated hopping interval at which the success rate reaches the target, and the ends of its bracket.
+        The estimate is NaN if the boundary is outside of the range, with the end of the range in the bracket.
+        """
+        nan = float('nan')
+        below, above = self.bracket(line, target)
+        if below is None:
+            return nan, nan, above[0] if above is not None else nan
+        if above is None:
+            return nan, below[0], nan
+        (h0, s0), (h1, s1) = below, above
+        x = (target - s0) / (s1 - s0)
+        return math.exp(math.log(h0) + x * (math.log(h1) - math.log(h0))), h0, h1
+
+    def write(self, filename: str):
+        """
+        Write the boundary surface: one row per routing interval, lease factor and target rate with the estimated
+        hopping interval and the ends of its bracket.
+        """
+        with open(filename, 'w') as f:
+            for r, lf in self.lines:
+                for target in self.targets:
+                    h, low, high = self.boundary((r, lf), target)
+                    f.write(f'{r},{lf},{target},{"" if math.isnan(h) else h},{"" if math.isnan(low) else low},'
+                            f'{"" if math.isnan(high) else high}\n')
+        print(f'Wrote data to file {filename}')
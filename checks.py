@@ -0,0 +1,153 @@
+#!/usr/bin/env python3.6
+
+"""
+Functional checks of the measurement infrastructure against a real PiCN, for the behaviour the test cases rely on but
+don't verify themselves:
+
+- `shared_expiry`: a route expires on a shared ForwarderHost.  The forwarders of a chain of two are created within
+  local_structures() and run on a ForwarderHost; once the client's forwarder learned the route to the repo, the
+  repo's forwarder stops sending, and its route must disappear from the client's FIB within a few routing intervals.
+  This fails if the layers' timers don't run on the host, or the RIB ageing doesn't see the structures it shares
+  with the event loop.
+- `pool_return`: a repository of a RepoPool registers again when it returns to its edge.  On a tree with two edges,
+  the pool moves the repository from edge A to B and back to A, each time after its registration at A expired; the
+  route at A must be back within a hop.  This fails if the returning repository doesn't register again, and the
+  pool's fallback of sending its kept registration again doesn't work either.
+
+Each check prints its result; the exit status is 1 if one of them failed:
+
+    env PYTHONPATH="$(realpath ./picn)" python3.6 checks.py [--checks shared_expiry pool_return] [--ageing 0.5]
+"""
+
+from typing import Callable, Dict, List
+
+import argparse
+import multiprocessing
+import sys
+from datetime import timedelta
+from time import monotonic
+
+from PiCN.Layers.PacketEncodingLayer.Encoder import NdnTlvEncoder
+from PiCN.Packets import Name
+from PiCN.ProgramLibs.ICNDataRepository import ICNDataRepository
+
+import topology
+from failure import FailingSocket
+from host import ForwarderHost, local_structures
+from instrumentation import FibWatch
+from mobility import RepoPool
+
+
+PREFIX = '/picn/routing/testrepo'
+
+
+def wait_faces(watch: FibWatch, index: int, present: bool, timeout: float) -> bool:
+    """Wait until the watched FIB entry of forwarder `index` points to a face, or with `present=False`, to none."""
+    deadline = monotonic() + timeout
+    while (len(watch.faces(index)) > 0) != present:
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            return False
+        watch.wait(remaining)
+    return True
+
+
+def check_shared_expiry(ageing: float) -> bool:
+    topo = topology.chain(2)
+    with local_structures() as local:
+        forwarders = topology.build(topo, ageing, local)
+    # Any address will do, the route is only ever looked at, never used.
+    topology.attach_repo(forwarders[topo.repo], ('127.0.0.1', 9), Name(PREFIX))
+    sockets = [FailingSocket(f.linklayer.sock) for f in forwarders]
+    for f, sock in zip(forwarders, sockets):
+        f.linklayer.sock = sock
+    host = ForwarderHost()
+    host.add(*forwarders)
+    watch = FibWatch([forwarders[topo.client]], Name(PREFIX))
+    try:
+        for f in forwarders:
+            f.start_forwarder()
+        if not wait_faces(watch, 0, True, (topo.route_distance() + 1) * ageing * 3):
+            print("shared_expiry: the client's forwarder never learned the route")
+            return False
+        sockets[topo.repo].block_all()
+        start = monotonic()
+        if not wait_faces(watch, 0, False, 10 * ageing):
+            print(f"shared_expiry: the route didn't expire within {10 * ageing} s")
+            return False
+        print(f'shared_expiry: the route expired after {monotonic() - start:.2f} s')
+        return True
+    finally:
+        for f in forwarders:
+            f.stop_forwarder()
+        host.close()
+        watch.close()
+
+
+def check_pool_return(ageing: float) -> bool:
+    lease = 2 * ageing
+    # Long enough for the registration at A to expire while the repository is at B.
+    interval = 3 * lease + 4 * ageing
+    topo = topology.tree(2, 1)
+    forwarders = topology.build(topo, ageing, multiprocessing.Manager(), autoconfig=True, static_faces=True)
+    for e in topo.edges:
+        forwarders[e].autoconfiglayer._service_registration_prefixes = [(Name('/edge'), False)]
+        forwarders[e].autoconfiglayer._service_registration_timeout = timedelta(seconds=lease)
+    a = topo.edges[0]
+    watch = FibWatch([forwarders[a]], Name('/edge/hoppingrepo'))
+    repos = []
+    for e in topo.edges:
+        r = ICNDataRepository(None, Name('/hoppingrepo'), 0, encoder=NdnTlvEncoder(), autoconfig=True,
+                              autoconfig_routed=True)
+        r.autoconfiglayer._broadcast_port = forwarders[e].linklayer.sock.getsockname()[1]
+        repos.append(r)
+    pool = RepoPool(repos, [lambda since: None for _ in repos], interval)
+    try:
+        for f in forwarders:
+            f.start_forwarder()
+        pool.prestart()
+        pool.start()
+        if not wait_faces(watch, 0, True, interval):
+            print('pool_return: A never had a route to the repository')
+            return False
+        if not wait_faces(watch, 0, False, interval):
+            print("pool_return: A's route didn't expire while the repository was at B, the check proves nothing")
+            return False
+        # The repository returns to A after two hops, and must be registered again before the next one.
+        if not wait_faces(watch, 0, True, 3 * interval - (monotonic() - pool.hops[0])):
+            print('pool_return: A had no route to the repository after it returned')
+            return False
+        if len(pool.hops) < 3:
+            print('pool_return: A had a route again before the repository returned')
+            return False
+        print(f'pool_return: A had a route {monotonic() - pool.hops[2]:.2f} s after the return, '
+              f'{pool.reregistrations} registrations sent for the repositories')
+        return True
+    finally:
+        pool.stop()
+        for f in forwarders:
+            f.stop_forwarder()
+        watch.close()
+
+
+CHECKS: Dict[str, Callable[[float], bool]] = {
+    'shared_expiry': check_shared_expiry,
+    'pool_return': check_pool_return,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(sys.argv[0], description='Functional checks of the measurement infrastructure')
+    parser.add_argument('--checks', nargs='+', choices=list(CHECKS.keys()), default=list(CHECKS.keys()))
+    parser.add_argument('--ageing', type=float, default=0.5, help='Routing interval of the forwarders')
+    args = parser.parse_args()
+    failed: List[str] = [name for name in args.checks if not CHECKS[name](args.ageing)]
+    for name in failed:
+        print(f'Failed: {name}')
+    if len(failed) == 0:
+        print('All checks passed')
+    sys.exit(1 if len(failed) > 0 else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3.6
+
+"""
+Failures injected into a converged topology.
+
+The link layer socket of each forwarder is wrapped by a FailingSocket before the forwarders are started.  What it
+blocks is kept in anonymous shared memory, so a failure can be injected from the measurement process after the
+forwarders' layer processes were forked:
+
+- `node`: everything the forwarder sends is dropped, so its peers no longer receive RIB replies or content from it,
+    as if it had crashed; its processes keep running, so this works the same with every `host` option
+- `face`: each end of a link drops what it sends to the other end, so both lose the face at the same time
+
+Datagrams are only ever dropped when they are sent, never when they are received, so the event loop of a shared
+ForwarderHost is never left waiting on a socket it was told is readable.  All forwarders of a topology run on this
+host, so the ends of a link are told apart by their port.
+"""
+
+import mmap
+import struct
+
+
+FAILURES = ['node', 'face']
+
+
+class FailingSocket(object):
+    """
+    Wraps the socket of a forwarder's link layer, and drops the datagrams sent to blocked ports, or all of them.
+    The blocked ports are only written by the measurement process, and only read by the link layer.
+    """
+
+    # blocking all datagrams, number of blocked ports, datagrams dropped
+    HEADER = struct.Struct('=BxxxIQ')
+    MAX_PORTS = 64
+
+    def __init__(self, sock):
+        self._sock = sock
+        self.mm = mmap.mmap(-1, FailingSocket.HEADER.size + FailingSocket.MAX_PORTS * 2)
+
+    def _blocks(self, port: int) -> bool:
+        if self.mm[0] == 1:
+            return True
+        n = struct.unpack_from('=I', self.mm, 4)[0]
+        return n > 0 and port in struct.unpack_from(f'={n}H', self.mm, FailingSocket.HEADER.size)
+
+    def sendto(self, data: bytes, addr) -> int:
+        if self._blocks(addr[1]):
+            struct.pack_into('=Q', self.mm, 8, self.dropped() + 1)
+            return len(data)
+        return self._sock.sendto(data, addr)
+
+    def block(self, port: int):
+        """Drop everything sent to `port` from now on."""
+        n = struct.unpack_from('=I', self.mm, 4)[0]
+        if n >= FailingSocket.MAX_PORTS:
+            raise ValueError(f'Can block at most {FailingSocket.MAX_PORTS} ports')
+        struct.pack_into('=H', self.mm, FailingSocket.HEADER.size + n * 2, port)
+        struct.pack_into('=I', self.mm, 4, n + 1)
+
+    def block_all(self):
+        """Drop everything sent from now on."""
+        self.mm[0] = 1
+
+    def dropped(self) -> int:
+        return struct.unpack_from('=Q', self.mm, 8)[0]
+
+    def fileno(self) -> int:
+        return self._sock.fileno()
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
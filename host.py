@@ -0,0 +1,363 @@
+#!/usr/bin/env python3.6
+
+"""
+Single-process host for many forwarders.
+
+An ICNForwarder normally runs each layer of its LayerStack in a process of its own, connected to the neighbouring
+layers by multiprocessing Queues, so every packet is pickled once per layer boundary.  A ForwarderHost instead runs
+the layers of many forwarders on a few event loop threads in the current process:
+
+- the queues between the layers are replaced by LocalQueues, which hand the packet objects over without pickling
+  and schedule the receiving layer's data_from_lower() or data_from_higher() on the forwarder's event loop
+- LayerProcess.start_process() and stop_process() don't create or stop a process for the layers of hosted
+  forwarders; the start and stop logic the layer classes add around them (e.g. timers) still runs
+- the event loop reads the link layers' sockets itself and passes the datagrams up like the link layer process
+  would
+- forwarders created within local_structures() get a LocalManager instead of a Manager process each, so their
+  data structures are LocalDicts in this process, and looking up a route is no longer a round trip to another
+  process.  Like a Manager's proxies, a LocalDict holds a lock for every operation and hands out copies of its
+  values, as it is shared by the event loop and the layers' timer threads
+
+Forwarders are assigned to the loops round-robin.  All forwarders must be added before they are started, and after
+they were attached to a MemoryLinkFabric, if any.
+"""
+
+from typing import Callable, List, Optional
+
+import collections
+import contextlib
+import itertools
+import multiprocessing
+import os
+import pickle
+import queue
+import select
+import socket
+import threading
+import traceback
+import types
+
+from PiCN.Processes import LayerProcess
+from PiCN.ProgramLibs.ICNForwarder import ICNForwarder
+
+
+class LocalQueue(object):
+    """
+    Stand-in for a multiprocessing.Queue between two layers.  If the queue has a receiver, every item is passed to
+    it on the event loop; items of queues without a receiver (the top of a stack) are kept for get().
+    """
+
+    def __init__(self, loop: 'HostLoop', receiver: Callable = None):
+        self._loop = loop
+        self.receiver: Optional[Callable] = receiver
+        self._items = collections.deque()
+        self._available = threading.Semaphore(0)
+
+    def put(self, item, block: bool = True, timeout: float = None):
+        if self.receiver is not None:
+            self._loop.call(self.receiver, item)
+        else:
+            self._items.append(item)
+            self._available.release()
+
+    def put_nowait(self, item):
+        self.put(item)
+
+    def get(self, block: bool = True, timeout: float = None):
+        if not self._available.acquire(block, timeout):
+            raise queue.Empty()
+        return self._items.popleft()
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def empty(self) -> bool:
+        return len(self._items) == 0
+
+    def qsize(self) -> int:
+        return len(self._items)
+
+    def close(self):
+        pass
+
+    def join_thread(self):
+        pass
+
+    def cancel_join_thread(self):
+        pass
+
+
+class LocalDict(object):
+    """
+    Stand-in for a Manager's DictProxy: every operation holds the dict's lock, and values are copied when they are
+    stored and when they are read, so the get-modify-store idiom of the layers behaves as with a Manager.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._lock = threading.RLock()
+        self._dict = {key: LocalDict._copy(value) for key, value in dict(*args, **kwargs).items()}
+
+    @staticmethod
+    def _copy(value):
+        return pickle.loads(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    def __getitem__(self, key):
+        with self._lock:
+            return LocalDict._copy(self._dict[key])
+
+    def __setitem__(self, key, value):
+        value = LocalDict._copy(value)
+        with self._lock:
+            self._dict[key] = value
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._dict[key]
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._dict
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._dict)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def get(self, key, default=None):
+        with self._lock:
+            return LocalDict._copy(self._dict.get(key, default))
+
+    def keys(self) -> List:
+        with self._lock:
+            return list(self._dict.keys())
+
+    def values(self) -> List:
+        with self._lock:
+            return [LocalDict._copy(value) for value in self._dict.values()]
+
+    def items(self) -> List:
+        with self._lock:
+            return [(key, LocalDict._copy(value)) for key, value in self._dict.items()]
+
+    def pop(self, key, *default):
+        with self._lock:
+            return self._dict.pop(key, *default)
+
+    def popitem(self):
+        with self._lock:
+            return self._dict.popitem()
+
+    def setdefault(self, key, default=None):
+        with self._lock:
+            if key not in self._dict:
+                self._dict[key] = LocalDict._copy(default)
+            return LocalDict._copy(self._dict[key])
+
+    def update(self, *args, **kwargs):
+        items = {key: LocalDict._copy(value) for key, value in dict(*args, **kwargs).items()}
+        with self._lock:
+            self._dict.update(items)
+
+    def clear(self):
+        with self._lock:
+            self._dict.clear()
+
+    def copy(self) -> dict:
+        with self._lock:
+            return LocalDict._copy(self._dict)
+
+
+class LocalManager(object):
+    """
+    Stand-in for the multiprocessing.Manager of forwarders whose layers all run in this process: it creates objects
+    of this process instead of proxies to objects in a server process of its own.
+    """
+
+    def __init__(self):
+        self.dict = LocalDict
+        self.list = list
+        self.Namespace = types.SimpleNamespace
+        self.Lock = threading.Lock
+        self.RLock = threading.RLock
+        self.Semaphore = threading.Semaphore
+        self.BoundedSemaphore = threading.BoundedSemaphore
+        self.Condition = threading.Condition
+        self.Event = threading.Event
+        self.Barrier = threading.Barrier
+        self.Queue = queue.Queue
+        self.JoinableQueue = queue.Queue
+
+    def start(self):
+        pass
+
+    def shutdown(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+@contextlib.contextmanager
+def local_structures():
+    """
+    Within the context, multiprocessing.Manager() returns a LocalManager when called from the thread that entered
+    it, so the forwarders created there keep their data structures in this process.  Such forwarders must only be run
+    on a ForwarderHost.  Other threads still get a Manager.
+    """
+    manager = multiprocessing.Manager
+    thread = threading.current_thread()
+
+    def local_manager(*args, **kwargs):
+        if threading.current_thread() is thread:
+            return LocalManager()
+        return manager(*args, **kwargs)
+
+    multiprocessing.Manager = local_manager
+    try:
+        yield LocalManager()
+    finally:
+        multiprocessing.Manager = manager
+
+
+class HostLoop(threading.Thread):
+    """Event loop running the layers of a subset of the forwarders: socket reads and queued layer calls."""
+
+    BUFSIZE = 8192
+
+    def __init__(self, name: str):
+        super().__init__(name=name, daemon=True)
+        self._calls = collections.deque()
+        self._epoll = select.epoll()
+        # socket file descriptor -> link layer
+        self._linklayers = dict()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self._epoll.register(self._wake_r, select.EPOLLIN)
+        self._stopped = False
+
+    def call(self, callback: Callable, item):
+        """Schedule a call; may be called from any thread, e.g. the forwarders' ageing timers."""
+        self._calls.append((callback, item))
+        if threading.current_thread() is not self:
+            try:
+                os.write(self._wake_w, b'\0')
+            except BlockingIOError:
+                pass
+
+    def add_linklayer(self, linklayer):
+        fd = linklayer.sock.fileno()
+        self._linklayers[fd] = linklayer
+        self._epoll.register(fd, select.EPOLLIN)
+
+    def _receive(self, linklayer):
+        try:
+            packet, addr = linklayer.sock.recvfrom(HostLoop.BUFSIZE, socket.MSG_DONTWAIT)
+        except OSError:
+            return
+        fid = linklayer.get_or_create_fid(addr, static=False)
+        linklayer.queue_to_higher.put([fid, packet])
+
+    def run(self):
+        while not self._stopped:
+            # Don't block while calls are pending, but still look at the sockets between two batches of calls.
+            for fd, _ in self._epoll.poll(0 if len(self._calls) > 0 else 0.1):
+                if fd == self._wake_r:
+                    try:
+                        os.read(self._wake_r, 4096)
+                    except BlockingIOError:
+                        pass
+                elif fd in self._linklayers:
+                    self._receive(self._linklayers[fd])
+            for _ in range(len(self._calls)):
+                callback, item = self._calls.popleft()
+                try:
+                    callback(item)
+                except Exception:
+                    traceback.print_exc()
+
+    def stop(self):
+        self._stopped = True
+        try:
+            os.write(self._wake_w, b'\0')
+        except BlockingIOError:
+            pass
+        if self.is_alive():
+            self.join()
+        self._epoll.close()
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+
+
+def _gate_layer_processes():
+    """
+    Make LayerProcess.start_process() and stop_process() skip the process of hosted layers.  The layer classes call
+    them via super() from their own start and stop logic, which therefore still runs.
+    """
+    if getattr(LayerProcess, '_hosted_gate', False):
+        return
+    start_process, stop_process = LayerProcess.start_process, LayerProcess.stop_process
+
+    def gated_start_process(self, *args, **kwargs):
+        if not getattr(self, '_hosted', False):
+            return start_process(self, *args, **kwargs)
+
+    def gated_stop_process(self, *args, **kwargs):
+        if not getattr(self, '_hosted', False):
+            return stop_process(self, *args, **kwargs)
+
+    LayerProcess.start_process = gated_start_process
+    LayerProcess.stop_process = gated_stop_process
+    LayerProcess._hosted_gate = True
+
+
+class ForwarderHost(object):
+
+    def __init__(self, threads: int = 1):
+        _gate_layer_processes()
+        self.loops = [HostLoop(f'ForwarderHost-{i}') for i in range(threads)]
+        self._next_loop = itertools.cycle(self.loops)
+        self.forwarders: List[ICNForwarder] = list()
+        for loop in self.loops:
+            loop.start()
+
+    def add(self, *forwarders: ICNForwarder):
+        for forwarder in forwarders:
+            self._wire(forwarder, next(self._next_loop))
+            self.forwarders.append(forwarder)
+
+    @staticmethod
+    def _wire(forwarder: ICNForwarder, loop: HostLoop):
+        stack = forwarder.lstack
+        # Top to bottom, like in LayerStack
+        layers = stack.layers
+        # down[i]: from layers[i] to layers[i+1], up[i]: from layers[i] to layers[i-1]
+        down = [LocalQueue(loop) for _ in layers]
+        up = [LocalQueue(loop) for _ in layers]
+        top = LocalQueue(loop)
+        for i, layer in enumerate(layers):
+            if i + 1 < len(layers):
+                lower = layers[i + 1]
+                down[i].receiver = lambda data, l=lower, j=i + 1: l.data_from_higher(down[j], up[j], data)
+            if i > 0:
+                higher = layers[i - 1]
+                up[i].receiver = lambda data, h=higher, j=i - 1: h.data_from_lower(down[j], up[j], data)
+            layer.queue_to_lower = down[i]
+            layer.queue_to_higher = up[i]
+            layer.queue_from_higher = down[i - 1] if i > 0 else top
+            layer.queue_from_lower = up[i + 1] if i + 1 < len(layers) else LocalQueue(loop)
+            # The layers run on the event loop, not in processes of their own.
+            layer._hosted = True
+        top.receiver = lambda data: layers[0].data_from_higher(down[0], up[0], data)
+        stack.queue_from_higher = top
+        stack.queue_to_higher = up[0]
+        loop.add_linklayer(forwarder.linklayer)
+
+    def close(self):
+        for loop in self.loops:
+            loop.stop()
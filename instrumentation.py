@@ -0,0 +1,449 @@
+#!/usr/bin/env python3.6
+
+"""
+Per-forwarder resource and traffic instrumentation.
+
+Counters are kept in anonymous shared memory, so they can be incremented by the layer processes after they were
+forked and read by the measurement process:
+
+- the link layer's socket is wrapped by a CountingSocket, which counts the packets and bytes received from and sent
+  to each face address
+- the routing layer's data_from_higher()/data_from_lower() and the queues it writes to are wrapped, so the messages
+  it originates (everything it sends down minus what it passes through from above) and consumes are counted
+
+A Sampler thread periodically reads the counters, the CPU time, RSS and context switches of the forwarder's layer
+processes from /proc, and the number of RIB and FIB entries.  Each counter has a single writing process, so no
+locking is needed.  Nothing is wrapped unless a Sampler is created, so there is no overhead when sampling is off.
+
+A FibWatch records the changes of the FIB entry for one prefix where they happen: the data structures of the layers
+that store the forwarder's FIB are wrapped, and each store of a FIB whose entry for the prefix differs from the last
+one recorded is appended to a ring in shared memory, with the time of the store and the faces of the entry, and
+announced on a pipe.  Probes are woken by the changes, instead of polling every FIB through the Manager.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import mmap
+import multiprocessing
+import os
+import select
+import socket
+import struct
+import threading
+from time import monotonic
+
+from results import ResultStore
+
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+_CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+
+class Counters(object):
+    """
+    Shared counters of one forwarder: a header with the routing counters and the number of faces, followed by a
+    record per face address.
+    """
+
+    # routing: from higher, to lower (layer process), to lower (timers in the parent), from lower, to higher
+    HEADER = struct.Struct('=QQQQQQ')
+    # face: IPv4 address, port, packets in, bytes in, packets out, bytes out
+    FACE = struct.Struct('=4sHxxQQQQ')
+    MAX_FACES = 256
+
+    def __init__(self):
+        self.mm = mmap.mmap(-1, Counters.HEADER.size + Counters.MAX_FACES * Counters.FACE.size)
+        # Face address -> slot, per process: every process that writes face counters allocates its own slots, and
+        # only the link layer process does.
+        self._slots: Dict[Tuple[str, int], int] = dict()
+
+    def add(self, field: int, value: int = 1):
+        off = field * 8
+        struct.pack_into('=Q', self.mm, off, struct.unpack_from('=Q', self.mm, off)[0] + value)
+
+    def get(self, field: int) -> int:
+        return struct.unpack_from('=Q', self.mm, field * 8)[0]
+
+    def count_face(self, addr: Tuple[str, int], direction: int, nbytes: int):
+        """Count a packet from (direction 0) or to (direction 1) a face address."""
+        slot = self._slots.get(addr)
+        if slot is None:
+            slot = self.get(5)
+            if slot >= Counters.MAX_FACES:
+                return
+            try:
+                ip = socket.inet_aton(addr[0])
+            except OSError:
+                ip = bytes(4)
+            Counters.FACE.pack_into(self.mm, self._face_offset(slot), ip, addr[1], 0, 0, 0, 0)
+            self._slots[addr] = slot
+            self.add(5)
+        off = self._face_offset(slot) + 8 + direction * 16
+        packets, total = struct.unpack_from('=QQ', self.mm, off)
+        struct.pack_into('=QQ', self.mm, off, packets + 1, total + nbytes)
+
+    @staticmethod
+    def _face_offset(slot: int) -> int:
+        return Counters.HEADER.size + slot * Counters.FACE.size
+
+    def faces(self) -> List[Tuple[str, int, int, int, int, int]]:
+        """(address, port, packets in, bytes in, packets out, bytes out) of each face."""
+        faces = []
+        for slot in range(min(self.get(5), Counters.MAX_FACES)):
+            ip, port, pin, bin, pout, bout = Counters.FACE.unpack_from(self.mm, self._face_offset(slot))
+            faces.append((socket.inet_ntoa(ip), port, pin, bin, pout, bout))
+        return faces
+
+    def routing(self) -> Tuple[int, int]:
+        """Routing messages sent and received by the routing layer."""
+        from_higher, to_lower, to_lower_timers, from_lower, to_higher, _ = Counters.HEADER.unpack_from(self.mm, 0)
+        return max(0, to_lower + to_lower_timers - from_higher), max(0, from_lower - to_higher)
+
+
+class CountingSocket(object):
+    """Wraps the socket of a link layer and counts the traffic per face address."""
+
+    def __init__(self, sock, counters: Counters):
+        self._sock = sock
+        self._counters = counters
+
+    def sendto(self, data: bytes, addr) -> int:
+        n = self._sock.sendto(data, addr)
+        self._counters.count_face(addr, 1, len(data))
+        return n
+
+    def recvfrom(self, bufsize: int, flags: int = 0):
+        data, addr = self._sock.recvfrom(bufsize, flags)
+        self._counters.count_face(addr, 0, len(data))
+        return data, addr
+
+    def fileno(self) -> int:
+        return self._sock.fileno()
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+class CountingQueue(object):
+    """Wraps a queue a layer writes to and counts the items put into it."""
+
+    def __init__(self, q, counters: Counters, field: int):
+        self._queue = q
+        self._counters = counters
+        self._field = field
+
+    def put(self, item, *args, **kwargs):
+        self._counters.add(self._field)
+        return self._queue.put(item, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._queue, name)
+
+    @staticmethod
+    def unwrap(q):
+        return q._queue if isinstance(q, CountingQueue) else q
+
+
+def _instrument_routing(layer, counters: Counters):
+    data_from_higher = layer.data_from_higher
+    data_from_lower = layer.data_from_lower
+
+    # The layer process may be passed the wrapped queue_to_lower below, count its messages only once.
+    def counting_from_higher(to_lower, to_higher, data):
+        counters.add(0)
+        data_from_higher(CountingQueue(CountingQueue.unwrap(to_lower), counters, 1),
+                         CountingQueue(to_higher, counters, 4), data)
+
+    def counting_from_lower(to_lower, to_higher, data):
+        counters.add(3)
+        data_from_lower(CountingQueue(CountingQueue.unwrap(to_lower), counters, 1),
+                        CountingQueue(to_higher, counters, 4), data)
+
+    layer.data_from_higher = counting_from_higher
+    layer.data_from_lower = counting_from_lower
+    # Route requests sent by the ageing timers, which run in the process that started the forwarder
+    layer.queue_to_lower = CountingQueue(layer.queue_to_lower, counters, 2)
+
+
+class _WatchedStructs(object):
+    """Wraps the data structures a layer stores the FIB into, and reports every FIB stored to a FibWatch."""
+
+    def __init__(self, structs, watch: 'FibWatch', index: int):
+        self._structs = structs
+        self._watch = watch
+        self._index = index
+
+    def __setitem__(self, key, value):
+        self._structs[key] = value
+        if key == 'fib':
+            self._watch.record(self._index, value)
+
+    def __getitem__(self, key):
+        return self._structs[key]
+
+    def __contains__(self, key) -> bool:
+        return key in self._structs
+
+    def __getattr__(self, name):
+        return getattr(self._structs, name)
+
+
+class FibWatch(object):
+    """
+    Records the changes of the FIB entry for `prefix` in a set of forwarders: per forwarder, a ring of the last RING
+    changes, each with the time of the FIB store and the faces of the entry (none if there is no entry).  Layers that
+    keep the forwarder's data structures as their `_data_structs` are wrapped, so the watch must be created before
+    the forwarders are started.  The FIBs of forwarders without such a layer are polled every `interval` seconds by
+    the reading side instead.  One thread at a time may wait() for changes.
+    """
+
+    # time of the FIB store, number of faces, faces
+    EVENT = struct.Struct('=dI8i')
+    RING = 64
+
+    def __init__(self, forwarders: List, prefix, interval: float = 0.001):
+        self.forwarders = list(forwarders)
+        self.prefix = prefix
+        self.interval = interval
+        self._slot_size = 8 + FibWatch.RING * FibWatch.EVENT.size
+        self.mm = mmap.mmap(-1, len(self.forwarders) * self._slot_size)
+        # Layers of different processes may store the FIB of the same forwarder.
+        self._lock = multiprocessing.Lock()
+        self.wake_r, self.wake_w = os.pipe()
+        os.set_blocking(self.wake_r, False)
+        os.set_blocking(self.wake_w, False)
+        # Forwarders whose FIB stores aren't seen, and are polled
+        self.polled: List[int] = []
+        # Per forwarder, the changes read so far: the state when the watch was created, then every change
+        self._history: List[List[Tuple[float, List[int]]]] = []
+        self._read: List[int] = [0] * len(self.forwarders)
+        self._read_lock = threading.Lock()
+        now = monotonic()
+        for i, f in enumerate(self.forwarders):
+            self._history.append([(now, self._faces(f.data_structs['fib']))])
+            wrapped = False
+            for layer in f.lstack.layers:
+                if getattr(layer, '_data_structs', None) is f.data_structs:
+                    layer._data_structs = _WatchedStructs(f.data_structs, self, i)
+                    wrapped = True
+            if not wrapped:
+                self.polled.append(i)
+
+    def _faces(self, fib) -> List[int]:
+        entry = fib.find_fib_entry(self.prefix)
+        if entry is None:
+            return []
+        return list(entry.faceid) if isinstance(entry.faceid, list) else [entry.faceid]
+
+    def _offset(self, index: int, k: int) -> int:
+        return index * self._slot_size + 8 + (k % FibWatch.RING) * FibWatch.EVENT.size
+
+    def record(self, index: int, fib):
+        """Called by the layers storing a FIB."""
+        t = monotonic()
+        faces = self._faces(fib)[:8]
+        with self._lock:
+            count = struct.unpack_from('=Q', self.mm, index * self._slot_size)[0]
+            if count > 0:
+                event = FibWatch.EVENT.unpack_from(self.mm, self._offset(index, count - 1))
+                last = list(event[2:2 + event[1]])
+            else:
+                last = self._history[index][0][1]
+            if faces == last:
+                return
+            FibWatch.EVENT.pack_into(self.mm, self._offset(index, count), t, len(faces),
+                                     *(faces + [0] * (8 - len(faces))))
+            struct.pack_into('=Q', self.mm, index * self._slot_size, count + 1)
+        self.wake()
+
+    def wake(self):
+        if self.wake_w is None:
+            return
+        try:
+            os.write(self.wake_w, b'\0')
+        except BlockingIOError:
+            pass
+
+    def wait(self, timeout: float):
+        """Wait until a change may have been recorded, at most `timeout` seconds."""
+        if len(self.polled) > 0:
+            timeout = min(timeout, self.interval)
+        select.select([self.wake_r], [], [], timeout)
+        try:
+            while len(os.read(self.wake_r, 4096)) > 0:
+                pass
+        except BlockingIOError:
+            pass
+
+    def history(self, index: int) -> List[Tuple[float, List[int]]]:
+        """The faces of the entry when the watch was created, and the time and faces of every change since."""
+        with self._read_lock:
+            history = self._history[index]
+            if index in self.polled:
+                faces = self._faces(self.forwarders[index].data_structs['fib'])
+                if faces != history[-1][1]:
+                    history.append((monotonic(), faces))
+                return list(history)
+            count = struct.unpack_from('=Q', self.mm, index * self._slot_size)[0]
+            # Changes that were overwritten before they were read are lost.
+            for k in range(max(self._read[index], count - FibWatch.RING), count):
+                event = FibWatch.EVENT.unpack_from(self.mm, self._offset(index, k))
+                history.append((event[0], list(event[2:2 + event[1]])))
+            self._read[index] = count
+            return list(history)
+
+    def faces(self, index: int) -> List[int]:
+        """The faces the entry points to now."""
+        return self.history(index)[-1][1]
+
+    def close(self):
+        if self.wake_r is not None:
+            os.close(self.wake_r)
+            os.close(self.wake_w)
+            self.wake_r, self.wake_w = None, None
+            self.mm.close()
+
+    def __del__(self):
+        if getattr(self, 'wake_r', None) is not None:
+            self.close()
+
+
+def _process_stats(pid: int) -> Optional[Tuple[float, int, int]]:
+    """CPU time in seconds, RSS in bytes and context switches of a process, None if it is gone."""
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open(f'/proc/{pid}/status', 'r') as f:
+            switches = sum(int(line.split()[1]) for line in f
+                           if line.startswith(('voluntary_ctxt_switches', 'nonvoluntary_ctxt_switches')))
+    except (OSError, IndexError, ValueError):
+        return None
+    # Fields after the command: state is field 3, utime 14, stime 15, rss 24
+    cpu = (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+    return cpu, int(fields[21]) * _PAGE_SIZE, switches
+
+
+def _entries(ds) -> Optional[int]:
+    for attr in ['container', '_container']:
+        container = getattr(ds, attr, None)
+        if container is not None:
+            try:
+                return len(container)
+            except TypeError:
+                pass
+    try:
+        return len(ds)
+    except TypeError:
+        return None
+
+
+class Sampler(threading.Thread):
+    """Samples the resources and traffic of a set of forwarders every `interval` seconds while a run is going on."""
+
+    def __init__(self, forwarders: List, interval: float):
+        super().__init__(daemon=True)
+        self.forwarders = list(forwarders)
+        self.interval = interval
+        self.counters = [Counters() for _ in self.forwarders]
+        for f, c in zip(self.forwarders, self.counters):
+            f.linklayer.sock = CountingSocket(f.linklayer.sock, c)
+            routinglayer = getattr(f, 'routinglayer', None)
+            if routinglayer is not None:
+                _instrument_routing(routinglayer, c)
+        # Last known process stats, kept for processes that have already exited
+        self._stats: Dict[int, Tuple[float, int, int]] = dict()
+        self.start_time: float = None
+        # (time, forwarder, cpu, rss, context switches, routing sent, routing received, rib entries, fib entries)
+        self.samples: List[tuple] = list()
+        # (time, forwarder, address, port, packets in, bytes in, packets out, bytes out)
+        self.faces: List[tuple] = list()
+        self._stopped = threading.Event()
+
+    @staticmethod
+    def _pids(forwarder) -> List[int]:
+        pids = []
+        for layer in forwarder.lstack.layers:
+            process = getattr(layer, 'process', None) or getattr(layer, '_process', None)
+            if process is not None and process.pid is not None:
+                pids.append(process.pid)
+        return pids
+
+    def totals(self) -> List[Tuple[float, int, int, int, int]]:
+        """
+        Current CPU time (NaN without layer processes), routing messages sent and received, and packets and bytes
+        sent to all faces of each forwarder.
+        """
+        totals = []
+        for f, c in zip(self.forwarders, self.counters):
+            pids = self._pids(f)
+            cpu = 0.0
+            for pid in pids:
+                stats = _process_stats(pid)
+                if stats is not None:
+                    self._stats[pid] = stats
+                cpu += self._stats.get(pid, (0.0, 0, 0))[0]
+            sent, received = c.routing()
+            faces = c.faces()
+            totals.append((cpu if len(pids) > 0 else float('nan'), sent, received,
+                           sum(face[4] for face in faces), sum(face[5] for face in faces)))
+        return totals
+
+    def sample(self):
+        t = monotonic() - self.start_time
+        for i, (f, c) in enumerate(zip(self.forwarders, self.counters)):
+            cpu, rss, switches = 0.0, 0, 0
+            pids = self._pids(f)
+            for pid in pids:
+                stats = _process_stats(pid)
+                if stats is not None:
+                    self._stats[pid] = stats
+                stats = self._stats.get(pid, (0.0, 0, 0))
+                cpu, rss, switches = cpu + stats[0], rss + stats[1], switches + stats[2]
+            try:
+                rib, fib = _entries(f.data_structs['rib']), _entries(f.data_structs['fib'])
+            except Exception:
+                rib, fib = None, None
+            sent, received = c.routing()
+            nan = float('nan')
+            self.samples.append((t, i, cpu if len(pids) > 0 else nan, rss, switches, sent, received,
+                                 rib if rib is not None else -1, fib if fib is not None else -1))
+            for face in c.faces():
+                self.faces.append((t, i) + face)
+
+    def run(self):
+        self.start_time = monotonic()
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        """Stop sampling and take a final sample."""
+        self._stopped.set()
+        if self.is_alive():
+            self.join()
+            self.sample()
+
+    def write(self, basename: str, params: List, run: int):
+        """
+        Write the final sample of each forwarder to `<basename>_resources.csv`, and all samples to the result store
+        `<basename>_resources/`.
+        """
+        prefix = ','.join(str(p) for p in params) + f',{run}'
+        final: Dict[int, tuple] = {s[1]: s for s in self.samples}
+        totals: Dict[int, List[int]] = dict()
+        last_t = self.samples[-1][0] if len(self.samples) > 0 else None
+        for t, i, _, _, pin, bin, pout, bout in self.faces:
+            if t == last_t:
+                total = totals.setdefault(i, [0, 0, 0, 0])
+                for j, v in enumerate([pin, bin, pout, bout]):
+                    total[j] += v
+        filename = f'{basename}_resources.csv'
+        with open(filename, 'a') as f:
+            for i, (t, _, cpu, rss, switches, sent, received, rib, fib) in sorted(final.items()):
+                traffic = ','.join(str(v) for v in totals.get(i, [0, 0, 0, 0]))
+                f.write(f'{prefix},{i},{cpu},{rss},{switches},{traffic},{sent},{received},{rib},{fib}\n')
+        print(f'Wrote data to file {filename}')
+        store = ResultStore(f'{basename}_resources', 'resources')
+        run_id = store.new_run({'params': params, 'run': run, 'interval': self.interval})
+        store.append('samples', [(run_id,) + s for s in self.samples])
+        store.append('faces', [(run_id, t, i, int.from_bytes(socket.inet_aton(ip), 'big'), port, pin, bin, pout, bout)
+                               for t, i, ip, port, pin, bin, pout, bout in self.faces])
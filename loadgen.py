@@ -0,0 +1,264 @@
+#!/usr/bin/env python3.6
+
+"""
+Interest load generator for LayerStack based clients.
+
+The sending thread follows an absolute schedule, so the jitter of one send doesn't accumulate over the run, and
+falls behind gracefully by sending back-to-back until it caught up.  Interests due within the same millisecond are
+sent together.  Responses are consumed concurrently by a receiving thread.
+
+Modes:
+
+- `constant`: open loop, one interest every 1/rate seconds
+- `poisson`: open loop, exponentially distributed gaps with mean 1/rate
+- `window`: closed loop, keeps `window` interests outstanding; an interest counts as answered when its response
+    arrives or after `timeout` seconds
+"""
+
+from typing import Callable, Dict, List, Optional
+
+import collections
+import queue
+import random
+import threading
+from time import sleep, monotonic
+
+from PiCN.LayerStack import LayerStack
+from PiCN.Packets import Name, Interest, Content, Nack
+
+
+MODES = ['constant', 'poisson', 'window']
+
+# Sleeping is only precise to about a millisecond, so interests due within the next tick are sent right away, as one
+# batch.  Spinning for the rest of the wait would compete with the receiving thread for the GIL at high rates.
+_TICK = 0.001
+
+
+def wait_until(deadline: float):
+    remaining = deadline - monotonic()
+    if remaining > _TICK:
+        sleep(remaining)
+
+
+class LoadGenerator(object):
+
+    def __init__(self, stack: LayerStack, fid: int, name: Callable[[int], Name], count: int,
+                 on_response: Callable[[List], None], mode: str = 'constant', rate: float = 10.0, window: int = 1,
+                 timeout: float = 4.0, duration: float = None, on_sent: Callable[[int, float], None] = None):
+        """
+        :param stack: The started LayerStack to send the interests through
+        :param fid: The face to send the interests to
+        :param name: Maps the sequence number of an interest to its name
+        :param count: The maximum number of interests to send
+        :param on_response: Called on the receiving thread with each element taken from the stack's queue_to_higher
+        :param mode: One of MODES
+        :param rate: The rate of the open loop modes, in interests per second
+        :param window: The number of outstanding interests in the closed loop mode
+        :param timeout: Time after which an interest counts as lost in the closed loop mode, in seconds
+        :param duration: If set, stop sending after this many seconds, even if less than `count` interests were sent
+        :param on_sent: Called on the sending thread with the sequence number and send time of each interest
+        """
+        if mode not in MODES:
+            raise ValueError(f'Unknown load generator mode: {mode}')
+        self.stack = stack
+        self.fid = fid
+        self.name = name
+        self.count = count
+        self.on_response = on_response
+        self.mode = mode
+        self.rate = rate
+        self.window = window
+        self.timeout = timeout
+        self.duration = duration
+        self.on_sent = on_sent
+        self.sent = 0
+        self.received = 0
+        self.start_time: float = None
+        self.end_time: float = None
+        self._window = threading.Semaphore(window)
+        # Name -> send time of the interests outstanding in closed loop mode
+        self._outstanding: Dict[Name, float] = collections.OrderedDict()
+        self._outstanding_lock = threading.Lock()
+        self._sending_done = threading.Event()
+        self._stopped = threading.Event()
+        self._sender = threading.Thread(target=self._send, daemon=True)
+        self._receiver = threading.Thread(target=self._receive, daemon=True)
+
+    def start(self):
+        self.start_time = monotonic()
+        self._receiver.start()
+        self._sender.start()
+
+    def wait_sent(self):
+        """Wait until all interests have been sent."""
+        self._sending_done.wait()
+
+    def stop(self, linger: float = 0.0):
+        """Wait until all interests have been sent, then keep receiving for `linger` seconds and stop."""
+        self._sending_done.wait()
+        sleep(linger)
+        self._stopped.set()
+        self._receiver.join()
+        self._sender.join()
+        # Hand over what is still queued, the receiving thread may have been stopped between two gets.
+        while not self.stack.queue_to_higher.empty():
+            self.received += 1
+            self.on_response(self.stack.queue_to_higher.get())
+
+    def _send(self):
+        deadline = self.start_time
+        for i in range(self.count):
+            if self.mode == 'window':
+                self._window.acquire()
+                with self._outstanding_lock:
+                    self._outstanding[self.name(i)] = monotonic()
+            else:
+                wait_until(deadline)
+                if self.mode == 'constant':
+                    deadline += 1.0 / self.rate
+                else:
+                    deadline += random.expovariate(self.rate)
+            if self._stopped.is_set():
+                break
+            if self.duration is not None and monotonic() - self.start_time >= self.duration:
+                break
+            self.stack.queue_from_higher.put([self.fid, Interest(self.name(i))])
+            self.sent += 1
+            if self.on_sent is not None:
+                self.on_sent(i, monotonic())
+        self.end_time = monotonic()
+        self._sending_done.set()
+
+    def _expire(self):
+        now = monotonic()
+        with self._outstanding_lock:
+            while len(self._outstanding) > 0:
+                name, sent = next(iter(self._outstanding.items()))
+                if now - sent < self.timeout:
+                    break
+                del self._outstanding[name]
+                self._window.release()
+
+    def _receive(self):
+        while not self._stopped.is_set():
+            try:
+                data = self.stack.queue_to_higher.get(timeout=0.01)
+            except queue.Empty:
+                if self.mode == 'window':
+                    self._expire()
+                continue
+            self.received += 1
+            if self.mode == 'window':
+                with self._outstanding_lock:
+                    if self._outstanding.pop(data[1].name, None) is not None:
+                        self._window.release()
+                self._expire()
+            self.on_response(data)
+
+
+class LatencyHistogram(object):
+    """
+    Log-linear histogram of latencies in the style of HdrHistogram: values are recorded in microseconds, with
+    2**SUB_BITS linear sub-buckets per power of two, i.e. a relative error below 0.1%.  Memory is bounded by the
+    largest recordable value, not by the number of recorded values.
+    """
+
+    SUB_BITS = 11
+    # 2**32 us, a little more than an hour
+    MAX_BITS = 32
+
+    def __init__(self):
+        half = 1 << (LatencyHistogram.SUB_BITS - 1)
+        self._counts: List[int] = [0] * ((LatencyHistogram.MAX_BITS - LatencyHistogram.SUB_BITS + 2) * half)
+        self.count = 0
+        self.max = 0.0
+
+    @staticmethod
+    def _index(us: int) -> int:
+        e = us.bit_length() - LatencyHistogram.SUB_BITS
+        if e <= 0:
+            return us
+        half = 1 << (LatencyHistogram.SUB_BITS - 1)
+        return (e + 1) * half + (us >> e) - half
+
+    @staticmethod
+    def _value(index: int) -> float:
+        """The midpoint of a bucket, in seconds."""
+        half = 1 << (LatencyHistogram.SUB_BITS - 1)
+        if index < 2 * half:
+            return index / 1e6
+        e = index // half - 1
+        low = (index % half + half) << e
+        return (low + (1 << e) / 2) / 1e6
+
+    def record(self, seconds: float):
+        us = min(int(seconds * 1e6), (1 << LatencyHistogram.MAX_BITS) - 1)
+        self._counts[LatencyHistogram._index(us)] += 1
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def merge(self, other: 'LatencyHistogram'):
+        """Add the values recorded by another histogram, e.g. of a concurrent client."""
+        for index, c in enumerate(other._counts):
+            if c > 0:
+                self._counts[index] += c
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """The latency in seconds below which p percent of the recorded values lie, None if nothing was recorded."""
+        if self.count == 0:
+            return None
+        threshold = p / 100.0 * self.count
+        cumulative = 0
+        for index, c in enumerate(self._counts):
+            cumulative += c
+            if c > 0 and cumulative >= threshold:
+                return min(LatencyHistogram._value(index), self.max)
+        return self.max
+
+
+class ResponseCollector(object):
+    """
+    Streaming summary of a load generator run: a latency histogram of the satisfied interests, counts of nacks and
+    timed out interests, and per time bucket the number of interests sent and satisfied.  Interests are assigned to
+    the bucket of their send time.  If a `timeout` is given, content arriving later than that counts as timed out,
+    and is counted separately as late.
+    """
+
+    def __init__(self, start_time: float, duration: float, bucket_width: float = 0.5, timeout: float = None):
+        self.start_time = start_time
+        self.timeout = timeout
+        self.bucket_width = bucket_width
+        buckets = int(duration / bucket_width) + 1
+        self.histogram = LatencyHistogram()
+        self.sent: List[int] = [0] * buckets
+        self.satisfied: List[int] = [0] * buckets
+        self.nacks = 0
+        self.late = 0
+        self._lock = threading.Lock()
+
+    def bucket(self, t: float) -> int:
+        return min(max(0, int((t - self.start_time) / self.bucket_width)), len(self.sent) - 1)
+
+    def on_sent(self, seq: int, t: float):
+        with self._lock:
+            self.sent[self.bucket(t)] += 1
+
+    def on_response(self, packet, duration: Optional[float]):
+        """Record a response; `duration` is None if the interest was not (or no longer) outstanding."""
+        if isinstance(packet, Nack):
+            self.nacks += 1
+            return
+        if not isinstance(packet, Content) or duration is None:
+            return
+        if self.timeout is not None and duration > self.timeout:
+            self.late += 1
+            return
+        self.histogram.record(duration)
+        with self._lock:
+            self.satisfied[self.bucket(monotonic() - duration)] += 1
+
+    @property
+    def timeouts(self) -> int:
+        return sum(self.sent) - self.histogram.count - self.nacks
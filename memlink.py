@@ -0,0 +1,180 @@
+#!/usr/bin/env python3.6
+
+"""
+In-memory link layer for single-host topologies.
+
+A MemoryLinkFabric connects the UDP4LinkLayers of a topology through shared-memory ring buffers.  The link layers
+themselves stay untouched: the fabric replaces their socket with a MemorySocket, which hands packets for other
+link layers on the fabric over through the receiver's ring buffer, and falls back to the real UDP socket for every
+other address (e.g. autoconfig broadcasts, or a Fetch client that is not on the fabric).  Face IDs, peer lists and
+getsockname() therefore keep working unchanged.
+
+All link layers must be attached to the fabric before any of their processes are started, as the rings are
+shared with the layer processes when they are forked.
+"""
+
+from typing import Dict, Optional, Tuple
+
+import mmap
+import multiprocessing
+import os
+import select
+import socket
+import struct
+
+
+LOCAL_ADDRESSES = ['0.0.0.0', '127.0.0.1', 'localhost']
+
+
+class Ring(object):
+    """
+    Multi-producer, single-consumer ring buffer in anonymous shared memory.  Write and read positions are byte
+    counters that only ever grow; records wrap around the end of the buffer.  Every record is announced by one byte
+    on a pipe, so the consumer can wait for records with select().
+    """
+
+    HEADER = struct.Struct('=QQ')
+    RECORD = struct.Struct('=IH')
+
+    def __init__(self, size: int):
+        self.size = size
+        self.mm = mmap.mmap(-1, Ring.HEADER.size + size)
+        self.lock = multiprocessing.Lock()
+        self.wake_r, self.wake_w = os.pipe()
+        os.set_blocking(self.wake_r, False)
+        os.set_blocking(self.wake_w, False)
+        self.dropped = multiprocessing.Value('Q', 0, lock=False)
+
+    def _write(self, pos: int, data: bytes):
+        off = Ring.HEADER.size + pos % self.size
+        first = min(len(data), Ring.HEADER.size + self.size - off)
+        self.mm[off:off + first] = data[:first]
+        if first < len(data):
+            self.mm[Ring.HEADER.size:Ring.HEADER.size + len(data) - first] = data[first:]
+
+    def _read(self, pos: int, n: int) -> bytes:
+        off = Ring.HEADER.size + pos % self.size
+        first = min(n, Ring.HEADER.size + self.size - off)
+        if first == n:
+            return self.mm[off:off + n]
+        return self.mm[off:off + first] + self.mm[Ring.HEADER.size:Ring.HEADER.size + n - first]
+
+    def put(self, data: bytes, src_port: int) -> bool:
+        n = Ring.RECORD.size + len(data)
+        with self.lock:
+            w, r = Ring.HEADER.unpack_from(self.mm, 0)
+            if w + n - r > self.size:
+                # Full, drop the packet like a full socket buffer would.
+                self.dropped.value += 1
+                return False
+            self._write(w, Ring.RECORD.pack(len(data), src_port))
+            self._write(w + Ring.RECORD.size, data)
+            struct.pack_into('=Q', self.mm, 0, w + n)
+        try:
+            os.write(self.wake_w, b'\0')
+        except BlockingIOError:
+            pass
+        return True
+
+    def _drain(self):
+        try:
+            while len(os.read(self.wake_r, 4096)) > 0:
+                pass
+        except BlockingIOError:
+            pass
+
+    def get(self) -> Optional[Tuple[bytes, int]]:
+        w, r = Ring.HEADER.unpack_from(self.mm, 0)
+        if r == w:
+            # A producer writes the wake byte after releasing the lock, so the record it announces may already have
+            # been taken, and the byte would keep the pipe readable forever.  Drain the pipe, and look again, as a
+            # record put in the meantime may have had its byte drained.
+            self._drain()
+            w, r = Ring.HEADER.unpack_from(self.mm, 0)
+            if r == w:
+                return None
+        length, src_port = Ring.RECORD.unpack(self._read(r, Ring.RECORD.size))
+        data = self._read(r + Ring.RECORD.size, length)
+        struct.pack_into('=Q', self.mm, 8, r + Ring.RECORD.size + length)
+        try:
+            os.read(self.wake_r, 1)
+        except BlockingIOError:
+            pass
+        return data, src_port
+
+    def close(self):
+        os.close(self.wake_r)
+        os.close(self.wake_w)
+        self.mm.close()
+
+
+class MemorySocket(object):
+    """Stands in for the UDP socket of a link layer attached to a MemoryLinkFabric."""
+
+    def __init__(self, fabric: 'MemoryLinkFabric', sock: socket.socket):
+        self._fabric = fabric
+        self._sock = sock
+        self._port: int = sock.getsockname()[1]
+        self._ring: Ring = fabric.rings[self._port]
+        # A single file descriptor that becomes readable for both ring records and UDP datagrams, so the link
+        # layer can keep selecting on its socket.
+        self._epoll = select.epoll()
+        self._epoll.register(sock.fileno(), select.EPOLLIN)
+        self._epoll.register(self._ring.wake_r, select.EPOLLIN)
+
+    def fileno(self) -> int:
+        return self._epoll.fileno()
+
+    def getsockname(self):
+        return self._sock.getsockname()
+
+    def sendto(self, data: bytes, addr: Tuple[str, int]) -> int:
+        ring = self._fabric.rings.get(addr[1]) if addr[0] in LOCAL_ADDRESSES else None
+        if ring is None:
+            return self._sock.sendto(data, addr)
+        ring.put(data, self._port)
+        return len(data)
+
+    def recvfrom(self, bufsize: int, flags: int = 0) -> Tuple[bytes, Tuple[str, int]]:
+        while True:
+            record = self._ring.get()
+            if record is not None:
+                data, src_port = record
+                # The address the kernel would have reported for a datagram from a local socket.
+                return data[:bufsize], ('127.0.0.1', src_port)
+            try:
+                return self._sock.recvfrom(bufsize, flags | socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                if flags & socket.MSG_DONTWAIT:
+                    raise
+            self._epoll.poll()
+
+    def close(self):
+        self._epoll.close()
+        self._sock.close()
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+class MemoryLinkFabric(object):
+
+    def __init__(self, ring_size: int = 1 << 20):
+        self.ring_size = ring_size
+        # Port of the link layer -> its receive ring
+        self.rings: Dict[int, Ring] = dict()
+
+    def attach(self, *linklayers):
+        """Connect link layers to the fabric.  Must be called before any of their processes are started."""
+        for linklayer in linklayers:
+            port = linklayer.sock.getsockname()[1]
+            self.rings[port] = Ring(self.ring_size)
+            linklayer.sock = MemorySocket(self, linklayer.sock)
+
+    def dropped(self) -> int:
+        return sum(r.dropped.value for r in self.rings.values())
+
+    def close(self):
+        for ring in self.rings.values():
+            ring.close()
+        self.rings = dict()
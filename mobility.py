@@ -0,0 +1,236 @@
+#!/usr/bin/env python3.6
+
+"""
+Repository mobility with a pool of pre-started repositories.
+
+Instead of starting a new repository at every hop, a RepoPool starts one repository per edge forwarder before the
+measurement, and moves the attachment between them.  The link layer socket of each repository is wrapped by a
+GatedSocket, whose gate is kept in anonymous shared memory, so it can be opened and closed from the measurement
+process after the repository's layer processes were forked:
+
+- while a repository is detached, everything it sends is dropped and everything it receives is discarded, like
+  after closing its socket; its registration at the edge forwarder expires with the lease
+- the first datagram a detached repository sends, its autoconfig forwarder solicitation, is kept; attaching the
+  repository opens the gate and sends the solicitation again from the repository's socket, so it is advertised a
+  forwarder and registers its prefix like a newly started repository would
+- the first datagram a repository sends after its first attachment, its service registration, is kept as well.  The
+  repository's autoconfig layer may consider itself registered when it returns to its edge; if the advertisement
+  passed the gate but the repository hasn't sent anything REREGISTER seconds after an attachment, the kept
+  registration is sent again from its socket.  The acknowledgement reaches the repository as usual, the handover
+  has no registration time
+
+The gate timestamps the first datagrams received and sent after each attachment with the system-wide monotonic
+clock: the forwarder advertisement, the service registration, and the registration's acknowledgement.  The hops follow
+an absolute schedule on a single thread.  When the core forwarder's route started to point towards the new edge is
+looked up once per hop, at its end, from the FIB changes recorded meanwhile, so the pool doesn't poll the FIB.
+"""
+
+from typing import Callable, List, Optional, Tuple
+
+import mmap
+import socket
+import struct
+import threading
+from time import monotonic
+
+
+class GatedSocket(object):
+    """
+    Wraps the socket of a repository's link layer; traffic only passes while the gate is open.  The gate and the
+    solicitation are written by the measurement process while the gate is closed, the counters, times and the
+    registration by the link layer process while it is open, so every field has a single writer at a time.
+    """
+
+    # attached, length of the kept solicitation, datagrams received and sent since the attachment, destination of
+    # the solicitation (IPv4 address and port), time of the first datagram received and sent and of the second one
+    # received since the attachment, length and destination of the kept registration
+    HEADER = struct.Struct('=BxxxIII4sHxxdddI4sHxx')
+    COUNTS = struct.Struct('=II')
+    TIMES = struct.Struct('=ddd')
+    MAX_SOLICITATION = 4096
+    # Offsets of the length and the destination in the header, and of the datagram, of the kept solicitation and
+    # registration
+    SOLICITATION = (4, 16, HEADER.size)
+    REGISTRATION = (48, 52, HEADER.size + MAX_SOLICITATION)
+
+    def __init__(self, sock):
+        self._sock = sock
+        self.mm = mmap.mmap(-1, GatedSocket.HEADER.size + 2 * GatedSocket.MAX_SOLICITATION)
+
+    def _count(self, direction: int):
+        """Count a datagram received (0) or sent (1), and timestamp the ones marking the steps of the handover."""
+        counts = list(GatedSocket.COUNTS.unpack_from(self.mm, 8))
+        counts[direction] += 1
+        GatedSocket.COUNTS.pack_into(self.mm, 8, *counts)
+        # advertisement: first received, registration: first sent, acknowledgement: second received
+        if counts[direction] == 1:
+            struct.pack_into('=d', self.mm, 24 + direction * 8, monotonic())
+        elif direction == 0 and counts[0] == 2:
+            struct.pack_into('=d', self.mm, 40, monotonic())
+
+    def _keep(self, data: bytes, addr, offsets: Tuple[int, int, int]):
+        """Keep a datagram and its destination; the length is written last, as it marks the datagram as kept."""
+        length, destination, start = offsets
+        if not 0 < len(data) <= GatedSocket.MAX_SOLICITATION:
+            return
+        try:
+            ip = socket.inet_aton(addr[0])
+        except OSError:
+            ip = socket.inet_aton('255.255.255.255')
+        self.mm[start:start + len(data)] = data
+        struct.pack_into('=4sH', self.mm, destination, ip, addr[1])
+        struct.pack_into('=I', self.mm, length, len(data))
+
+    def _kept(self, offsets: Tuple[int, int, int]) -> Optional[Tuple[bytes, Tuple[str, int]]]:
+        length, destination, start = offsets
+        n = struct.unpack_from('=I', self.mm, length)[0]
+        if n == 0:
+            return None
+        ip, port = struct.unpack_from('=4sH', self.mm, destination)
+        return self.mm[start:start + n], (socket.inet_ntoa(ip), port)
+
+    def sendto(self, data: bytes, addr) -> int:
+        if self.mm[0] == 1:
+            n = self._sock.sendto(data, addr)
+            self._count(1)
+            if self.registration() is None:
+                self._keep(data, addr, GatedSocket.REGISTRATION)
+            return n
+        if self.solicitation() is None:
+            self._keep(data, addr, GatedSocket.SOLICITATION)
+        return len(data)
+
+    def recvfrom(self, bufsize: int, flags: int = 0):
+        while True:
+            data, addr = self._sock.recvfrom(bufsize, flags)
+            if self.mm[0] == 1:
+                self._count(0)
+                return data, addr
+
+    def solicitation(self) -> Optional[Tuple[bytes, Tuple[str, int]]]:
+        """The kept solicitation and its destination, None if the repository hasn't sent one yet."""
+        return self._kept(GatedSocket.SOLICITATION)
+
+    def registration(self) -> Optional[Tuple[bytes, Tuple[str, int]]]:
+        """The kept registration and its destination, None if the repository hasn't been attached yet."""
+        return self._kept(GatedSocket.REGISTRATION)
+
+    def attach(self) -> float:
+        """Open the gate and send the kept solicitation.  Returns the time the gate was opened."""
+        GatedSocket.COUNTS.pack_into(self.mm, 8, 0, 0)
+        nan = float('nan')
+        GatedSocket.TIMES.pack_into(self.mm, 24, nan, nan, nan)
+        attached = monotonic()
+        self.mm[0] = 1
+        solicitation = self.solicitation()
+        if solicitation is not None:
+            self._sock.sendto(*solicitation)
+        return attached
+
+    def reregister(self) -> bool:
+        """
+        Send the kept registration again if the forwarder advertisement passed the gate since the attachment, but the
+        repository didn't send anything.  Returns whether it was sent.
+        """
+        registration = self.registration()
+        received, sent = GatedSocket.COUNTS.unpack_from(self.mm, 8)
+        if self.mm[0] != 1 or registration is None or received == 0 or sent > 0:
+            return False
+        self._sock.sendto(*registration)
+        return True
+
+    def detach(self):
+        self.mm[0] = 0
+
+    def handover(self) -> List[float]:
+        """Times the forwarder advertisement, the registration and its acknowledgement passed the gate, or NaN."""
+        return list(GatedSocket.TIMES.unpack_from(self.mm, 24))
+
+    def fileno(self) -> int:
+        return self._sock.fileno()
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+class RepoPool(threading.Thread):
+    """
+    Moves the attachment of a repository through a pool of pre-started repositories, one per edge, every `interval`
+    seconds, beginning with the first edge.  `routed[i](since)` is the first time at or after `since` the core
+    forwarder's route pointed towards edge i (`since` if it already did), or None if it hasn't since.
+    """
+
+    # Polling interval of the solicitations of the starting repositories
+    POLL = 0.001
+    # Seconds after an attachment until a repository that didn't register again gets its registration sent for it
+    REREGISTER = 0.25
+
+    def __init__(self, repos: List, routed: List[Callable[[float], Optional[float]]], interval: float):
+        super().__init__(daemon=True)
+        self.repos = list(repos)
+        self.routed = list(routed)
+        self.interval = interval
+        self.gates = [GatedSocket(r.linklayer.sock) for r in self.repos]
+        for r, gate in zip(self.repos, self.gates):
+            r.linklayer.sock = gate
+        self.active: Optional[int] = None
+        # Attachment times, as hop_times before
+        self.hops: List[float] = list()
+        # Per handover: edge, detach and attach time, and the times the advertisement, the registration and its
+        # acknowledgement passed the gate, and the core's route pointed towards the edge; NaN if not seen (e.g. no
+        # detach before the first attachment, no core route update if the route already pointed there or only did
+        # after the next hop)
+        self.handovers: List[List[float]] = list()
+        # Attachments after which the kept registration was sent for the repository
+        self.reregistrations = 0
+        self._stopped = threading.Event()
+
+    def prestart(self, timeout: float = 5.0):
+        """Start all repositories detached, and wait until each has sent its forwarder solicitation."""
+        for r in self.repos:
+            r.start_repo()
+        deadline = monotonic() + timeout
+        while not all(g.solicitation() is not None for g in self.gates):
+            if monotonic() > deadline:
+                raise RuntimeError('Not all repositories of the pool sent a forwarder solicitation')
+            self._stopped.wait(RepoPool.POLL)
+
+    def _hop(self, edge: int):
+        nan = float('nan')
+        detached = nan
+        if self.active is not None:
+            self.gates[self.active].detach()
+            detached = monotonic()
+            self.handovers[-1][3:6] = self.gates[self.active].handover()
+        attached = self.gates[edge].attach()
+        self.hops.append(attached)
+        self.active = edge
+        self.handovers.append([edge, detached, attached, nan, nan, nan, nan])
+
+    def _routed(self):
+        """Look up when the core's route started to point towards the edge of the last handover."""
+        handover = self.handovers[-1]
+        t = self.routed[int(handover[0])](handover[2])
+        if t is not None and t > handover[2]:
+            handover[6] = t
+
+    def run(self):
+        start = monotonic()
+        k = 0
+        while not self._stopped.is_set():
+            self._hop(k % len(self.repos))
+            k += 1
+            if not self._stopped.wait(min(RepoPool.REREGISTER, self.interval)) and self.gates[self.active].reregister():
+                self.reregistrations += 1
+            self._stopped.wait(max(0.0, start + k * self.interval - monotonic()))
+            self._routed()
+
+    def stop(self):
+        self._stopped.set()
+        if self.is_alive():
+            self.join()
+        if self.active is not None and len(self.handovers) > 0:
+            self.handovers[-1][3:6] = self.gates[self.active].handover()
+            self.gates[self.active].detach()
+        for r in self.repos:
+            r.stop_repo()
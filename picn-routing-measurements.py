@@ -1,30 +1,51 @@
 #!/usr/bin/env python3.6
 
-from typing import List, Tuple, Dict
+from typing import Callable, List, Tuple, Dict, Optional
 
+import argparse
+import collections
+import itertools
+import json
+import math
 import multiprocessing
+import multiprocessing.connection
 import threading
+import traceback
+import signal
+import sqlite3
 import sys
 import os
 import queue
 import random
-from datetime import datetime, timedelta
-from time import sleep
+import time
+from datetime import timedelta
+from time import sleep, monotonic
 
 from PiCN.LayerStack import LayerStack
 from PiCN.Layers.PacketEncodingLayer import BasicPacketEncodingLayer
 from PiCN.Layers.ChunkLayer import BasicChunkLayer
 from PiCN.Layers.LinkLayer import UDP4LinkLayer
 from PiCN.Layers.PacketEncodingLayer.Encoder import NdnTlvEncoder
-from PiCN.Layers.RoutingLayer.RoutingInformationBase import BaseRoutingInformationBase, TreeRoutingInformationBase
-from PiCN.Layers.ICNLayer.ForwardingInformationBase import BaseForwardingInformationBase
 from PiCN.Layers.RepositoryLayer.Repository import SimpleMemoryRepository
-from PiCN.Packets import Name, Interest, Content
+from PiCN.Packets import Name, Content, Nack
 from PiCN.Processes import LayerProcess
 from PiCN.ProgramLibs.ICNForwarder import ICNForwarder
 from PiCN.ProgramLibs.ICNDataRepository import ICNDataRepository
 from PiCN.ProgramLibs.Fetch import Fetch
 
+import boundary
+import simulation
+import topology
+from failure import FAILURES, FailingSocket
+from memlink import MemoryLinkFabric
+from mobility import RepoPool
+from shmstore import SharedMemoryManager, unlink_dicts
+from tracing import Tracer
+from host import ForwarderHost, local_structures
+from instrumentation import FibWatch, Sampler
+from loadgen import LatencyHistogram, LoadGenerator, ResponseCollector
+from results import ResultStore
+
 
 now = ''
 repo: ICNDataRepository = None
@@ -32,342 +53,1683 @@ dumpster = list()
 edge_index = -1
 lock = threading.Lock()
 running = True
+hop_timer: threading.Timer = None
+hop_times: List[float] = list()
+_manager = None
+# Sampling interval of the resource instrumentation in seconds, None if off; set by the `sample` option
+sample_interval: Optional[float] = None
+sampler: Optional[Sampler] = None
+# Records kept per traced layer, None if tracing is off; set by the `trace` option
+trace_records: Optional[int] = None
+tracer: Optional[Tracer] = None
+# Event loop threads of a shared forwarder host; set by the `threads` option
+host_threads = 1
+# (file, row) of the result rows written by the current run, reported to the sweep's state database
+results_written: List[Tuple[str, str]] = list()
+# In a sweep worker, the connection each result row is reported through as soon as it was written
+results_conn: Optional[multiprocessing.connection.Connection] = None
+
+# Upper bound of the interests per second a single consumer of the throughput test cases can send; the repository
+# holds this many content objects per consumer and second of the measurement window.
+MAX_CONSUMER_RATE = 500.0
+
+# The routers of the repo hopping test cases: a core node with three children, each with three edge nodes.
+REPO_HOPPING_TOPOLOGY = 'tree:k=3,depth=2,rib=tree'
+
+# Seconds of interest traffic in the failure test case before the failure is injected, and the least time after it.
+FAILURE_WARMUP = 2.0
+FAILURE_MIN_WINDOW = 5.0
+
+
+def get_manager():
+    """
+    Return a Manager that is kept alive across all runs executed by the same process, so long-lived sweep workers
+    don't pay the manager spin-up for every run.
+    """
+    global _manager
+    if _manager is None:
+        _manager = multiprocessing.Manager()
+    return _manager
+
+
+def attach_link(link: str, linklayers) -> Optional[MemoryLinkFabric]:
+    """
+    Connect the link layers according to the `link` option: 'udp' leaves them on their UDP sockets, 'mem' attaches
+    them to a shared-memory fabric.  Must be called before the forwarders are started.
+    """
+    if link == 'udp':
+        return None
+    if link == 'mem':
+        fabric = MemoryLinkFabric()
+        fabric.attach(*linklayers)
+        return fabric
+    raise ValueError(f'Unknown link layer: {link}')
+
+
+def build_forwarders(topo: topology.Topology, ageing: float, host: str, manager=None, **kwargs) -> List[ICNForwarder]:
+    """
+    topology.build() for the `host` option.  For a shared host, the forwarders are created within local_structures(),
+    so their data structures are kept in this process instead of a Manager process per forwarder;
+    so are their tree RIBs, unless a `manager` is given.
+    """
+    if host == 'shared':
+        with local_structures() as local:
+            return topology.build(topo, ageing, manager if manager is not None else local, **kwargs)
+    return topology.build(topo, ageing, manager if manager is not None else get_manager(), **kwargs)
+
+
+def start_host(host: str, forwarders: List[ICNForwarder]) -> Optional[ForwarderHost]:
+    """
+    Run the forwarders according to the `host` option: 'process' runs the layers of each forwarder in processes of
+    their own, 'shared' runs all of them on a ForwarderHost in this process, with `threads` event loops.  Must be
+    called after attach_link() and before the forwarders are started.
+    """
+    if host == 'process':
+        return None
+    if host == 'shared':
+        shared = ForwarderHost(threads=host_threads)
+        shared.add(*forwarders)
+        return shared
+    raise ValueError(f'Unknown forwarder host: {host}')
+
+
+def instrument(forwarders: List[ICNForwarder], counters: bool = False) -> Optional[Sampler]:
+    """
+    Start sampling the resources and traffic of the forwarders if the `sample` option is set.  With `counters`, the
+    forwarders are instrumented even if it isn't, for test cases that read the totals themselves.  Trace the layers
+    of the forwarders if the `trace` option is set; test cases add their client and repo stacks to the tracer
+    themselves.  Must be called after start_host() and before the forwarders are started.
+    """
+    global sampler, tracer
+    sampler = None
+    if sample_interval is not None or counters:
+        sampler = Sampler(forwarders, sample_interval)
+        if sample_interval is not None:
+            sampler.start()
+    tracer = None
+    if trace_records is not None:
+        tracer = Tracer(trace_records)
+        for i, f in enumerate(forwarders):
+            tracer.add(f'forwarder{i}', f.lstack)
+    return sampler
+
+
+def write_samples(testname: str, params: List, run: int, start_time: Optional[float] = None):
+    if sampler is not None and sample_interval is not None:
+        sampler.stop()
+        sampler.write(f'raw/{now}_{testname}', params, run)
+    if tracer is not None:
+        tracer.write(f'raw/{now}_{testname}', params, run, start_time)
 
 
-def measure(fetch: Fetch, repo, forwarders, timeout: float, random_startup_delay: bool) -> Tuple[float, str]:
+def variant(link: str, host: str) -> str:
+    """The testname suffix of the link and host options, and of the threads option of the current run."""
+    if host != 'process' and host_threads != 1:
+        host = f'{host}{host_threads}'
+    return f'{"" if link == "udp" else "_" + link}{"" if host == "process" else "_" + host}'
+
+
+class ConvergenceProbe(threading.Thread):
+    """
+    Timestamps, with the monotonic clock, the moment a route for `prefix` lands in the FIB of each of a set of
+    forwarders.  The times are those of the FIB stores recorded by a FibWatch, and the probe is only woken by them, so
+    it neither sends packets into the network being measured nor reads the FIBs through the Manager.  Must be created
+    before the forwarders are started.  `interval` is the polling interval of the FIBs whose stores can't be watched.
+    """
+
+    def __init__(self, forwarders: List[ICNForwarder], prefix: Name, interval: float = 0.001):
+        super().__init__(daemon=True)
+        self.forwarders = list(forwarders)
+        self.prefix = prefix
+        self.watch = FibWatch(self.forwarders, prefix, interval)
+        self.landed: List[Optional[float]] = [None] * len(self.forwarders)
+        self._landed_events = [threading.Event() for _ in self.forwarders]
+        self._stopped = threading.Event()
+
+    def run(self):
+        pending = list(range(len(self.forwarders)))
+        while len(pending) > 0 and not self._stopped.is_set():
+            for i in list(pending):
+                t = route_time(self.watch.history(i), lambda faces: len(faces) > 0)
+                if t is not None:
+                    self.landed[i] = t
+                    self._landed_events[i].set()
+                    pending.remove(i)
+            self.watch.wait(1.0)
+
+    def wait_landed(self, index: int, timeout: float) -> bool:
+        return self._landed_events[index].wait(timeout)
+
+    def stop(self):
+        self._stopped.set()
+        self.watch.wake()
+        if self.is_alive():
+            self.join()
+
+    def relative(self, start_time: float) -> List[Optional[float]]:
+        return [t - start_time if t is not None else None for t in self.landed]
+
+
+def route_time(history: List[Tuple[float, List[int]]], condition: Callable[[List[int]], bool],
+               since: float = float('-inf')) -> Optional[float]:
+    """
+    The first time at or after `since` the faces of a route in a FibWatch history met `condition`: `since` if the
+    faces in effect then already did, None if they never did.
+    """
+    before = [faces for t, faces in history if t <= since]
+    if len(before) > 0 and condition(before[-1]):
+        return since
+    return next((t for t, faces in history if t > since and condition(faces)), None)
+
+
+def measure(fetch: Fetch, repo, forwarders, timeout: float, random_startup_delay: bool,
+            client_index: int = 0) -> Tuple[float, str, List[Optional[float]]]:
+    """
+    Start the repo and the forwarders, and measure the time until the client can fetch the content.  Instead of
+    flooding the network with interests, the client waits until the route has landed in the FIB of its forwarder
+    `forwarders[client_index]`, and only then starts fetching.  Returns the convergence time, the data received, and
+    for each forwarder the time the route landed in its FIB, all relative to the start of the measurement.
+    """
+    probe = ConvergenceProbe(forwarders, Name('/picn/routing/testrepo'))
+    probe.start()
     repo.start_repo()
+    order = list(forwarders)
     if random_startup_delay:
-        random.shuffle(forwarders)
-    for f in forwarders:
+        random.shuffle(order)
+    for f in order:
         if random_startup_delay:
             sleep(random.uniform(0.1, 0.5))
         f.start_forwarder()
     data = ''
-    start_time = datetime.utcnow()
-    while datetime.utcnow() < start_time + timedelta(seconds=timeout):
+    start_time = monotonic()
+    probe.wait_landed(client_index, timeout)
+    while monotonic() < start_time + timeout:
         try:
             data = fetch.fetch_data(Name('/picn/routing/testrepo/testcontent'), 1.0)
             if data != 'testcontent':
-                sleep(0.1)
+                sleep(0.01)
                 continue
             else:
                 break
         except queue.Empty:
             pass
-    end_time = datetime.utcnow()
+    end_time = monotonic()
+    probe.stop()
     repo.stop_repo()
     for f in forwarders:
         f.stop_forwarder()
     fetch.stop_fetch()
-    return (end_time - start_time).total_seconds(), data
+    return end_time - start_time, data, probe.relative(start_time)
 
 
-def measure_depth_scaling(n: int, ageing: float, random_startup_delay: bool) -> Tuple[int, float, float, bool]:
-    forwarders: List[ICNForwarder] = []
-    for i in range(n):
-        forwarders.append(ICNForwarder(0, encoder=NdnTlvEncoder(), routing=True))
+class DurationTaggingLayer(LayerProcess):
+    """
+    Top layer of a client stack: passes each response up as [fid, packet, duration], the time since its interest was
+    sent, or None if the interest timed out or was never sent.
+    """
+
+    def __init__(self, timeout: float = 4.0):
+        super().__init__('DurationTaggingLayer')
+        self._timeout = timeout
+        # In order of sending, so interests that timed out can be forgotten from the front.
+        self._names: Dict[Name, float] = collections.OrderedDict()
+
+    def _expire(self, now: float):
+        while len(self._names) > 0:
+            name, sent = next(iter(self._names.items()))
+            if now - sent < self._timeout:
+                break
+            del self._names[name]
+
+    def data_from_lower(self, to_lower: multiprocessing.Queue, to_higher: multiprocessing.Queue, data):
+        fid, packet = data
+        now = monotonic()
+        self._expire(now)
+        sent = self._names.pop(packet.name, None)
+        to_higher.put([fid, packet, now - sent if sent is not None else None])
+
+    def data_from_higher(self, to_lower: multiprocessing.Queue, to_higher: multiprocessing.Queue, data):
+        fid, packet = data
+        now = monotonic()
+        self._expire(now)
+        self._names.pop(packet.name, None)
+        self._names[packet.name] = now
+        to_lower.put(data)
+
+
+def measure_topology_scaling(topo: topology.Topology, ageing: float, random_startup_delay: bool, link: str = 'udp',
+                             timeout: float = None,
+                             host: str = 'process') -> Tuple[int, float, float, bool, List[Optional[float]]]:
+    """
+    Measure the convergence time of a topology, with the repository connected to its `repo` forwarder and the
+    client to its `client` forwarder.  The timeout defaults to three routing intervals per hop the route has to
+    travel.
+    """
+    forwarders: List[ICNForwarder] = build_forwarders(topo, ageing, host)
     repo = ICNDataRepository(None, Name('/picn/routing/testrepo'), port=0, encoder=NdnTlvEncoder())
-    for i in range(n):
-        if i < len(forwarders) - 1:
-            forwarders[i].routinglayer._peers.append(forwarders[i+1].linklayer.sock.getsockname())
-        if i == len(forwarders) - 1:
-            fid = forwarders[i].linklayer.get_or_create_fid(repo.linklayer.sock.getsockname(), static=True)
-            rib: BaseRoutingInformationBase = forwarders[i].data_structs['rib']
-            rib.insert(Name('/picn/routing/testrepo'), fid, 1)
-            forwarders[i].data_structs['rib'] = rib
-        forwarders[i].routinglayer._ageing_interval = ageing
+    topology.attach_repo(forwarders[topo.repo], repo.linklayer.sock.getsockname(), Name('/picn/routing/testrepo'))
     repo.repo.add_content(Name('/picn/routing/testrepo/testcontent'), 'testcontent')
-    fetchaddr = forwarders[0].linklayer.sock.getsockname()
+    fetchaddr = forwarders[topo.client].linklayer.sock.getsockname()
     fetch = Fetch(fetchaddr[0], fetchaddr[1], encoder=NdnTlvEncoder())
+    fabric = attach_link(link, [f.linklayer for f in forwarders] + [repo.linklayer])
+    shared = start_host(host, forwarders)
+    instrument(forwarders)
 
-    time, data = measure(fetch, repo, forwarders, n*ageing*3, random_startup_delay)
-    return n, ageing, time, data == 'testcontent'
+    if timeout is None:
+        timeout = (topo.route_distance() + 1) * ageing * 3
+    time, data, landed = measure(fetch, repo, forwarders, timeout, random_startup_delay, client_index=topo.client)
+    if sampler is not None:
+        sampler.stop()
+    if shared is not None:
+        shared.close()
+    if fabric is not None:
+        fabric.close()
+    return len(topo), ageing, time, data == 'testcontent', landed
 
 
-def depth_measurements(n: int, ageing: float, run: int, random_startup_delay: bool = False):
-    testname = f'depth{"_rand" if random_startup_delay else ""}'
-    measurements: List[Tuple[int, float, float, bool]] = []
-    print(f'{testname} n={n}, ageing interval={ageing}, run {run}')
-    measurements.append(measure_depth_scaling(n, ageing, random_startup_delay))
+def measure_depth_scaling(n: int, ageing: float, random_startup_delay: bool, link: str = 'udp',
+                          host: str = 'process') -> Tuple[int, float, float, bool, List[Optional[float]]]:
+    return measure_topology_scaling(topology.chain(n), ageing, random_startup_delay, link, timeout=n*ageing*3,
+                                    host=host)
+
+
+def write_result(testname: str, row: str):
+    """Append a result row to the CSV file of a test case."""
     os.makedirs('raw', exist_ok=True)
     filename = f'raw/{now}_{testname}.csv'
     with open(filename, 'a') as f:
-        for i, a, t, ok in measurements:
-            f.write(f'{i},{a},{t},{"ok" if ok else "fail"}\n')
+        f.write(f'{row}\n')
+    results_written.append((filename, row))
+    if results_conn is not None:
+        results_conn.send(('written', (filename, row)))
     print(f'Wrote data to file {filename}')
 
 
-def measure_breadth_scaling(n: int, ageing: float, random_startup_delay: bool) -> Tuple[int, float, float, bool]:
-    forwarders: List[ICNForwarder] = []
-    for i in range(n):
-        forwarders.append(ICNForwarder(0, encoder=NdnTlvEncoder(), routing=True))
-    forwarders.append(ICNForwarder(0, encoder=NdnTlvEncoder(), routing=True))
-    forwarders.append(ICNForwarder(0, encoder=NdnTlvEncoder(), routing=True))
+def write_landed(testname: str, measurements: List[Tuple[int, float, float, bool, List[Optional[float]]]], run: int):
+    """Write the per-forwarder route landing times and the time of the first data delivery."""
+    filename = f'raw/{now}_{testname}_hops.csv'
+    with open(filename, 'a') as f:
+        for i, a, t, ok, landed in measurements:
+            for hop, l in enumerate(landed):
+                f.write(f'{i},{a},{run},{hop},{l if l is not None else ""}\n')
+            f.write(f'{i},{a},{run},data,{t if ok else ""}\n')
+    print(f'Wrote data to file {filename}')
+
+
+def store_convergence_events(testname: str,
+                             measurements: List[Tuple[int, float, float, bool, List[Optional[float]]]], run: int,
+                             spec: str = None):
+    store = ResultStore(f'raw/{now}_{testname}', 'scaling')
+    nan = float('nan')
+    for i, a, t, ok, landed in measurements:
+        params = {'n': i, 'interval': a, 'run': run}
+        if spec is not None:
+            params['topology'] = spec
+        run_id = store.new_run(params, {'time': t, 'ok': ok})
+        rows = [(run_id, hop, l if l is not None else nan) for hop, l in enumerate(landed)]
+        rows.append((run_id, -1, t if ok else nan))
+        store.append('convergence', rows)
+
+
+def depth_measurements(n: int, ageing: float, run: int, random_startup_delay: bool = False, link: str = 'udp',
+                       host: str = 'process'):
+    testname = f'depth{"_rand" if random_startup_delay else ""}{variant(link, host)}'
+    measurements: List[Tuple[int, float, float, bool, List[Optional[float]]]] = []
+    print(f'{testname} n={n}, ageing interval={ageing}, run {run}')
+    measurements.append(measure_depth_scaling(n, ageing, random_startup_delay, link, host))
+    for i, a, t, ok, _ in measurements:
+        write_result(testname, f'{i},{a},{t},{"ok" if ok else "fail"}')
+    write_landed(testname, measurements, run)
+    store_convergence_events(testname, measurements, run)
+    write_samples(testname, list(measurements[0][:2]), run)
+
+
+def measure_breadth_scaling(n: int, ageing: float, random_startup_delay: bool, link: str = 'udp',
+                            host: str = 'process') -> Tuple[int, float, float, bool, List[Optional[float]]]:
+    _, _, time, ok, landed = measure_topology_scaling(topology.breadth(n), ageing, random_startup_delay, link,
+                                                      timeout=n*ageing*3, host=host)
+    return n, ageing, time, ok, landed
+
+
+def breadth_measurements(n: int, ageing: float, run: int, random_startup_delay: bool = False, link: str = 'udp',
+                         host: str = 'process'):
+    testname = f'breadth{"_rand" if random_startup_delay else ""}{variant(link, host)}'
+    measurements: List[Tuple[int, float, float, bool, List[Optional[float]]]] = []
+    print(f'{testname} n={n}, ageing interval={ageing}, run {run}')
+    measurements.append(measure_breadth_scaling(n, ageing, random_startup_delay, link, host))
+    for i, a, t, ok, _ in measurements:
+        write_result(testname, f'{i},{a},{t},{"ok" if ok else "fail"}')
+    write_landed(testname, measurements, run)
+    store_convergence_events(testname, measurements, run)
+    write_samples(testname, list(measurements[0][:2]), run)
+
+
+def topology_measurements(spec: str, ageing: float, run: int, random_startup_delay: bool = False, link: str = 'udp',
+                          host: str = 'process'):
+    topo = topology.parse(spec)
+    testname = f'topology_{topo.name}{"_rand" if random_startup_delay else ""}{variant(link, host)}'
+    measurements: List[Tuple[int, float, float, bool, List[Optional[float]]]] = []
+    print(f'{testname} {spec} ({len(topo)} forwarders), ageing interval={ageing}, run {run}')
+    measurements.append(measure_topology_scaling(topo, ageing, random_startup_delay, link, host=host))
+    for i, a, t, ok, _ in measurements:
+        write_result(testname, f'{i},{a},{t},{"ok" if ok else "fail"}')
+    write_landed(testname, measurements, run)
+    store_convergence_events(testname, measurements, run, spec)
+    write_samples(testname, list(measurements[0][:2]), run)
+
+
+def measure_routing_overhead(topo: topology.Topology, ageing: float, prefixes: int, window: float, link: str = 'udp',
+                             host: str = 'process') -> Tuple[int, float, int, float, float, float, bool]:
+    """
+    Measure the cost of the routing protocol in a converged topology.  The repo forwarder advertises `prefixes`
+    routes to the same repository; once the last of them has landed in every FIB, the routing traffic and CPU time
+    of all forwarders are counted for `window` seconds.  There is no interest traffic, so every packet sent is a
+    routing message.  Returns the number of forwarders, the routing interval, the number of prefixes, the routing
+    messages and bytes per second (all forwarders together), the mean CPU utilisation of a forwarder, and whether
+    the topology converged.
+    """
+    forwarders: List[ICNForwarder] = build_forwarders(topo, ageing, host)
     repo = ICNDataRepository(None, Name('/picn/routing/testrepo'), port=0, encoder=NdnTlvEncoder())
-    for i in range(n):
-        forwarders[i].routinglayer._peers.append(forwarders[-1].linklayer.sock.getsockname())
-        forwarders[-2].routinglayer._peers.append(forwarders[i].linklayer.sock.getsockname())
+    names = [Name(f'/picn/routing/overhead/{i}') for i in range(prefixes)]
+    for name in names:
+        topology.attach_repo(forwarders[topo.repo], repo.linklayer.sock.getsockname(), name)
+    fabric = attach_link(link, [f.linklayer for f in forwarders] + [repo.linklayer])
+    shared = start_host(host, forwarders)
+    counters = instrument(forwarders, counters=True)
+
+    probe = ConvergenceProbe(forwarders, names[-1])
+    probe.start()
+    repo.start_repo()
     for f in forwarders:
-        f.routinglayer._ageing_interval = ageing
-    fid = forwarders[-1].linklayer.get_or_create_fid(repo.linklayer.sock.getsockname(), static=True)
-    rib: BaseRoutingInformationBase = forwarders[-1].data_structs['rib']
-    rib.insert(Name('/picn/routing/testrepo'), fid, 1)
-    forwarders[-1].data_structs['rib'] = rib
-    repo.repo.add_content(Name('/picn/routing/testrepo/testcontent'), 'testcontent')
-    fetchaddr = forwarders[-2].linklayer.sock.getsockname()
-    fetch = Fetch(fetchaddr[0], fetchaddr[1], encoder=NdnTlvEncoder())
+        f.start_forwarder()
+    deadline = monotonic() + (topo.route_distance() + 1) * ageing * 3
+    ok = all(probe.wait_landed(i, max(0.0, deadline - monotonic())) for i in range(len(forwarders)))
+    probe.stop()
+    # Let the other prefixes and the first ageing timers settle before counting.
+    sleep(ageing)
+    start = counters.totals()
+    start_time = monotonic()
+    sleep(window)
+    end = counters.totals()
+    duration = monotonic() - start_time
+    counters.stop()
+    repo.stop_repo()
+    for f in forwarders:
+        f.stop_forwarder()
+    if shared is not None:
+        shared.close()
+    if fabric is not None:
+        fabric.close()
+
+    sent = sum(e[1] - s[1] for s, e in zip(start, end))
+    sent_bytes = sum(e[4] - s[4] for s, e in zip(start, end))
+    cpu = sum(e[0] - s[0] for s, e in zip(start, end)) / len(forwarders) / duration
+    return len(topo), ageing, prefixes, sent / duration, sent_bytes / duration, cpu, ok
+
+
+def overhead_measurements(spec: str, ageing: float, prefixes: int, run: int, window: float = 10.0,
+                          link: str = 'udp', host: str = 'process'):
+    topo = topology.parse(spec)
+    testname = f'overhead_{topo.name}{variant(link, host)}'
+    print(f'{testname} {spec} ({len(topo)} forwarders), ageing interval={ageing}, prefixes={prefixes}, run {run}')
+    n, a, p, packets, nbytes, cpu, ok = measure_routing_overhead(topo, ageing, prefixes, window, link, host)
+    write_result(testname, f'{n},{a},{p},{packets},{nbytes},{cpu},{"ok" if ok else "fail"}')
+    write_samples(testname, [n, a, p], run)
+
+
+def measure_throughput(topo: topology.Topology, consumers: int, routing: bool, ageing: float, duration: float,
+                       window: int = 1, link: str = 'udp', host: str = 'process'
+                       ) -> Tuple[int, int, float, float, Optional[float], Optional[float], float, bool]:
+    """
+    Measure the interest throughput of a topology once routing has converged.  `consumers` clients, each with a
+    stack and face of its own, are connected to the client's forwarder and keep `window` interests outstanding for
+    `duration` seconds.  Every interest has a name of its own, so none of them is answered from a content store.
+    Without `routing`, the forwarders have no routing layer and static routes towards the repository.  Returns the
+    number of forwarders, the number of consumers, the interests sent and satisfied per second, the median and 99th
+    percentile latency, the fraction of interests not satisfied, and whether routing converged.
+    """
+    prefix = '/picn/routing/throughput'
+    if not routing:
+        topo.add_repo_routes(prefix)
+    forwarders: List[ICNForwarder] = build_forwarders(topo, ageing, host, routing=routing)
+    repo = ICNDataRepository(None, Name(prefix), port=0, encoder=NdnTlvEncoder())
+    topology.attach_repo(forwarders[topo.repo], repo.linklayer.sock.getsockname(), Name(prefix), static=not routing)
+    count = int(duration * MAX_CONSUMER_RATE)
+    for c in range(consumers):
+        for i in range(count):
+            repo.repo.add_content(Name(f'{prefix}/{c}/{i}'), f'{c} {i}')
+    clients = [UDP4LinkLayer(port=0) for _ in range(consumers)]
+    fabric = attach_link(link, [f.linklayer for f in forwarders] + [repo.linklayer] + clients)
+    shared = start_host(host, forwarders)
+    instrument(forwarders)
+
+    probe = ConvergenceProbe([forwarders[topo.client]], Name(prefix)) if routing else None
+    repo.start_repo()
+    for f in forwarders:
+        f.start_forwarder()
+    ok = True
+    if probe is not None:
+        probe.start()
+        ok = probe.wait_landed(0, (topo.route_distance() + 1) * ageing * 3)
+        probe.stop()
+
+    clientaddr = forwarders[topo.client].linklayer.sock.getsockname()
+    stacks: List[LayerStack] = []
+    generators: List[LoadGenerator] = []
+    collectors: List[ResponseCollector] = []
+    for c, linklayer in enumerate(clients):
+        fid = linklayer.create_new_fid(clientaddr, True)
+        stack = LayerStack([DurationTaggingLayer(), BasicChunkLayer(), BasicPacketEncodingLayer(NdnTlvEncoder()),
+                            linklayer])
+        if tracer is not None:
+            tracer.add(f'client{c}', stack)
+        stack.start_all()
+        collector = ResponseCollector(monotonic(), duration)
+        stacks.append(stack)
+        collectors.append(collector)
+        generators.append(LoadGenerator(stack, fid, lambda i, c=c: Name(f'{prefix}/{c}/{i}'), count,
+                                        lambda response, col=collector: col.on_response(response[1], response[2]),
+                                        mode='window', window=window, duration=duration,
+                                        on_sent=collector.on_sent))
+    for collector in collectors:
+        collector.start_time = monotonic()
+    for g in generators:
+        g.start()
+    for g in generators:
+        g.wait_sent()
+    # The throughput only counts the responses received within the window, not those of the drain below.
+    satisfied = sum(collector.histogram.count for collector in collectors)
+    elapsed = monotonic() - min(g.start_time for g in generators)
+    # Keep receiving the responses to the interests sent at the end of the window.
+    for g in generators:
+        g.stop(linger=1.0)
+    if any(g.sent >= count for g in generators):
+        print(f'Warning: a consumer sent all {count} interests before the end of the window, '
+              'the throughput is a lower bound')
+    for stack in stacks:
+        stack.stop_all()
+    repo.stop_repo()
+    for f in forwarders:
+        f.stop_forwarder()
+    if sampler is not None:
+        sampler.stop()
+    if shared is not None:
+        shared.close()
+    if fabric is not None:
+        fabric.close()
+
+    histogram = LatencyHistogram()
+    for collector in collectors:
+        histogram.merge(collector.histogram)
+    sent = sum(g.sent for g in generators)
+    loss = 1.0 - histogram.count / sent if sent > 0 else 1.0
+    return len(topo), consumers, sent / elapsed, satisfied / elapsed, histogram.percentile(50), \
+        histogram.percentile(99), loss, ok
+
+
+def throughput_measurements(spec: str, consumers: int, run: int, routing: bool = True, ageing: float = 1.0,
+                            duration: float = 10.0, window: int = 1, link: str = 'udp', host: str = 'process'):
+    topo = topology.parse(spec)
+    testname = f'throughput_{topo.name}{"" if routing else "_static"}{variant(link, host)}'
+    print(f'{testname} {spec} ({len(topo)} forwarders), consumers={consumers}, run {run}')
+    n, c, offered, throughput, p50, p99, loss, ok = measure_throughput(topo, consumers, routing, ageing, duration,
+                                                                       window, link, host)
+    write_result(testname, f'{n},{c},{offered},{throughput},{p50 if p50 is not None else ""},'
+                           f'{p99 if p99 is not None else ""},{loss},{"ok" if ok else "fail"}')
+    write_samples(testname, [n, c], run)
+
+
+def failure_testname(topo: topology.Topology, fail: str, link: str, host: str) -> str:
+    """Separate files per RIB mode, as the tree RIB (`shortest_only=False`) keeps the alternate paths."""
+    rib = '_treerib' if any(node.rib == 'tree' for node in topo.nodes) else ''
+    return f'failure_{topo.name}{rib}{"_face" if fail == "face" else ""}{variant(link, host)}'
+
+
+def measure_failure(topo: topology.Topology, ageing: float, fail: str, rate: float, window: float, link: str = 'udp',
+                    host: str = 'process') -> Tuple[int, float, float, float, float, int, int, bool,
+                                                    List[Tuple[int, float, float, int]]]:
+    """
+    Measure how routing recovers from a failure on the path of a steady interest flow.  Once the route has landed
+    in the client's forwarder and had time to reach it over the longer paths, too, a client sends interests at a
+    constant `rate`; after FAILURE_WARMUP seconds, the forwarder the client's route points to fails (`node`), or the
+    face between the two does (`face`), and the interests keep flowing for `window` seconds.  Returns the number of
+    forwarders, the routing interval, the time from the failure until the data plane recovered for good (the send
+    time of the first interest satisfied after the last one lost, 0 if none was lost), until the client's route no
+    longer pointed to the failed face, and until it pointed to another face (NaN if never), the interests lost and
+    sent after the failure, whether the failure could be injected, and the send time relative to the failure, round
+    trip time and status (as in results.SCHEMAS) of each interest.
+    """
+    prefix = '/picn/routing/testrepo'
+    nan = float('nan')
+    forwarders: List[ICNForwarder] = build_forwarders(topo, ageing, host)
+    repo = ICNDataRepository(None, Name(prefix), port=0, encoder=NdnTlvEncoder())
+    topology.attach_repo(forwarders[topo.repo], repo.linklayer.sock.getsockname(), Name(prefix))
+    count = int((FAILURE_WARMUP + window) * rate) + 1
+    for i in range(count):
+        repo.repo.add_content(Name(f'{prefix}/{i}'), f'content {i}')
+    linklayer = UDP4LinkLayer(port=0)
+    fabric = attach_link(link, [f.linklayer for f in forwarders] + [repo.linklayer, linklayer])
+    sockets = [FailingSocket(f.linklayer.sock) for f in forwarders]
+    for f, sock in zip(forwarders, sockets):
+        f.linklayer.sock = sock
+    shared = start_host(host, forwarders)
+    instrument(forwarders)
+
+    client = forwarders[topo.client]
+    probe = ConvergenceProbe([client], Name(prefix))
+    repo.start_repo()
+    for f in forwarders:
+        f.start_forwarder()
+    probe.start()
+    ok = probe.wait_landed(0, (topo.route_distance() + 1) * ageing * 3)
+    probe.stop()
+    # Let the routes over the longer paths arrive, too.
+    sleep((topo.route_distance() + 1) * ageing)
+    ports = [f.linklayer.sock.getsockname()[1] for f in forwarders]
+    peers = {client.linklayer.get_or_create_fid(forwarders[p].linklayer.sock.getsockname(), static=True): p
+             for p in topo.nodes[topo.client].peers}
+    target = next((peers[fid] for fid in probe.watch.faces(0) if fid in peers), None)
+    if ok and target is None:
+        print("Warning: the route of the client's forwarder doesn't point to one of its peers, nothing to fail")
+    ok = ok and target is not None
 
-    time, data = measure(fetch, repo, forwarders, n*ageing*3, random_startup_delay)
-    return n, ageing, time, data == 'testcontent'
+    events: List[Tuple[int, float, float, int]] = []
+    gap, withdrawal, alternate, lost, sent = nan, nan, nan, 0, 0
+    if ok:
+        send_times: List[float] = [nan] * count
+        rtts: List[float] = [nan] * count
+        status: List[int] = [0] * count
 
+        def on_sent(seq: int, t: float):
+            send_times[seq] = t
 
-def breadth_measurements(n: int, ageing: float, run: int, random_startup_delay: bool = False):
-    testname = f'breadth{"_rand" if random_startup_delay else ""}'
-    measurements: List[Tuple[int, float, float, bool]] = []
+        def on_response(response):
+            _, data, duration = response
+            if isinstance(data, Nack):
+                try:
+                    status[int(data.name.components[-1])] = 2
+                except (ValueError, IndexError):
+                    pass
+            # Content arriving after the tagging layer gave up on the interest counts as timed out.
+            if isinstance(data, Content) and data.content.startswith('content '):
+                i = int(data.content.split(' ', 1)[1])
+                status[i] = 1 if duration is not None else 3
+                if duration is not None:
+                    rtts[i] = duration
+
+        fid = linklayer.create_new_fid(client.linklayer.sock.getsockname(), True)
+        stack = LayerStack([DurationTaggingLayer(), BasicChunkLayer(), BasicPacketEncodingLayer(NdnTlvEncoder()),
+                            linklayer])
+        if tracer is not None:
+            tracer.add('client', stack)
+        stack.start_all()
+        generator = LoadGenerator(stack, fid, lambda i: Name(f'{prefix}/{i}'), count, on_response, mode='constant',
+                                  rate=rate, duration=FAILURE_WARMUP + window, on_sent=on_sent)
+        generator.start()
+        sleep(max(0.0, generator.start_time + FAILURE_WARMUP - monotonic()))
+        failed_at = monotonic()
+        if fail == 'node':
+            sockets[target].block_all()
+        else:
+            sockets[topo.client].block(ports[target])
+            sockets[target].block(ports[topo.client])
+        generator.stop(linger=1.0)
+        stack.stop_all()
+
+        # The route changes recorded since the failure
+        failed = [fid for fid, p in peers.items() if p == target]
+        history = probe.watch.history(0)
+        withdrawal, alternate = (t - failed_at if t is not None else nan for t in [
+            route_time(history, lambda faces: not any(f in failed for f in faces), failed_at),
+            route_time(history, lambda faces: any(f not in failed for f in faces), failed_at)])
+        after = [i for i in range(generator.sent) if send_times[i] >= failed_at]
+        lost_seqs = [i for i in after if status[i] != 1]
+        recovered = [i for i in after if status[i] == 1 and (len(lost_seqs) == 0 or i > lost_seqs[-1])]
+        if len(lost_seqs) == 0:
+            gap = 0.0
+        elif len(recovered) > 0:
+            gap = send_times[recovered[0]] - failed_at
+        lost, sent = len(lost_seqs), len(after)
+        events = [(i, send_times[i] - failed_at, rtts[i], status[i]) for i in range(generator.sent)]
+
+    repo.stop_repo()
+    for f in forwarders:
+        f.stop_forwarder()
+    if sampler is not None:
+        sampler.stop()
+    if shared is not None:
+        shared.close()
+    if fabric is not None:
+        fabric.close()
+    return len(topo), ageing, gap, withdrawal, alternate, lost, sent, ok, events
+
+
+def failure_measurements(spec: str, ageing: float, run: int, fail: str = 'node', rate: float = 50.0,
+                         window: float = None, link: str = 'udp', host: str = 'process'):
+    if fail not in FAILURES:
+        raise ValueError(f'Unknown failure: {fail}')
+    if window is None:
+        window = max(FAILURE_MIN_WINDOW, 10 * ageing)
+    topo = topology.parse(spec)
+    testname = failure_testname(topo, fail, link, host)
+    print(f'{testname} {spec} ({len(topo)} forwarders), ageing interval={ageing}, fail={fail}, run {run}')
+    n, a, gap, withdrawal, alternate, lost, sent, ok, events = measure_failure(topo, ageing, fail, rate, window,
+                                                                               link, host)
+    times = ','.join('' if math.isnan(t) else str(t) for t in (gap, withdrawal, alternate))
+    write_result(testname, f'{n},{a},{times},{lost},{sent},{"ok" if ok else "fail"}')
+    store = ResultStore(f'raw/{now}_{testname}', 'failure')
+    run_id = store.new_run({'topology': spec, 'interval': ageing, 'fail': fail, 'rate': rate, 'window': window,
+                            'run': run},
+                           {'gap': gap, 'withdrawal': withdrawal, 'alternate': alternate, 'lost': lost, 'sent': sent,
+                            'ok': ok})
+    store.append('interests', [(run_id,) + e for e in events])
+    write_samples(testname, [n, a], run)
+
+
+def simulate_measurements(scenario: str, n: int, ageing: float, run: int):
+    testname = f'{scenario}_sim'
     print(f'{testname} n={n}, ageing interval={ageing}, run {run}')
-    measurements.append(measure_breadth_scaling(n, ageing, random_startup_delay))
-    os.makedirs('raw', exist_ok=True)
-    filename = f'raw/{now}_{testname}.csv'
-    with open(filename, 'a') as f:
-        for i, a, t, ok in measurements:
-            f.write(f'{i},{a},{t},{"ok" if ok else "fail"}\n')
-    print(f'Wrote data to file {filename}')
+    t, ok = simulation.simulate_scenario(scenario, n, ageing)
+    write_result(testname, f'{n},{ageing},{t},{"ok" if ok else "fail"}')
+
+
+def validate_measurements(scenario: str, n: int, ageing: float, run: int):
+    testname = f'{scenario}_validate'
+    print(f'{testname} n={n}, ageing interval={ageing}, run {run}')
+    random_startup_delay = scenario.endswith('_rand')
+    if scenario.startswith('depth'):
+        _, _, real_t, real_ok, _ = measure_depth_scaling(n, ageing, random_startup_delay)
+    else:
+        _, _, real_t, real_ok, _ = measure_breadth_scaling(n, ageing, random_startup_delay)
+    sim_t, sim_ok = simulation.simulate_scenario(scenario, n, ageing)
+    write_result(testname, f'{n},{ageing},{real_t},{"ok" if real_ok else "fail"},{sim_t},{"ok" if sim_ok else "fail"}')
+
+
+def repo_hopping_testname(edge_traverse: bool, link: str, host: str, load: str, rate: float, window: int,
+                          topology_spec: str, mobility: str = 'respawn', backend: str = 'manager') -> str:
+    testname = f'repo_hopping{"_edge_traverse" if edge_traverse else ""}{variant(link, host)}'
+    if mobility != 'respawn':
+        testname += f'_{mobility}'
+    if backend != 'manager':
+        testname += f'_{backend}'
+    if topology_spec != REPO_HOPPING_TOPOLOGY:
+        topo = topology.parse(topology_spec)
+        testname += f'_{topo.name}{len(topo)}'
+    if load == 'window':
+        testname += f'_window{window}'
+    elif (load, rate) != ('constant', 10.0):
+        testname += f'_{load}{rate:g}'
+    return testname
+
 
-    
 def measure_repo_hopping(run: int, routing_interval: float, hopping_interval: float, lease_time: float,
-                         edge_traverse: bool = False):
-    testname = f'repo_hopping{"_edge_traverse" if edge_traverse else ""}'
+                         edge_traverse: bool = False, port_base: int = 9000, link: str = 'udp',
+                         load: str = 'constant', rate: float = 10.0, window: int = 1,
+                         topology_spec: str = REPO_HOPPING_TOPOLOGY, host: str = 'process', mobility: str = 'respawn',
+                         backend: str = 'manager'):
+    if mobility not in ['respawn', 'pool']:
+        raise ValueError(f'Unknown mobility: {mobility}')
+    if backend not in ['manager', 'shm']:
+        raise ValueError(f'Unknown backend: {backend}')
+    topo = topology.parse(topology_spec)
+    testname = repo_hopping_testname(edge_traverse, link, host, load, rate, window, topology_spec, mobility, backend)
     print(f'{testname} routing interval={routing_interval}, hopping interval={hopping_interval}, lease time=' +
           f'{lease_time}, run {run}')
-    global repo, lock, running
-    manager = multiprocessing.Manager()
+    global repo, dumpster, edge_index, lock, running, hop_timer, hop_times
+    # Reset the hopping state, as a sweep worker may have run another hopping test before this one.
+    repo = None
+    dumpster = list()
+    hop_times = list()
+    edge_index = -1
+    with lock:
+        running = True
+    manager = get_manager()
+    # The tree RIBs and the repository's content are kept in dicts of this manager: proxies to the manager's
+    # process, or with the shm backend, dicts in shared memory that every process reads directly.
+    structs = SharedMemoryManager(manager) if backend == 'shm' else manager
     autoconfig_edgeprefix: List[Tuple[Name, bool]] = [(Name('/edge'), False)]
-    nodes: Dict[int, ICNForwarder] = dict()
-    ports: Dict[int, Tuple[str, int]] = dict()
-    edgeports: List[int] = list()
-
-    # Initialize core nodes
-    for c in [00, 10, 20, 30]:
-        nodes[c] = ICNForwarder(9000 + c, encoder=NdnTlvEncoder(), routing=True, peers=[])
-        ports[c] = nodes[c].linklayer.sock.getsockname()
-    # Initialize edge nodes
-    for e in [11, 12, 13, 21, 22, 23, 31, 32, 33]:
-        nodes[e] = ICNForwarder(9000 + e, encoder=NdnTlvEncoder(), routing=True, peers=[], autoconfig=True)
-        ports[e] = nodes[e].linklayer.sock.getsockname()
-        edgeports.append(ports[e][1])
-
-    # Assign routing peers after the OS assigned UDP ports. Each node knows the nodes one layer "beneath" itself
-    # in above graph as its routing peers.
-    nodes[00].routinglayer._peers = [ports[10], ports[20], ports[30]]
-    nodes[10].routinglayer._peers = [ports[11], ports[12], ports[13]]
-    nodes[20].routinglayer._peers = [ports[21], ports[22], ports[23]]
-    nodes[30].routinglayer._peers = [ports[31], ports[32], ports[33]]
-
-    # Set up faces and static FIB of core00 node.
-    fid00to10: int = nodes[00].linklayer.get_or_create_fid(ports[10], static=True)
-    fid00to20: int = nodes[00].linklayer.get_or_create_fid(ports[20], static=True)
-    fid00to30: int = nodes[00].linklayer.get_or_create_fid(ports[30], static=True)
-    fib00: BaseForwardingInformationBase = nodes[00].data_structs['fib']
-    if edge_traverse:
-        fib00.add_fib_entry(Name('/edge'), fid00to10, static=True)
-        fib00.add_fib_entry(Name('/edge'), fid00to20, static=True)
-        fib00.add_fib_entry(Name('/edge'), fid00to30, static=True)
-    nodes[00].data_structs['fib'] = fib00
-    nodes[00].data_structs['rib'] = TreeRoutingInformationBase(manager, shortest_only=False)
-
-    # Set up faces and static FIB of core10 node.
-    fid10to11: int = nodes[10].linklayer.get_or_create_fid(ports[11], static=True)
-    fid10to12: int = nodes[10].linklayer.get_or_create_fid(ports[12], static=True)
-    fid10to13: int = nodes[10].linklayer.get_or_create_fid(ports[13], static=True)
-    fib10: BaseForwardingInformationBase = nodes[10].data_structs['fib']
-    if edge_traverse:
-        fib10.add_fib_entry(Name('/edge'), fid10to11, static=True)
-        fib10.add_fib_entry(Name('/edge'), fid10to12, static=True)
-        fib10.add_fib_entry(Name('/edge'), fid10to13, static=True)
-    nodes[10].data_structs['fib'] = fib10
-    nodes[10].data_structs['rib'] = TreeRoutingInformationBase(manager, shortest_only=False)
-
-    # Set up faces and static FIB of core20 node.
-    fid20to21: int = nodes[20].linklayer.get_or_create_fid(ports[21], static=True)
-    fid20to22: int = nodes[20].linklayer.get_or_create_fid(ports[22], static=True)
-    fid20to23: int = nodes[20].linklayer.get_or_create_fid(ports[23], static=True)
-    fib20: BaseForwardingInformationBase = nodes[20].data_structs['fib']
-    if edge_traverse:
-        fib20.add_fib_entry(Name('/edge'), fid20to21, static=True)
-        fib20.add_fib_entry(Name('/edge'), fid20to22, static=True)
-        fib20.add_fib_entry(Name('/edge'), fid20to23, static=True)
-    nodes[20].data_structs['fib'] = fib20
-    nodes[20].data_structs['rib'] = TreeRoutingInformationBase(manager, shortest_only=False)
-
-    # Set up faces and static FIB of core30 node.
-    fid30to31: int = nodes[30].linklayer.get_or_create_fid(ports[31], static=True)
-    fid30to32: int = nodes[30].linklayer.get_or_create_fid(ports[32], static=True)
-    fid30to33: int = nodes[30].linklayer.get_or_create_fid(ports[33], static=True)
-    fib30: BaseForwardingInformationBase = nodes[30].data_structs['fib']
-    if edge_traverse:
-        fib30.add_fib_entry(Name('/edge'), fid30to31, static=True)
-        fib30.add_fib_entry(Name('/edge'), fid30to32, static=True)
-        fib30.add_fib_entry(Name('/edge'), fid30to33, static=True)
-    nodes[30].data_structs['fib'] = fib30
-    nodes[30].data_structs['rib'] = TreeRoutingInformationBase(manager, shortest_only=False)
 
-    for node in [00, 10, 20, 30]:
-        nodes[node].routinglayer._ageing_interval = routing_interval
+    # Each node knows the nodes one layer "beneath" itself in above graph as its routing peers, with static faces.
+    # With edge traversal, each node additionally has FIB entries for /edge to all of these nodes.
+    if edge_traverse:
+        topo.add_edge_routes('/edge')
+    # Custom topologies may be larger than the port range of a sweep worker, their forwarders use OS assigned ports.
+    forwarders: List[ICNForwarder] = build_forwarders(
+        topo, routing_interval, host, structs, port_base=port_base if topology_spec == REPO_HOPPING_TOPOLOGY else None,
+        autoconfig=True, static_faces=True)
+    edgeports: List[int] = [forwarders[e].linklayer.sock.getsockname()[1] for e in topo.edges]
 
     # Set up network edge autoconfig.
-    for e in [11, 12, 13, 21, 22, 23, 31, 32, 33]:
-        nodes[e].autoconfiglayer._service_registration_prefixes = autoconfig_edgeprefix
-        nodes[e].routinglayer._ageing_interval = routing_interval
-        nodes[e].autoconfiglayer._service_registration_timeout = timedelta(seconds=lease_time)
-
-    forwarders = list(nodes.values())
-    random.shuffle(forwarders)
-    for n in forwarders:
+    for e in topo.edges:
+        forwarders[e].autoconfiglayer._service_registration_prefixes = autoconfig_edgeprefix
+        forwarders[e].autoconfiglayer._service_registration_timeout = timedelta(seconds=lease_time)
+
+    linklayer = UDP4LinkLayer(port=0)
+    # Repos are created while the test is running, so they stay on UDP.
+    fabric = attach_link(link, [f.linklayer for f in forwarders] + [linklayer])
+    shared = start_host(host, forwarders)
+    instrument(forwarders)
+    # With the repository pool, the handovers are seen in the FIB of the client's forwarder, the core of the tree.
+    watch = FibWatch([forwarders[topo.client]], Name('/edge/hoppingrepo')) if mobility == 'pool' else None
+    for n in random.sample(forwarders, len(forwarders)):
         n.start_forwarder()
         sleep(0.05)
 
-    imr = SimpleMemoryRepository(Name('/edge/hoppingrepo'), manager)
-    n = 600
+    imr = SimpleMemoryRepository(Name('/edge/hoppingrepo'), structs)
+    # One interest per content object during the 60 s window.  In closed loop mode, `rate` only sizes the content
+    # set, the interests are sent as fast as the window allows.
+    n = int(rate * 60)
     for i in range(n):
         imr.add_content(Name(f'/edge/hoppingrepo/{i}'), f'content {i}')
 
+    repos = itertools.count()
+
+    def new_repo(port: int) -> ICNDataRepository:
+        r = ICNDataRepository(None, Name('/hoppingrepo'), 0, encoder=NdnTlvEncoder(),
+                              autoconfig=True, autoconfig_routed=True)
+        r.repolayer._repository = imr
+        r.autoconfiglayer._broadcast_port = port
+        if tracer is not None:
+            tracer.add(f'repo{next(repos)}', r.lstack)
+        return r
+
     def repo_hop():
-        global repo, edge_index, lock, running
+        global repo, edge_index, lock, running, hop_timer
         if repo is not None:
             repo.linklayer.sock.close()
             dumpster.append(repo)
         with lock:
             if not running:
                 return
-        repo = ICNDataRepository(None, Name('/hoppingrepo'), 0, encoder=NdnTlvEncoder(),
-                                 autoconfig=True, autoconfig_routed=True)
-        repo.repolayer._repository = imr
         edge_index = (edge_index + 1) % len(edgeports)
-        repo.autoconfiglayer._broadcast_port = edgeports[edge_index]
+        repo = new_repo(edgeports[edge_index])
         repo.start_repo()
-        threading.Timer(hopping_interval, repo_hop).start()
+        hop_times.append(monotonic())
+        hop_timer = threading.Timer(hopping_interval, repo_hop)
+        hop_timer.start()
 
-    repo_hop()
+    pool: Optional[RepoPool] = None
+    if mobility == 'pool':
+        # The client's forwarder is the core of the tree; a handover is seen there once its route points to the
+        # peers towards the new edge.
+        core = forwarders[topo.client]
+        routed = []
+        for e in topo.edges:
+            fids = [core.linklayer.get_or_create_fid(forwarders[p].linklayer.sock.getsockname(), static=True)
+                    for p in topo.next_hops(topo.client, e)]
+            routed.append(lambda since, fids=fids: route_time(watch.history(0),
+                                                              lambda faces: any(f in fids for f in faces), since))
+        pool = RepoPool([new_repo(port) for port in edgeports], routed, hopping_interval)
+        pool.prestart()
+        pool.start()
+    else:
+        repo_hop()
 
-    class DurationTaggingLayer(LayerProcess):
-
-        def __init__(self):
-            super().__init__('DurationTaggingLayer')
-            self._names: Dict[Name, datetime] = dict()
-
-        def data_from_lower(self, to_lower: multiprocessing.Queue, to_higher: multiprocessing.Queue, data):
-            fid, packet = data
-            if packet.name in self._names:
-                to_higher.put([fid, packet, (datetime.utcnow() - self._names[packet.name]).total_seconds()])
-                del self._names[packet.name]
-            else:
-                to_higher.put([fid, packet, None])
-
-        def data_from_higher(self, to_lower: multiprocessing.Queue, to_higher: multiprocessing.Queue, data):
-            fid, packet = data
-            self._names[packet.name] = datetime.utcnow()
-            to_lower.put(data)
-
-    linklayer = UDP4LinkLayer(port=0)
-    fetch_fid = linklayer.create_new_fid(ports[00], True)
+    fetch_fid = linklayer.create_new_fid(forwarders[topo.client].linklayer.sock.getsockname(), True)
     fetch = LayerStack([
-        DurationTaggingLayer(),
+        # Content is timed for as long as the run lasts, so the aggregate row counts late content like it always did.
+        DurationTaggingLayer(timeout=60.0 + 1.0 / rate),
         BasicChunkLayer(),
         BasicPacketEncodingLayer(NdnTlvEncoder()),
         linklayer
     ])
-    end_time = datetime.utcnow()
-    fetch.start_all()
-    for i in range(n):
-        fetch.queue_from_higher.put([fetch_fid, Interest(Name(f'/edge/hoppingrepo/{i}'))])
-        end_time += timedelta(milliseconds=100)
-        delay = (end_time - datetime.utcnow()).total_seconds()
-        if delay > 0:
-            sleep(delay)
+    if tracer is not None:
+        tracer.add('client', fetch)
     satisfied_interests: Dict[int, bool] = dict()
     satisfied_interests_outoforder: Dict[int, bool] = dict()
-    maxreceived = -1
-    avgduration = 0
-    while not fetch.queue_to_higher.empty():
-        _, data, duration = fetch.queue_to_higher.get()
-        if isinstance(data, Content) and data.content.startswith('content '):
+    received = {'max': -1, 'duration': 0.0}
+    # Per-interest events: send time, round trip time and status as in results.SCHEMAS
+    send_times: List[float] = [float('nan')] * n
+    rtts: List[float] = [float('nan')] * n
+    status: List[int] = [0] * n
+
+    def on_sent(seq: int, t: float):
+        send_times[seq] = t
+        collector.on_sent(seq, t)
+
+    def on_response(response):
+        _, data, duration = response
+        collector.on_response(data, duration)
+        if isinstance(data, Nack):
+            try:
+                status[int(data.name.components[-1])] = 2
+            except (ValueError, IndexError):
+                pass
+        # Content arriving more than 4 s after its interest is reported as late, but still counts as satisfied.
+        if isinstance(data, Content) and data.content.startswith('content ') and duration is not None:
             _, i = data.content.split(' ', 1)
             i = int(i)
+            status[i] = 1 if duration <= collector.timeout else 3
+            rtts[i] = duration
             satisfied_interests_outoforder[i] = True
-            avgduration += duration
-            if i <= maxreceived:
-                continue
-            maxreceived = i
+            received['duration'] += duration
+            if i <= received['max']:
+                return
+            received['max'] = i
             satisfied_interests[i] = True
+
+    fetch.start_all()
+    collector = ResponseCollector(monotonic(), 60.0, timeout=4.0)
+    generator = LoadGenerator(fetch, fetch_fid, lambda i: Name(f'/edge/hoppingrepo/{i}'), n, on_response,
+                              mode=load, rate=rate, window=window, duration=60.0, on_sent=on_sent)
+    generator.start()
+    # Like the sending loop before, wait one more interval after the last interest.
+    generator.stop(linger=1.0 / rate)
+    if pool is not None:
+        pool.stop()
+        hop_times = pool.hops
+        if pool.reregistrations > 0:
+            print(f'Warning: {pool.reregistrations} repositories of the pool had to be registered again on their behalf')
+    n = generator.sent
+    avgduration = received['duration']
     success = len(satisfied_interests)
     success_outoforder = len(satisfied_interests_outoforder)
-    os.makedirs('raw', exist_ok=True)
-    filename = f'raw/{now}_{testname}.csv'
+    # The ratios are of the interests actually sent; if none could be sent, the run failed to satisfy any.
+    success_ratio = success / n if n > 0 else 0.0
+    success_outoforder_ratio = success_outoforder / n if n > 0 else 0.0
+    write_result(testname, f'{routing_interval},{hopping_interval},{lease_time},{success_ratio},'
+                           f'{success_outoforder_ratio},{avgduration / success if success > 0 else 0.0}')
+    params = f'{routing_interval},{hopping_interval},{lease_time},{run}'
+    filename = f'raw/{now}_{testname}_latency.csv'
+    with open(filename, 'a') as f:
+        percentiles = [collector.histogram.percentile(p) for p in [50, 90, 99, 99.9]]
+        f.write(f'{params},{",".join("" if p is None else str(p) for p in percentiles)},' +
+                f'{collector.histogram.max},{collector.timeouts},{collector.nacks},{collector.late}\n')
+    print(f'Wrote data to file {filename}')
+    filename = f'raw/{now}_{testname}_series.csv'
+    hop_buckets = collections.Counter(collector.bucket(t) for t in hop_times if t >= collector.start_time)
     with open(filename, 'a') as f:
-        f.write(f'{routing_interval},{hopping_interval},{lease_time},{success / n},{success_outoforder / n},{avgduration / success if success > 0 else 0.0}\n')
+        for b, (sent, satisfied) in enumerate(zip(collector.sent, collector.satisfied)):
+            f.write(f'{params},{b * collector.bucket_width},{sent},{satisfied},{hop_buckets[b]}\n')
     print(f'Wrote data to file {filename}')
+    store = ResultStore(f'raw/{now}_{testname}', 'repo_hopping')
+    run_id = store.new_run({'routing_interval': routing_interval, 'hopping_interval': hopping_interval,
+                            'lease_time': lease_time, 'run': run, 'load': load, 'rate': rate, 'window': window},
+                           {'success': success_ratio, 'success_outoforder': success_outoforder_ratio,
+                            'avgduration': avgduration / success if success > 0 else 0.0})
+    store.append('interests', [(run_id, i, send_times[i] - collector.start_time, rtts[i], status[i])
+                               for i in range(n)])
+    store.append('hops', [(run_id, t - collector.start_time) for t in hop_times])
+    if pool is not None:
+        handovers = [[t - collector.start_time for t in h[1:]] for h in pool.handovers]
+        store.append('handovers', [(run_id, i, int(h[0])) + tuple(t) for i, (h, t) in
+                                   enumerate(zip(pool.handovers, handovers))])
+        filename = f'raw/{now}_{testname}_handover.csv'
+        with open(filename, 'a') as f:
+            for i, (h, t) in enumerate(zip(pool.handovers, handovers)):
+                f.write(f'{params},{i},{int(h[0])},{",".join("" if math.isnan(x) else str(x) for x in t)}\n')
+        print(f'Wrote data to file {filename}')
+    print(f'Wrote events to {store.directory}')
+    write_samples(testname, [routing_interval, hopping_interval, lease_time], run, collector.start_time)
+    with lock:
+        running = False
+    if hop_timer is not None:
+        hop_timer.cancel()
     fetch.stop_all()
-    for f in nodes.values():
+    for f in forwarders:
         f.stop_forwarder()
     if repo is not None:
         repo.stop_repo()
     for r in dumpster:
         r.stop_repo()
-    with lock:
-        running = False
+    if shared is not None:
+        shared.close()
+    if fabric is not None:
+        fabric.close()
+    if structs is not manager:
+        structs.close()
+    if watch is not None:
+        watch.close()
+
+
+CASE_PARAMS: Dict[str, List[str]] = {
+    'depth': ['n', 'interval'],
+    'breadth': ['n', 'interval'],
+    'depth_rand': ['n', 'interval'],
+    'breadth_rand': ['n', 'interval'],
+    'repo_hopping': ['routing_interval', 'hopping_interval', 'lease_time'],
+    'repo_hopping_edge_traverse': ['routing_interval', 'hopping_interval', 'lease_time'],
+    'simulate': ['scenario', 'n', 'interval'],
+    'validate': ['scenario', 'n', 'interval'],
+    'topology': ['topology', 'interval'],
+    'topology_rand': ['topology', 'interval'],
+    'overhead': ['topology', 'interval', 'prefixes'],
+    'throughput': ['topology', 'consumers'],
+    'failure': ['topology', 'interval'],
+}
+
+# The result column estimated by the early stopping of the sweep, and whether the target width of its confidence
+# interval is absolute (success rates) rather than relative to the mean: the convergence time of the scaling cases,
+# the success rate of repo hopping, the routing packets of overhead, the throughput, and the route withdrawal time of
+# failure, which unlike the outage has a value even if there is no alternate path.
+STOP_METRICS: Dict[str, Tuple[int, bool]] = {
+    'depth': (2, False),
+    'breadth': (2, False),
+    'depth_rand': (2, False),
+    'breadth_rand': (2, False),
+    'topology': (2, False),
+    'topology_rand': (2, False),
+    'repo_hopping': (3, True),
+    'repo_hopping_edge_traverse': (3, True),
+    'overhead': (3, False),
+    'throughput': (3, False),
+    'failure': (3, False),
+}
+
+# Two-sided 97.5% quantiles of Student's t distribution for 1 to 30 degrees of freedom
+_T_975 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228, 2.201, 2.179, 2.160, 2.145, 2.131,
+          2.120, 2.110, 2.101, 2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+
+def case_options(params: List[str]) -> Dict[str, str]:
+    """Optional key=value parameters following the positional parameters of a case."""
+    options: Dict[str, str] = dict()
+    for p in params:
+        if '=' not in p:
+            raise ValueError(f'Expected key=value, got {p}')
+        key, value = p.split('=', 1)
+        options[key] = value
+    return options
+
+
+def run_case(case: str, run: int, params: List[str], port_base: int = 9000):
+    global sample_interval, trace_records, host_threads
+    options = case_options(params[len(CASE_PARAMS[case]):])
+    link = options.get('link', 'udp')
+    host = options.get('host', 'process')
+    host_threads = int(options.get('threads', '1'))
+    sample_interval = float(options['sample']) if 'sample' in options else None
+    trace_records = int(options['trace']) if 'trace' in options else None
+    load = {
+        'load': options.get('load', 'constant'),
+        'rate': float(options.get('rate', '10.0')),
+        'window': int(options.get('window', '1')),
+        'topology_spec': options.get('topology', REPO_HOPPING_TOPOLOGY),
+        'mobility': options.get('mobility', 'respawn'),
+        'backend': options.get('backend', 'manager'),
+    }
+    if case == 'depth':
+        depth_measurements(int(params[0]), float(params[1]), run, link=link, host=host)
+    elif case == 'breadth':
+        breadth_measurements(int(params[0]), float(params[1]), run, link=link, host=host)
+    elif case == 'depth_rand':
+        depth_measurements(int(params[0]), float(params[1]), run, random_startup_delay=True, link=link, host=host)
+    elif case == 'breadth_rand':
+        breadth_measurements(int(params[0]), float(params[1]), run, random_startup_delay=True, link=link, host=host)
+    elif case == 'repo_hopping':
+        measure_repo_hopping(run, float(params[0]), float(params[1]), float(params[2]), port_base=port_base,
+                             link=link, host=host, **load)
+    elif case == 'repo_hopping_edge_traverse':
+        measure_repo_hopping(run, float(params[0]), float(params[1]), float(params[2]), edge_traverse=True,
+                             port_base=port_base, link=link, host=host, **load)
+    elif case == 'simulate':
+        simulate_measurements(params[0], int(params[1]), float(params[2]), run)
+    elif case == 'validate':
+        validate_measurements(params[0], int(params[1]), float(params[2]), run)
+    elif case == 'topology':
+        topology_measurements(params[0], float(params[1]), run, link=link, host=host)
+    elif case == 'topology_rand':
+        topology_measurements(params[0], float(params[1]), run, random_startup_delay=True, link=link, host=host)
+    elif case == 'overhead':
+        overhead_measurements(params[0], float(params[1]), int(params[2]), run,
+                              window=float(options.get('duration', '10.0')), link=link, host=host)
+    elif case == 'throughput':
+        throughput_measurements(params[0], int(params[1]), run, routing=options.get('routing', 'on') != 'off',
+                                ageing=float(options.get('interval', '1.0')),
+                                duration=float(options.get('duration', '10.0')), window=load['window'], link=link,
+                                host=host)
+    elif case == 'failure':
+        failure_measurements(params[0], float(params[1]), run, fail=options.get('fail', 'node'),
+                             rate=float(options.get('rate', '50.0')),
+                             window=float(options['duration']) if 'duration' in options else None, link=link,
+                             host=host)
+
+
+def timeout_row(case: str, params: List[str], elapsed: float) -> Optional[Tuple[str, str]]:
+    """
+    The testname and the `fail` row recorded for a run that was killed after `elapsed` seconds, in the format of the
+    case's result CSV, or None for the cases that aren't part of the sweep.
+    """
+    global host_threads
+    options = case_options(params[len(CASE_PARAMS[case]):])
+    # As run_case() would have set it, for the testnames
+    host_threads = int(options.get('threads', '1'))
+    v = variant(options.get('link', 'udp'), options.get('host', 'process'))
+    if case in ['depth', 'breadth', 'depth_rand', 'breadth_rand']:
+        return f'{case}{v}', f'{int(params[0])},{float(params[1])},{elapsed},fail'
+    if case in ['topology', 'topology_rand']:
+        topo = topology.parse(params[0])
+        return f'topology_{topo.name}{"_rand" if case == "topology_rand" else ""}{v}', \
+            f'{len(topo)},{float(params[1])},{elapsed},fail'
+    if case in ['repo_hopping', 'repo_hopping_edge_traverse']:
+        testname = repo_hopping_testname(case == 'repo_hopping_edge_traverse', options.get('link', 'udp'),
+                                         options.get('host', 'process'), options.get('load', 'constant'),
+                                         float(options.get('rate', '10.0')), int(options.get('window', '1')),
+                                         options.get('topology', REPO_HOPPING_TOPOLOGY),
+                                         options.get('mobility', 'respawn'), options.get('backend', 'manager'))
+        # Nothing was satisfied, written like measure_repo_hopping() writes the average duration of no content.
+        return testname, f'{float(params[0])},{float(params[1])},{float(params[2])},0.0,0.0,0.0'
+    if case == 'overhead':
+        topo = topology.parse(params[0])
+        return f'overhead_{topo.name}{v}', f'{len(topo)},{float(params[1])},{int(params[2])},,,,fail'
+    if case == 'throughput':
+        topo = topology.parse(params[0])
+        static = '_static' if options.get('routing', 'on') == 'off' else ''
+        return f'throughput_{topo.name}{static}{v}', f'{len(topo)},{int(params[1])},,,,,,fail'
+    if case == 'failure':
+        topo = topology.parse(params[0])
+        testname = failure_testname(topo, options.get('fail', 'node'), options.get('link', 'udp'),
+                                    options.get('host', 'process'))
+        return testname, f'{len(topo)},{float(params[1])},,,,,,fail'
+    return None
+
+
+# The cases a sweep runs unless --cases is given, i.e. the nightly grid of run.sh.  The grids of the other cases are
+# only run when asked for.
+SWEEP_CASES = ['depth', 'breadth', 'depth_rand', 'breadth_rand', 'repo_hopping', 'repo_hopping_edge_traverse']
+
+
+def sweep_grid(runs: int) -> List[Tuple[str, int, List[str], float]]:
+    """
+    The parameter grid of all cases a sweep can run, as (case, run, params, timeout) tuples.  The timeouts of the
+    SWEEP_CASES are the same as the ones run.sh passed to timeout(1).
+    """
+    grid: List[Tuple[str, int, List[str], float]] = []
+    for case in ['depth', 'breadth', 'depth_rand', 'breadth_rand']:
+        for n in range(1, 11):
+            for interval in [0.5, 1.0, 2.0]:
+                for run in range(1, runs + 1):
+                    grid.append((case, run, [str(n), str(interval)], 5.0 + 10 * n))
+    for case in ['repo_hopping', 'repo_hopping_edge_traverse']:
+        for routing_interval in [0.1, 1.0, 2.0]:
+            for hopping_interval in [5.0, 10.0, 20.0]:
+                for lease_factor in [0.5, 0.9, 1.0, 1.1, 2.0]:
+                    # Round like bc does in run.sh, so the lease times in the CSV stay e.g. 5.5 instead of 5.500000001
+                    lease_time = round(hopping_interval * lease_factor, 2)
+                    for run in range(1, runs + 1):
+                        grid.append((case, run, [str(routing_interval), str(hopping_interval), str(lease_time)],
+                                     70.0))
+    for n in [2, 5, 10]:
+        for interval in [0.5, 1.0, 2.0]:
+            for prefixes in [1, 10, 100]:
+                for run in range(1, runs + 1):
+                    grid.append(('overhead', run, [f'chain:n={n}', str(interval), str(prefixes)],
+                                 15.0 + (n + 1) * interval * 3))
+    for spec in ['chain:n=1', 'chain:n=3', 'chain:n=5', 'breadth:n=2', 'breadth:n=4']:
+        for consumers in [1, 4, 16]:
+            for routing in ['on', 'off']:
+                for run in range(1, runs + 1):
+                    grid.append(('throughput', run, [spec, str(consumers), f'routing={routing}'],
+                                 30.0 + (topology.parse(spec).route_distance() + 1) * 3))
+    for spec in ['chain:n=3', 'breadth:n=3', 'breadth:n=3,rib=tree', REPO_HOPPING_TOPOLOGY]:
+        for interval in [0.5, 1.0, 2.0]:
+            for fail in FAILURES:
+                for run in range(1, runs + 1):
+                    grid.append(('failure', run, [spec, str(interval), f'fail={fail}'],
+                                 30.0 + (topology.parse(spec).route_distance() + 1) * interval * 4 +
+                                 max(FAILURE_MIN_WINDOW, 10 * interval)))
+    return grid
+
+
+def expected_duration(job: Tuple[str, int, List[str], float]) -> float:
+    """
+    Expected wall time of a run: the convergence timeout of measure() for the scaling cases, and the 60 s interest
+    window plus forwarder startup for repo hopping.
+    """
+    case, _, params, _ = job
+    if case.startswith('repo_hopping'):
+        return 60.0 + 13 * 0.05
+    if case.startswith('topology'):
+        return (topology.parse(params[0]).route_distance() + 1) * float(params[1]) * 3
+    if case == 'throughput':
+        # Convergence at the default interval of 1 s, and the measurement window
+        return topology.parse(params[0]).route_distance() + 10.0
+    if case == 'overhead':
+        # Convergence of the advertisements, one interval to settle, and the measurement window
+        return topology.parse(params[0]).route_distance() * float(params[1]) + float(params[1]) + 10.0
+    if case == 'failure':
+        # Convergence, the time the longer paths are given, and the interests before and after the failure
+        ageing = float(params[1])
+        window = float(case_options(params[2:]).get('duration', max(FAILURE_MIN_WINDOW, 10 * ageing)))
+        return (topology.parse(params[0]).route_distance() + 1) * ageing * 2 + FAILURE_WARMUP + window
+    return int(params[0]) * float(params[1]) * 3
+
+
+class CpuMonitor(object):
+    """Host-wide CPU utilisation between two calls to utilisation(), read from /proc/stat."""
+
+    def __init__(self):
+        self._last = self._read()
+
+    @staticmethod
+    def _read() -> Tuple[int, int]:
+        try:
+            with open('/proc/stat', 'r') as f:
+                fields = [int(x) for x in f.readline().split()[1:]]
+        except OSError:
+            return 0, 0
+        # idle + iowait
+        return sum(fields), fields[3] + fields[4]
+
+    def utilisation(self) -> float:
+        total, idle = self._read()
+        last_total, last_idle = self._last
+        self._last = total, idle
+        if total <= last_total:
+            # No /proc/stat, fall back to the load average.
+            return os.getloadavg()[0] / os.cpu_count()
+        return 1.0 - (idle - last_idle) / (total - last_total)
+
+
+def _reap_children():
+    # Forwarders, repos and their managers are children of the worker. Anything a run left behind would otherwise
+    # accumulate over the lifetime of the worker, except for the manager that is intentionally kept warm.
+    warm = getattr(_manager, '_process', None)
+    for p in multiprocessing.active_children():
+        if p is warm:
+            continue
+        p.terminate()
+        p.join(1)
+
+
+def _sweep_worker(conn: multiprocessing.connection.Connection):
+    global results_conn
+    # Become a process group leader, so the whole tree of forwarder processes can be killed on a hang.
+    os.setpgrp()
+    results_conn = conn
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        case, run, params, port_base = job
+        start = monotonic()
+        status = 'done'
+        del results_written[:]
+        try:
+            run_case(case, run, params, port_base)
+        except Exception:
+            traceback.print_exc()
+            status = 'crashed'
+        _reap_children()
+        sys.stdout.flush()
+        conn.send((status, monotonic() - start, list(results_written)))
+    conn.close()
+
+
+class SweepWorker(object):
+    """
+    A long-lived process executing one run at a time, with PiCN imported and the manager already started.  Each
+    worker slot owns a disjoint range of PORT_RANGE fixed UDP ports, so concurrent repo hopping runs don't collide.
+    """
+
+    PORT_RANGE = 100
+    # Below the Linux ephemeral port range, so sockets bound to port 0 never take a port from a slot's range.
+    PORT_BASE = 10000
+
+    def __init__(self, slot: int):
+        self.slot = slot
+        self.port_base = SweepWorker.PORT_BASE + slot * SweepWorker.PORT_RANGE
+        self.conn, child_conn = multiprocessing.Pipe()
+        # Not daemonic, as daemonic processes must not start the forwarder processes.
+        self.process = multiprocessing.Process(target=_sweep_worker, args=(child_conn,))
+        self.process.start()
+        child_conn.close()
+        self.job: Tuple[str, int, List[str], float] = None
+        self.started: float = 0.0
+        self.deadline: float = 0.0
+        # Number of the attempt at the current job
+        self.attempt = 0
+        # Result rows the current job reported so far, also if it later crashes or hangs
+        self.results: List[Tuple[str, str]] = []
+
+    def submit(self, job: Tuple[str, int, List[str], float], attempt: int = 1):
+        case, run, params, timeout = job
+        self.job = job
+        self.attempt = attempt
+        self.results = []
+        self.started = monotonic()
+        self.deadline = self.started + timeout
+        self.conn.send((case, run, params, self.port_base))
+
+    def kill(self, grace: float = 5.0):
+        """Kill the worker and everything it started, like timeout -k does in run.sh."""
+        for sig in [signal.SIGTERM, signal.SIGKILL]:
+            try:
+                os.killpg(self.process.pid, sig)
+            except ProcessLookupError:
+                break
+            self.process.join(grace)
+            if not self.process.is_alive():
+                break
+        self.process.join()
+        self.conn.close()
+        # A killed run never closes its shared memory dicts.
+        unlink_dicts(self.process.pid)
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, EOFError):
+            pass
+        self.process.join()
+        self.conn.close()
+        unlink_dicts(self.process.pid)
+
+
+class EarlyStopping(object):
+    """
+    Sequential sampling of the runs of each parameter point (a case and its parameters): once a point has `min_runs`
+    results, it is only repeated until the 95% confidence interval of the mean of its STOP_METRICS column is at most
+    `width` wide, relative to the mean, or absolute for success rates.  Runs whose result column is empty (e.g.
+    failed throughput runs) or whose row is marked `fail` (e.g. scaling runs that were killed, with the time until
+    then) don't count towards the results of a point, as the plots drop them as well.
+    """
+
+    def __init__(self, min_runs: int, width: float):
+        self.min_runs = min_runs
+        self.width = width
+        self.values: Dict[Tuple[str, str], List[float]] = dict()
+
+    @staticmethod
+    def point(job: Tuple[str, int, List[str], float]) -> Tuple[str, str]:
+        case, _, params, _ = job
+        return case, ' '.join(params)
+
+    def observe(self, job: Tuple[str, int, List[str], float], results: List[Tuple[str, str]]):
+        """Record the result rows written by a finished run."""
+        values = self.values.setdefault(self.point(job), [])
+        if job[0] not in STOP_METRICS:
+            return
+        column, _ = STOP_METRICS[job[0]]
+        for _, row in results:
+            fields = row.split(',')
+            if fields[-1] == 'fail':
+                continue
+            try:
+                values.append(float(fields[column]))
+            except (IndexError, ValueError):
+                pass
+
+    def count(self, point: Tuple[str, str]) -> int:
+        return len(self.values.get(point, []))
+
+    def ci_width(self, point: Tuple[str, str]) -> float:
+        """Width of the 95% confidence interval of the mean, infinite with less than two results."""
+        values = self.values.get(point, [])
+        n = len(values)
+        if n < 2:
+            return float('inf')
+        mean = sum(values) / n
+        variance = sum((v - mean) ** 2 for v in values) / (n - 1)
+        t = _T_975[n - 2] if n - 1 <= len(_T_975) else 1.96
+        return 2 * t * (variance / n) ** 0.5
+
+    def converged(self, point: Tuple[str, str]) -> bool:
+        values = self.values.get(point, [])
+        if len(values) < max(2, self.min_runs) or point[0] not in STOP_METRICS:
+            return False
+        _, absolute = STOP_METRICS[point[0]]
+        scale = 1.0 if absolute else abs(sum(values) / len(values))
+        return self.ci_width(point) <= self.width * scale
+
+
+class SweepState(object):
+    """
+    The state of each planned run of a sweep (pending, running, done, timeout, crashed, or skipped by the early
+    stopping), the number of attempts, the duration of the last one and the result rows it wrote, in a SQLite
+    database next to the results.  Only the sweep's main process writes to it.  When a sweep with the same timestamp
+    is started again, runs that are done, failed for good or skipped are skipped, and runs that were going on when it
+    was interrupted are pending again, unless they had already written result rows.
+    """
+
+    def __init__(self, filename: str):
+        self.db = sqlite3.connect(filename)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS runs (
+            testcase TEXT NOT NULL,
+            params TEXT NOT NULL,
+            run INTEGER NOT NULL,
+            timeout REAL NOT NULL,
+            state TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            -- 1 once a failed run has used up its attempts, i.e. a timed out one has its fail row
+            final INTEGER NOT NULL DEFAULT 0,
+            duration REAL,
+            -- JSON list of [file, row] of the result rows written by the last attempt
+            results TEXT,
+            updated REAL,
+            PRIMARY KEY (testcase, params, run)
+        )''')
+        self.db.execute("UPDATE runs SET state = 'crashed', final = 1 WHERE state = 'running' AND results != '[]'")
+        self.db.execute("UPDATE runs SET state = 'pending' WHERE state = 'running'")
+        self.db.commit()
+
+    @staticmethod
+    def _key(job: Tuple[str, int, List[str], float]) -> Tuple[str, str, int]:
+        case, run, params, _ = job
+        return case, ' '.join(params), run
+
+    def plan(self, jobs: List[Tuple[str, int, List[str], float]], attempts: int
+             ) -> List[Tuple[Tuple[str, int, List[str], float], int]]:
+        """
+        Record the jobs that aren't planned yet.  Returns the jobs still to do, i.e. pending ones and failed ones with
+        attempts left, each with the number of attempts made so far.
+        """
+        self.db.executemany('INSERT OR IGNORE INTO runs (testcase, params, run, timeout) VALUES (?, ?, ?, ?)',
+                            [self._key(job) + (job[3],) for job in jobs])
+        self.db.commit()
+        rows = {(case, params, run): (state, tried, final, len(json.loads(results or '[]')) > 0)
+                for case, params, run, state, tried, final, results
+                in self.db.execute('SELECT testcase, params, run, state, attempts, final, results FROM runs')}
+        todo = []
+        for job in jobs:
+            state, tried, final, written = rows[self._key(job)]
+            # A run that timed out for good has its fail row; one that crashed may be retried with more attempts,
+            # unless it crashed after writing its result rows.
+            if state == 'pending' or (tried < attempts and not written and
+                                      (state == 'crashed' or (state == 'timeout' and not final))):
+                todo.append((job, tried))
+        return todo
+
+    def start(self, job: Tuple[str, int, List[str], float]):
+        self.db.execute("UPDATE runs SET state = 'running', attempts = attempts + 1, results = NULL, updated = ? "
+                        'WHERE testcase = ? AND params = ? AND run = ?', (time.time(),) + self._key(job))
+        self.db.commit()
+
+    def written(self, job: Tuple[str, int, List[str], float], results: List[Tuple[str, str]]):
+        """Record the result rows a run has written so far, before it finished."""
+        self.db.execute('UPDATE runs SET results = ?, updated = ? WHERE testcase = ? AND params = ? AND run = ?',
+                        (json.dumps(results), time.time()) + self._key(job))
+        self.db.commit()
+
+    def finish(self, job: Tuple[str, int, List[str], float], state: str, duration: Optional[float],
+               results: List[Tuple[str, str]], final: bool):
+        self.db.execute('UPDATE runs SET state = ?, duration = ?, results = ?, final = ?, updated = ? '
+                        'WHERE testcase = ? AND params = ? AND run = ?',
+                        (state, duration, json.dumps(results), int(final), time.time()) + self._key(job))
+        self.db.commit()
+
+    def skip(self, job: Tuple[str, int, List[str], float]):
+        self.db.execute("UPDATE runs SET state = 'skipped', final = 1, updated = ? "
+                        'WHERE testcase = ? AND params = ? AND run = ?', (time.time(),) + self._key(job))
+        self.db.commit()
+
+    def finished(self) -> List[Tuple[Tuple[str, int, List[str], float], List[Tuple[str, str]]]]:
+        """The runs that are done or failed for good, with the result rows they wrote."""
+        rows = self.db.execute("SELECT testcase, params, run, timeout, results FROM runs "
+                               "WHERE state = 'done' OR (final = 1 AND state != 'skipped')")
+        return [((case, run, params.split(' '), timeout), [tuple(r) for r in json.loads(results or '[]')])
+                for case, params, run, timeout, results in rows]
+
+    def summary(self) -> Dict[str, int]:
+        return dict(self.db.execute('SELECT state, COUNT(*) FROM runs GROUP BY state'))
+
+    def close(self):
+        self.db.close()
+
+
+def sweep(jobs: List[Tuple[str, int, List[str], float]], workers: int, headroom: float = 0.0,
+          settle: float = 1.0, state: SweepState = None, attempts: int = 1,
+          tried: Dict[Tuple[str, int, str], int] = None, stopping: EarlyStopping = None):
+    """
+    Run the jobs on up to `workers` cores.  Jobs are dispatched longest expected duration first, so the short runs
+    fill up the gaps at the end of the sweep.  A new run is only started while the host's CPU utilisation stays
+    below 1-headroom, and at most once per `settle` seconds, so the load of the previous run shows up in the
+    utilisation before the next decision.
+
+    A run that times out or crashes is queued again until it was attempted `attempts` times in total, counting the
+    attempts in `tried` (by case, run and parameters) made by earlier sweeps.  A run that times out for the last time
+    is recorded as a `fail` row in the result CSV of its case, so the statistics include it.  With a `state`, the
+    state of each run is tracked in the database.
+
+    With `stopping`, only the first min_runs runs of each parameter point are queued at first (just one if the point
+    already has that many results), and each run that is finished for good queues the next run of its point until
+    the point's confidence interval is narrow enough.  The remaining runs of a point are then skipped.
+    """
+    tried = dict(tried) if tried is not None else dict()
+    # Runs held back by the early stopping, in the order of their run number, and the number of queued or running
+    # runs, by parameter point
+    held: Dict[Tuple[str, str], collections.deque] = dict()
+    outstanding: Dict[Tuple[str, str], int] = collections.defaultdict(int)
+    if stopping is not None:
+        for job in sorted(jobs, key=lambda j: j[1]):
+            held.setdefault(stopping.point(job), collections.deque()).append(job)
+        jobs = []
+        for point, runs in held.items():
+            if stopping.converged(point):
+                # Converged in an earlier sweep
+                for job in runs:
+                    if state is not None:
+                        state.skip(job)
+                runs.clear()
+                continue
+            for _ in range(min(len(runs), max(1, stopping.min_runs - stopping.count(point)))):
+                jobs.append(runs.popleft())
+                outstanding[point] += 1
+    pending = collections.deque(sorted(jobs, key=expected_duration, reverse=True))
+    pool: List[SweepWorker] = [SweepWorker(slot) for slot in range(workers)]
+    cpu = CpuMonitor()
+    next_dispatch = 0.0
+
+    def submit(worker: SweepWorker, job: Tuple[str, int, List[str], float]):
+        case, run, params, _ = job
+        tried[case, run, ' '.join(params)] = tried.get((case, run, ' '.join(params)), 0) + 1
+        if state is not None:
+            state.start(job)
+        worker.submit(job, tried[case, run, ' '.join(params)])
+
+    def skip(point: Tuple[str, str]):
+        for job in held.pop(point, []):
+            if state is not None:
+                state.skip(job)
+
+    def finished(job: Tuple[str, int, List[str], float], results: List[Tuple[str, str]]):
+        if stopping is None:
+            return
+        point = stopping.point(job)
+        stopping.observe(job, results)
+        outstanding[point] -= 1
+        if stopping.converged(point):
+            if len(held.get(point, [])) > 0:
+                print(f'{point[0]} {point[1]}: converged after {stopping.count(point)} runs, '
+                      f'skipping {len(held[point])}')
+            skip(point)
+        elif len(held.get(point, [])) > 0 and (stopping.count(point) >= stopping.min_runs or outstanding[point] == 0):
+            # Before min_runs results, only replace runs that didn't yield one.  Keep the queue ordered by expected
+            # duration.
+            job = held[point].popleft()
+            outstanding[point] += 1
+            i = 0
+            while i < len(pending) and expected_duration(pending[i]) >= expected_duration(job):
+                i += 1
+            pending.insert(i, job)
+
+    while True:
+        idle = [w for w in pool if w.job is None]
+        if len(idle) > 0 and len(pending) > 0:
+            if len(idle) == len(pool):
+                submit(idle[0], pending.popleft())
+                next_dispatch = monotonic() + settle
+            elif monotonic() >= next_dispatch:
+                if cpu.utilisation() < 1.0 - headroom:
+                    submit(idle[0], pending.popleft())
+                next_dispatch = monotonic() + settle
+        busy = [w for w in pool if w.job is not None]
+        if len(busy) == 0:
+            break
+        wakeup = min([w.deadline for w in busy])
+        if len(busy) < len(pool) and len(pending) > 0:
+            wakeup = min(wakeup, next_dispatch)
+        timeout = max(0.0, wakeup - monotonic())
+        ready = multiprocessing.connection.wait([w.conn for w in busy], timeout)
+        for i, w in enumerate(pool):
+            if w.job is None:
+                continue
+            case, run, params, _ = w.job
+            results = w.results
+            duration = monotonic() - w.started
+            if w.conn in ready:
+                try:
+                    message = w.conn.recv()
+                except EOFError:
+                    message = ('crashed', duration, results)
+                if message[0] == 'written':
+                    w.results.append(message[1])
+                    if state is not None:
+                        state.written(w.job, w.results)
+                    continue
+                status, duration, results = message
+                if status == 'done':
+                    if state is not None:
+                        state.finish(w.job, 'done', duration, results, True)
+                    finished(w.job, results)
+                    w.job = None
+                    continue
+            elif monotonic() < w.deadline:
+                continue
+            else:
+                status = 'timeout'
+            print(f'{case} {" ".join(params)}, run {run}: {"Timeout" if status == "timeout" else "Crashed"}')
+            # A run that already wrote its result rows isn't repeated, that would write them twice.
+            final = w.attempt >= attempts or len(results) > 0
+            if status == 'timeout' and len(results) == 0 and final:
+                row = timeout_row(case, params, duration)
+                if row is not None:
+                    del results_written[:]
+                    write_result(*row)
+                    results = list(results_written)
+            if state is not None:
+                state.finish(w.job, status, duration, results, final)
+            if not final:
+                pending.append(w.job)
+            else:
+                finished(w.job, results)
+            w.kill()
+            pool[i] = SweepWorker(w.slot)
+    for w in pool:
+        w.close()
+
+
+def sweep_main(args: List[str]):
+    parser = argparse.ArgumentParser(prog=f'{sys.argv[0]} {now} sweep',
+                                     description='Run the whole parameter grid in a pool of long-lived workers.')
+    parser.add_argument('runs', type=int,
+                        help='number of runs per parameter point, or the maximum number with --min-runs')
+    parser.add_argument('--workers', type=int, default=1, help='number of runs executed concurrently')
+    parser.add_argument('--headroom', type=float, default=0.25,
+                        help='fraction of the CPU capacity to keep idle when starting concurrent runs')
+    parser.add_argument('--option', action='append', default=[], metavar='KEY=VALUE',
+                        help='option passed to every run, e.g. link=mem')
+    parser.add_argument('--cases', nargs='+', default=SWEEP_CASES, choices=list(CASE_PARAMS.keys()),
+                        help=f'test cases to include in the sweep (default: {" ".join(SWEEP_CASES)})')
+    parser.add_argument('--attempts', type=int, default=3,
+                        help='number of attempts at a run that times out or crashes, across restarts of the sweep')
+    parser.add_argument('--min-runs', type=int, default=None,
+                        help='stop repeating a parameter point after this many runs once its confidence interval is '
+                             'narrow enough (default: always do all runs)')
+    parser.add_argument('--ci-width', type=float, default=0.1,
+                        help='target width of the 95%% confidence interval of the mean with --min-runs, relative to '
+                             'the mean, or absolute for success rates')
+    opts = parser.parse_args(args)
+    jobs = [(c, r, p + opts.option, t) for c, r, p, t in sweep_grid(opts.runs) if c in opts.cases]
+    os.makedirs('raw', exist_ok=True)
+    state = SweepState(f'raw/{now}_sweep.sqlite')
+    todo = state.plan(jobs, opts.attempts)
+    print(f'{len(todo)} of {len(jobs)} runs to do, state: {state.summary()}')
+    tried = {(c, r, ' '.join(p)): n for (c, r, p, _), n in todo}
+    stopping = None
+    if opts.min_runs is not None:
+        stopping = EarlyStopping(opts.min_runs, opts.ci_width)
+        for job, results in state.finished():
+            stopping.observe(job, results)
+    sweep([job for job, _ in todo], opts.workers, opts.headroom, state=state, attempts=opts.attempts, tried=tried,
+          stopping=stopping)
+    print(f'Sweep finished, state: {state.summary()}')
+    state.close()
+
+
+def explore_main(args: List[str]):
+    parser = argparse.ArgumentParser(prog=f'{sys.argv[0]} {now} explore',
+                                     description='Search the hopping intervals at which the repo hopping success '
+                                                 'rate reaches the target rates.')
+    parser.add_argument('--case', default='repo_hopping', choices=['repo_hopping', 'repo_hopping_edge_traverse'])
+    parser.add_argument('--targets', type=float, nargs='+', default=[0.5, 0.9], help='target success rates')
+    parser.add_argument('--routing-intervals', type=float, nargs='+', default=[0.1, 1.0, 2.0])
+    parser.add_argument('--lease-factors', type=float, nargs='+', default=[0.5, 0.9, 1.0, 1.1, 2.0],
+                        help='lease times as fractions of the hopping interval')
+    parser.add_argument('--hopping-range', type=float, nargs=2, default=[2.5, 40.0], metavar=('LOW', 'HIGH'),
+                        help='range of hopping intervals searched')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='stop bisecting once the ends of a bracket are less than this fraction apart')
+    parser.add_argument('--runs', type=int, default=3, help='number of runs per sampled point')
+    parser.add_argument('--rounds', type=int, default=10, help='maximum number of bisection rounds')
+    parser.add_argument('--workers', type=int, default=1, help='number of runs executed concurrently')
+    parser.add_argument('--headroom', type=float, default=0.25,
+                        help='fraction of the CPU capacity to keep idle when starting concurrent runs')
+    parser.add_argument('--attempts', type=int, default=3, help='number of attempts at a run that times out or crashes')
+    parser.add_argument('--option', action='append', default=[], metavar='KEY=VALUE',
+                        help='option passed to every run, e.g. link=mem')
+    opts = parser.parse_args(args)
+    options = case_options(opts.option)
+    testname = repo_hopping_testname(opts.case == 'repo_hopping_edge_traverse', options.get('link', 'udp'),
+                                     options.get('host', 'process'), options.get('load', 'constant'),
+                                     float(options.get('rate', '10.0')), int(options.get('window', '1')),
+                                     options.get('topology', REPO_HOPPING_TOPOLOGY), options.get('mobility', 'respawn'),
+                                     options.get('backend', 'manager'))
+    search = boundary.BoundarySearch(opts.routing_intervals, opts.lease_factors, opts.targets, *opts.hopping_range,
+                                     tolerance=opts.tolerance)
+    os.makedirs('raw', exist_ok=True)
+    # The runs of the search go into the result CSV of the case, like the sweep's; the state is kept separately.
+    state = SweepState(f'raw/{now}_{testname}_explore.sqlite')
+    for i in range(opts.rounds + 1):
+        search.samples.clear()
+        sampled = set()
+        for (_, _, params, _), results in state.finished():
+            point = tuple(float(p) for p in params[:3])
+            sampled.add(point)
+            for _, row in results:
+                search.add(*point, float(row.split(',')[3]))
+        search.write(f'raw/{now}_{testname}_boundary.csv')
+        # Points whose runs all failed without a result aren't proposed again.
+        points = [p for p in search.proposals() if p not in sampled]
+        if len(points) == 0 or i == opts.rounds:
+            break
+        jobs = [(opts.case, run, [str(r), str(h), str(l)] + opts.option, 70.0)
+                for r, h, l in points for run in range(1, opts.runs + 1)]
+        todo = state.plan(jobs, opts.attempts)
+        print(f'Round {i + 1}: {len(points)} points, {len(todo)} runs to do')
+        tried = {(c, r, ' '.join(p)): n for (c, r, p, _), n in todo}
+        sweep([job for job, _ in todo], opts.workers, opts.headroom, state=state, attempts=opts.attempts, tried=tried)
+    print(f'Search finished, state: {state.summary()}')
+    state.close()
+
 
 def main():
     global now
+    if len(sys.argv) >= 3 and sys.argv[2] in ['sweep', 'explore']:
+        now = sys.argv[1]
+        if sys.argv[2] == 'sweep':
+            sweep_main(sys.argv[3:])
+        else:
+            explore_main(sys.argv[3:])
+        return
     if len(sys.argv) < 4:
-        print(f'Usage: {sys.argv[0]} <timestamp> <case> <run> [param1] ... [paramN]')
+        print(f'Usage: {sys.argv[0]} <timestamp> <case> <run> [param1] ... [paramN] [key=value] ...')
+        print(f'       {sys.argv[0]} <timestamp> sweep <runs> [options]')
+        print(f'       {sys.argv[0]} <timestamp> explore [options]')
         exit(1)
     now = sys.argv[1]
     case = sys.argv[2]
     run = int(sys.argv[3])
-    if case == 'depth':
-        if len(sys.argv) < 6:
-            print(f'Usage: {sys.argv[0]} {now} {case} {run} <n> <interval>')
-            exit(1)
-        n = int(sys.argv[4])
-        ageing_interval = float(sys.argv[5])
-        depth_measurements(n, ageing_interval, run)
-    elif case == 'breadth':
-        if len(sys.argv) < 6:
-            print(f'Usage: {sys.argv[0]} {now} {case} {run} <n> <interval>')
-            exit(1)
-        n = int(sys.argv[4])
-        ageing_interval = float(sys.argv[5])
-        breadth_measurements(n, ageing_interval, run)
-    elif case == 'depth_rand':
-        if len(sys.argv) < 6:
-            print(f'Usage: {sys.argv[0]} {now} {case} {run} <n> <interval>')
-            exit(1)
-        n = int(sys.argv[4])
-        ageing_interval = float(sys.argv[5])
-        depth_measurements(n, ageing_interval, run, random_startup_delay=True)
-    elif case == 'breadth_rand':
-        if len(sys.argv) < 6:
-            print(f'Usage: {sys.argv[0]} {now} {case} {run} <n> <interval>')
-            exit(1)
-        n = int(sys.argv[4])
-        ageing_interval = float(sys.argv[5])
-        breadth_measurements(n, ageing_interval, run, random_startup_delay=True)
-    elif case == 'repo_hopping':
-        if len(sys.argv) < 7:
-            print(f'Usage: {sys.argv[0]} {now} {case} {run} <routing_interval> <hopping_interval> <lease_time>')
-            exit(1)
-        routing_interval = float(sys.argv[4])
-        hopping_interval = float(sys.argv[5])
-        lease_time = float(sys.argv[6])
-        measure_repo_hopping(run, routing_interval, hopping_interval, lease_time)
-    elif case == 'repo_hopping_edge_traverse':
-        if len(sys.argv) < 7:
-            print(f'Usage: {sys.argv[0]} {now} {case} {run} <routing_interval> <hopping_interval> <lease_time>')
+    if case in CASE_PARAMS:
+        params = sys.argv[4:]
+        if len(params) < len(CASE_PARAMS[case]):
+            print(f'Usage: {sys.argv[0]} {now} {case} {run} {" ".join(f"<{p}>" for p in CASE_PARAMS[case])} '
+                  '[key=value] ...')
             exit(1)
-        routing_interval = float(sys.argv[4])
-        hopping_interval = float(sys.argv[5])
-        lease_time = float(sys.argv[6])
-        measure_repo_hopping(run, routing_interval, hopping_interval, lease_time, edge_traverse=True)
+        run_case(case, run, params)
 
 
 if __name__ == '__main__':
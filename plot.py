@@ -1,6 +1,12 @@
 
-from typing import Dict, List, Tuple
-
+from typing import Callable, Dict, List, Optional, Tuple
+
+import argparse
+import glob
+import hashlib
+import json
+import multiprocessing
+import pickle
 import sys
 import os
 
@@ -9,6 +15,35 @@ matplotlib.use('Agg')
 
 import matplotlib.pyplot as plt
 import matplotlib.lines
+import numpy as np
+
+import aggregate
+import results
+
+
+# Timestamps of the sweeps whose results are plotted together.  The plots are named after the first one.
+timestamps: List[str] = list()
+# Files written by the figure functions in this process, see savefig().
+saved: List[str] = list()
+
+MANIFEST = 'plots/.manifest.json'
+
+# A figure job: manifest key, figure function and its arguments
+Job = Tuple[str, Callable, tuple]
+
+# Result columns of the overhead test cases and their axis labels
+OVERHEAD_METRICS = [('packets', 'routing messages/s'), ('bytes', 'routing traffic [B/s]'),
+                    ('cpu', 'CPU utilisation per forwarder')]
+# Fraction of unsatisfied interests up to which a load counts as sustained
+LOSS_LIMIT = 0.01
+# Result columns of the failure test cases and their axis labels
+FAILURE_METRICS = [('gap', 'outage [s]'), ('withdrawal', 'route withdrawal [s]'),
+                   ('alternate', 'alternate path [s]'), ('lost', 'lost interests')]
+
+
+def savefig(filename: str):
+    plt.savefig(filename)
+    saved.append(filename)
 
 
 def scaling_boxplot(data: Dict[str, Dict[int, List[float]]], basename, ymax: float):
@@ -26,62 +61,88 @@ def scaling_boxplot(data: Dict[str, Dict[int, List[float]]], basename, ymax: flo
         plt.ylabel('time [s]')
         plt.ylim(ymin=0, ymax=ymax * 1.1)
         plt.title(f'interval = {interval}')
-        plt.savefig(basename.format(t=now, i=interval))
+        savefig(basename.format(t=now, i=interval))
         plt.close()
 
 
-def parse_scaling_csv(filename: str) -> Dict[str, Dict[int, List[float]]]:
-    with open(filename, 'r') as f:
-        raw = f.read()
-    lines = [l for l in raw.split('\n') if len(l) > 0]
+def load_results(testname: str, columns: int) -> np.ndarray:
+    """The rows of a test case's CSV files of all timestamps, parsed by (and cached in) results.load_csv()."""
+    arrays = [results.load_csv(f'raw/{t}_{testname}.csv', columns) for t in timestamps
+              if os.path.exists(f'raw/{t}_{testname}.csv')]
+    if len(arrays) == 0:
+        raise FileNotFoundError(f'No results for {testname}')
+    return np.concatenate(arrays)
+
+
+def param_key(value: float) -> str:
+    """The string a parameter was written to the CSV as."""
+    return repr(float(value))
+
+
+def load_scaling(testname: str) -> aggregate.Aggregation:
+    """The (n, interval, time) rows of the successful runs."""
+    rows = load_results(testname, 4)
+    return aggregate.Aggregation(rows[rows[:, 3] == 1][:, :3], aggregate.COLUMNS['scaling'][:3])
+
+
+def group_scaling(agg: aggregate.Aggregation) -> Dict[str, Dict[int, List[float]]]:
+    groups = agg.groupby('interval', 'n')
     data: Dict[str, Dict[int, List[float]]] = dict()
-    for l in lines:
-        n, interval, t, ok = l.split(',')
-        if ok != 'ok':
-            continue
-        n = int(n)
-        t = float(t)
-        if interval not in data:
-            data[interval] = dict()
-        if n not in data[interval]:
-            data[interval][n] = list()
-        data[interval][n].append(t)
+    for (interval, n), values in zip(groups.keys, groups.values('time')):
+        data.setdefault(param_key(interval), dict())[int(n)] = values.tolist()
     return data
 
 
-def plot_scaling():
-    depth_data = parse_scaling_csv(f'raw/{now}_depth.csv')
-    depth_rand_data = parse_scaling_csv(f'raw/{now}_depth_rand.csv')
-    depth_ymax = max(max([v for n in depth_data.values() for i in n.values() for v in i]),
-                     max([v for n in depth_rand_data.values() for i in n.values() for v in i]))
-    scaling_boxplot(depth_data, 'plots/{t}_depth_{i}.png', depth_ymax)
-    scaling_boxplot(depth_rand_data, 'plots/{t}_depth_rand_{i}.png', depth_ymax)
-
-    breadth_data = parse_scaling_csv(f'raw/{now}_breadth.csv')
-    breadth_rand_data = parse_scaling_csv(f'raw/{now}_breadth_rand.csv')
-    breadth_ymax = max(max([v for n in breadth_data.values() for i in n.values() for v in i]),
-                       max([v for n in breadth_rand_data.values() for i in n.values() for v in i]))
-    scaling_boxplot(breadth_data, 'plots/{t}_breadth_{i}.png', breadth_ymax)
-    scaling_boxplot(breadth_rand_data, 'plots/{t}_breadth_rand_{i}.png', breadth_ymax)
-
-
-def parse_hopping_csv(filename: str):
-    with open(filename, 'r') as f:
-        raw = f.read()
-    lines = [l for l in raw.split('\n') if len(l) > 0]
-    data: Dict[Tuple[str, str, str], Tuple[List[float], List[float], List[float]]] = dict()
-    for l in lines:
-        routing_interval, hopping_interval, lease_time, success, success_ooo, avgduration = l.split(',')
-        success = float(success)
-        success_ooo = float(success_ooo)
-        avgduration = float(avgduration)
-        key = (routing_interval, hopping_interval, lease_time)
-        if key not in data:
-            data[key] = list(), list(), list()
-        data[key][0].append(success)
-        data[key][1].append(success_ooo)
-        data[key][2].append(avgduration)
-    return data
+def parse_scaling_csv(testname: str) -> Dict[str, Dict[int, List[float]]]:
+    return group_scaling(load_scaling(testname))
+
+
+def summary_table(agg: aggregate.Aggregation, by: List[str], column: str, filename: str):
+    """Write the per group summary of a result column computed by aggregate.Groups.table()."""
+    header, rows = agg.groupby(*by).table(column)
+    aggregate.write_table(filename.format(t=now), header, rows)
+    saved.append(filename.format(t=now))
+
+
+def scaling_jobs(testname: str, agg: aggregate.Aggregation, ymax: float) -> List[Job]:
+    """One job per routing interval, so appending runs of one interval only redraws its figure."""
+    basename = f'plots/{{t}}_{testname}_{{i}}.png'
+    data = group_scaling(agg)
+    jobs: List[Job] = [(f'{testname}_{i}', scaling_boxplot, ({i: data[i]}, basename, ymax)) for i in data.keys()]
+    jobs.append((f'{testname}_summary', summary_table,
+                 (agg, ['interval', 'n'], 'time', f'plots/{{t}}_{testname}_summary.csv')))
+    return jobs
+
+
+def plot_scaling() -> List[Job]:
+    depth_data = load_scaling('depth')
+    depth_rand_data = load_scaling('depth_rand')
+    depth_ymax = max(depth_data.column('time').max(), depth_rand_data.column('time').max())
+    jobs = scaling_jobs('depth', depth_data, depth_ymax)
+    jobs += scaling_jobs('depth_rand', depth_rand_data, depth_ymax)
+
+    breadth_data = load_scaling('breadth')
+    breadth_rand_data = load_scaling('breadth_rand')
+    breadth_ymax = max(breadth_data.column('time').max(), breadth_rand_data.column('time').max())
+    jobs += scaling_jobs('breadth', breadth_data, breadth_ymax)
+    jobs += scaling_jobs('breadth_rand', breadth_rand_data, breadth_ymax)
+    return jobs
+
+
+def load_hopping(testname: str) -> aggregate.Aggregation:
+    return aggregate.Aggregation(load_results(testname, 6), aggregate.COLUMNS['repo_hopping'])
+
+
+def load_boundary(testname: str) -> Optional[np.ndarray]:
+    """
+    The success boundary found by the adaptive search (`explore`) of the last timestamp that has one: (routing
+    interval, lease factor, target, hopping interval, bracket low, bracket high) rows, None if there is none.
+    """
+    for t in reversed(timestamps):
+        filename = f'raw/{t}_{testname}_boundary.csv'
+        if os.path.exists(filename):
+            return np.genfromtxt(filename, delimiter=',', ndmin=2)
+    return None
 
 
 def mkcolor(val: float, low: str, high: str) -> str:
@@ -94,32 +155,16 @@ def mkcolor(val: float, low: str, high: str) -> str:
     return result
 
 
-def hopping_plot_single_vars(data: Dict[Tuple[str, str, str], Tuple[List[float], List[float], List[float]]],
-                             basename: str, duration_ymax: float):
-    routing_intervals = sorted(list(set([k[0] for k in data.keys()])), key=lambda x: float(x))
-    hopping_intervals = sorted(list(set([k[1] for k in data.keys()])), key=lambda x: float(x))
-    lease_timeouts = sorted(list(set([k[2] for k in data.keys()])), key=lambda x: float(x))
-
-    rsvals = list()
-    rdvals = list()
-    for routing_interval in routing_intervals:
-        keys = [k for k in data.keys() if k[0] == routing_interval]
-        rsvals.append([x for k in keys for x in data[k][0]])
-        rdvals.append([x for k in keys for x in data[k][2]])
-
-    hsvals = list()
-    hdvals = list()
-    for hopping_interval in hopping_intervals:
-        keys = [k for k in data.keys() if k[1] == hopping_interval]
-        hsvals.append([x for k in keys for x in data[k][0]])
-        hdvals.append([x for k in keys for x in data[k][2]])
-
-    lsvals = list()
-    ldvals = list()
-    for lease_timeout in lease_timeouts:
-        keys = [k for k in data.keys() if k[2] == lease_timeout]
-        lsvals.append([x for k in keys for x in data[k][0]])
-        ldvals.append([x for k in keys for x in data[k][2]])
+def hopping_plot_single_vars(agg: aggregate.Aggregation, basename: str, duration_ymax: float):
+    by_r = agg.groupby('routing_interval')
+    by_h = agg.groupby('hopping_interval')
+    by_l = agg.groupby('lease_time')
+    routing_intervals = [param_key(k) for k in by_r.keys[:, 0]]
+    hopping_intervals = [param_key(k) for k in by_h.keys[:, 0]]
+    lease_timeouts = [param_key(k) for k in by_l.keys[:, 0]]
+    rsvals, rdvals = by_r.values('success'), by_r.values('duration')
+    hsvals, hdvals = by_h.values('success'), by_h.values('duration')
+    lsvals, ldvals = by_l.values('success'), by_l.values('duration')
 
     plt.figure()
     plt.boxplot(rsvals,
@@ -131,7 +176,7 @@ def hopping_plot_single_vars(data: Dict[Tuple[str, str, str], Tuple[List[float],
     plt.xlabel('RIB exchange interval [s]')
     plt.ylabel('success rate')
     plt.ylim(ymin=0, ymax=1.1)
-    plt.savefig(basename.format(t=now, r='success', var='r'))
+    savefig(basename.format(t=now, r='success', var='r'))
     plt.close()
 
     plt.figure()
@@ -144,7 +189,7 @@ def hopping_plot_single_vars(data: Dict[Tuple[str, str, str], Tuple[List[float],
     plt.xlabel('hopping interval [s]')
     plt.ylabel('success rate')
     plt.ylim(ymin=0, ymax=1.1)
-    plt.savefig(basename.format(t=now, r='success', var='h'))
+    savefig(basename.format(t=now, r='success', var='h'))
     plt.close()
 
     plt.figure()
@@ -157,7 +202,7 @@ def hopping_plot_single_vars(data: Dict[Tuple[str, str, str], Tuple[List[float],
     plt.xlabel('lease timeout [s]')
     plt.ylabel('success rate')
     plt.ylim(ymin=0, ymax=1.1)
-    plt.savefig(basename.format(t=now, r='success', var='l'))
+    savefig(basename.format(t=now, r='success', var='l'))
     plt.close()
 
     plt.figure()
@@ -170,7 +215,7 @@ def hopping_plot_single_vars(data: Dict[Tuple[str, str, str], Tuple[List[float],
     plt.xlabel('RIB exchange interval [s]')
     plt.ylabel('average duration [s]')
     plt.ylim(ymin=0, ymax=duration_ymax)
-    plt.savefig(basename.format(t=now, r='duration', var='r'))
+    savefig(basename.format(t=now, r='duration', var='r'))
     plt.close()
 
     plt.figure()
@@ -183,7 +228,7 @@ def hopping_plot_single_vars(data: Dict[Tuple[str, str, str], Tuple[List[float],
     plt.xlabel('hopping interval [s]')
     plt.ylabel('average duration [s]')
     plt.ylim(ymin=0, ymax=duration_ymax)
-    plt.savefig(basename.format(t=now, r='duration', var='h'))
+    savefig(basename.format(t=now, r='duration', var='h'))
     plt.close()
 
     plt.figure()
@@ -196,39 +241,38 @@ def hopping_plot_single_vars(data: Dict[Tuple[str, str, str], Tuple[List[float],
     plt.xlabel('lease timeout [s]')
     plt.ylabel('average duration [s]')
     plt.ylim(ymin=0, ymax=duration_ymax)
-    plt.savefig(basename.format(t=now, r='duration', var='l'))
+    savefig(basename.format(t=now, r='duration', var='l'))
     plt.close()
 
 
-def hopping_plot_success_rate_l_vs_h(data: Dict[Tuple[str, str, str], Tuple[List[float], List[float], List[float]]],
-                                     basename: str):
+def hopping_plot_success_rate_l_vs_h(agg: aggregate.Aggregation, basename: str, boundary: np.ndarray = None):
+    """With the boundary rows of the routing interval, the boundary of each target rate is drawn as a line."""
     scale = 750
     lowcolor = '#000000'
     highcolor = '#ff0000'
-    routing_intervals = set(k[0] for k in data.keys())
-    for routing_interval in routing_intervals:
-        keys = [k for k in data.keys() if k[0] == routing_interval]
-        x = list()
-        y = list()
-        avg = list()
-        c = list()
-        smin = 1.0
-        smax = 0.0
-        mean = 0.0
-        for k in keys:
-            s, sooo, duration = data[k]
-            val = sum(s)/len(s)
-            smin = min(smin, val)
-            smax = max(smax, val)
-            mean += val
-            x.append([float(k[2])])
-            y.append([float(k[1])])
-            avg.append((val**2) * scale)
-            c.append(mkcolor(val, lowcolor, highcolor))
-        mean /= len(avg)
+    groups = agg.groupby('routing_interval', 'hopping_interval', 'lease_time')
+    rates = groups.mean('success')
+    for r in np.unique(groups.keys[:, 0]):
+        routing_interval = param_key(r)
+        selected = groups.keys[:, 0] == r
+        vals = rates[selected]
+        x = groups.keys[selected, 2:3]
+        y = groups.keys[selected, 1:2]
+        avg = (vals**2) * scale
+        c = [mkcolor(val, lowcolor, highcolor) for val in vals]
+        smin, smax, mean = vals.min(), vals.max(), vals.mean()
         plt.figure()
         plt.scatter(x, y, s=avg, c=c)
-        plt.ylim([0, 22])
+        plt.ylim([0, max(22, y.max() * 1.1)])
+        boundaries = []
+        if boundary is not None:
+            for target in np.unique(boundary[:, 2]):
+                rows = boundary[(boundary[:, 2] == target) & ~np.isnan(boundary[:, 3])]
+                rows = rows[np.argsort(rows[:, 1])]
+                line, = plt.plot(rows[:, 1] * rows[:, 3], rows[:, 3], linestyle='--', marker='x',
+                                 color=mkcolor(target, lowcolor, highcolor),
+                                 label='{:.0f}% boundary'.format(target * 100), zorder=3)
+                boundaries.append(line)
         # Legend proxies
         mean_proxy = matplotlib.lines.Line2D([], [],
                                              label='{:.1f}% (mean)'.format(mean * 100),
@@ -255,40 +299,29 @@ def hopping_plot_success_rate_l_vs_h(data: Dict[Tuple[str, str, str], Tuple[List
                                               markerfacecolor=mkcolor(smax, lowcolor, highcolor),
                                               markersize=20)
         plt.legend(title='Success rates',
-                   handles=[upper_bound, mean_proxy, lower_bound])
+                   handles=[upper_bound, mean_proxy, lower_bound] + boundaries)
         plt.xlabel('prefix lease time [s]')
         plt.ylabel('hopping interval [s]')
         plt.title(f'RIB exchange interval = {routing_interval}s')
-        plt.savefig(basename.format(t=now, i=routing_interval))
+        savefig(basename.format(t=now, i=routing_interval))
         plt.close()
 
 
-def hopping_plot_success_rate_l_vs_r(data: Dict[Tuple[str, str, str], Tuple[List[float], List[float], List[float]]],
-                                     basename: str):
+def hopping_plot_success_rate_l_vs_r(agg: aggregate.Aggregation, basename: str):
     scale = 750
     lowcolor = '#000000'
     highcolor = '#ff0000'
-    hopping_intervals = set(k[1] for k in data.keys())
-    for hopping_interval in hopping_intervals:
-        keys = [k for k in data.keys() if k[1] == hopping_interval]
-        x = list()
-        y = list()
-        savg = list()
-        sc = list()
-        smin = 1.0
-        smax = 0.0
-        smean = 0.0
-        for k in keys:
-            s, sooo, duration = data[k]
-            sval = sum(s)/len(s)
-            smin = min(smin, sval)
-            smax = max(smax, sval)
-            smean += sval
-            x.append([float(k[2])])
-            y.append([float(k[0])])
-            savg.append((sval**2) * scale)
-            sc.append(mkcolor(sval, lowcolor, highcolor))
-        smean /= len(savg)
+    groups = agg.groupby('routing_interval', 'hopping_interval', 'lease_time')
+    rates = groups.mean('success')
+    for h in np.unique(groups.keys[:, 1]):
+        hopping_interval = param_key(h)
+        selected = groups.keys[:, 1] == h
+        svals = rates[selected]
+        x = groups.keys[selected, 2:3]
+        y = groups.keys[selected, 0:1]
+        savg = (svals**2) * scale
+        sc = [mkcolor(sval, lowcolor, highcolor) for sval in svals]
+        smin, smax, smean = svals.min(), svals.max(), svals.mean()
 
         plt.figure()
         plt.scatter(x, y, s=savg, c=sc)
@@ -325,40 +358,319 @@ def hopping_plot_success_rate_l_vs_r(data: Dict[Tuple[str, str, str], Tuple[List
         plt.xlabel('prefix lease time [s]')
         plt.ylabel('RIB exchange interval [s]')
         plt.title(f'hopping interval = {hopping_interval}s')
-        plt.savefig(basename.format(r='success', t=now, i=hopping_interval))
+        savefig(basename.format(r='success', t=now, i=hopping_interval))
         plt.close()
 
 
-def plot_hopping():
-    data = parse_hopping_csv(f'raw/{now}_repo_hopping.csv')
-    data_et = parse_hopping_csv(f'raw/{now}_repo_hopping_edge_traverse.csv')
+def hopping_jobs(testname: str, agg: aggregate.Aggregation, duration_ymax: float) -> List[Job]:
+    """
+    The single variable boxplots depend on all data points; the bubble plots are split into one job per constant
+    routing or hopping interval.
+    """
+    jobs: List[Job] = [(f'{testname}_single_vars', hopping_plot_single_vars,
+                        (agg, f'plots/{{t}}_{testname}_{{r}}_{{var}}.png', duration_ymax))]
+    boundary = load_boundary(testname)
+    for r in np.unique(agg.column('routing_interval')):
+        jobs.append((f'{testname}_l_vs_h_{param_key(r)}', hopping_plot_success_rate_l_vs_h,
+                     (agg.where(routing_interval=r), f'plots/{{t}}_{testname}_success_l_vs_h_{{i}}.png',
+                      boundary[boundary[:, 0] == r] if boundary is not None else None)))
+    for h in np.unique(agg.column('hopping_interval')):
+        jobs.append((f'{testname}_l_vs_r_{param_key(h)}', hopping_plot_success_rate_l_vs_r,
+                     (agg.where(hopping_interval=h), f'plots/{{t}}_{testname}_{{r}}_l_vs_r_{{i}}.png')))
+    for column in ['success', 'duration']:
+        jobs.append((f'{testname}_{column}_summary', summary_table,
+                     (agg, aggregate.PARAMS['repo_hopping'], column, f'plots/{{t}}_{testname}_{column}_summary.csv')))
+    return jobs
+
+
+def plot_hopping() -> List[Job]:
+    data = load_hopping('repo_hopping')
+    data_et = load_hopping('repo_hopping_edge_traverse')
 
     # Remove data points with 0% success rate from the duration pool.
     # Also, remove a single extreme duration outlier from the plot, as it massively distorted the scale.
     # This removal is mentioned in the thesis.
-    outlierval = data[('2.0', '5.0', '2.5')]
-    s, sooo, t = outlierval
-    t = [x for x in t if x < 0.64 and x != 0.0]
-    data[('2.0', '5.0', '2.5')] = (s, sooo, t)
+    duration = data.column('duration')
+    outlier = (data.column('routing_interval') == 2.0) & (data.column('hopping_interval') == 5.0) \
+        & (data.column('lease_time') == 2.5) & ((duration >= 0.64) | (duration == 0.0))
+    data.rows[outlier, data.columns.index('duration')] = np.nan
+
+    duration_ymax: float = np.nanmax(data.column('duration')) * 1.1
+
+    jobs = hopping_jobs('repo_hopping', data, duration_ymax)
+    jobs += hopping_jobs('repo_hopping_edge_traverse', data_et, duration_ymax)
+    return jobs
+
 
-    data_max: float = max([max(x[2]) for x in data.values()])
-    data_et_max: float = max([max(x[2]) for x in data.values()])
-    duration_ymax: float = max(data_max, data_et_max) * 1.1
+def load_overhead(testname: str) -> aggregate.Aggregation:
+    """The rows of the runs that converged, without the `ok` column."""
+    rows = load_results(testname, 7)
+    return aggregate.Aggregation(rows[rows[:, 6] == 1][:, :6], aggregate.COLUMNS['overhead'][:6])
 
-    hopping_plot_single_vars(data, 'plots/{t}_repo_hopping_{r}_{var}.png', duration_ymax)
-    hopping_plot_success_rate_l_vs_h(data, 'plots/{t}_repo_hopping_success_l_vs_h_{i}.png')
-    hopping_plot_success_rate_l_vs_r(data, 'plots/{t}_repo_hopping_{r}_l_vs_r_{i}.png')
 
-    hopping_plot_single_vars(data_et, 'plots/{t}_repo_hopping_edge_traverse_{r}_{var}.png', duration_ymax)
-    hopping_plot_success_rate_l_vs_h(data_et, 'plots/{t}_repo_hopping_edge_traverse_success_l_vs_h_{i}.png')
-    hopping_plot_success_rate_l_vs_r(data_et, 'plots/{t}_repo_hopping_edge_traverse_{r}_l_vs_r_{i}.png')
+def case_testnames(case: str) -> List[str]:
+    """The test names of a case with results, one per topology generator and variant, e.g. overhead_chain."""
+    names = set()
+    for t in timestamps:
+        for path in glob.glob(f'raw/{t}_{case}_*.csv'):
+            name = os.path.basename(path)[len(t) + 1:-len('.csv')]
+            if not name.endswith(('_resources', '_trace')):
+                names.add(name)
+    return sorted(names)
+
+
+def overhead_plot(agg: aggregate.Aggregation, x: str, xlabel: str, basename: str):
+    """One figure per metric: the median over `x`, one line per topology size, with the interquartile range."""
+    groups = agg.groupby('n', x)
+    sizes = np.unique(groups.keys[:, 0])
+    for column, ylabel in OVERHEAD_METRICS:
+        q25, q50, q75 = groups.percentile(column, [25, 50, 75])
+        plt.figure()
+        for i, n in enumerate(sizes):
+            m = groups.keys[:, 0] == n
+            plt.errorbar(groups.keys[m, 1], q50[m], yerr=[q50[m] - q25[m], q75[m] - q50[m]],
+                         color=mkcolor(i / max(len(sizes) - 1, 1), '#000000', '#ff0000'),
+                         marker='o', capsize=3, label=f'{int(n)} nodes')
+        if x == 'prefixes':
+            plt.xscale('log')
+        plt.xlabel(xlabel)
+        plt.ylabel(ylabel)
+        plt.ylim(ymin=0)
+        plt.legend()
+        savefig(basename.format(t=now, r=column))
+        plt.close()
+
+
+def overhead_jobs(testname: str, agg: aggregate.Aggregation) -> List[Job]:
+    """One job per constant number of prefixes (metrics vs interval) and per constant interval (metrics vs prefixes)."""
+    jobs: List[Job] = []
+    for p in np.unique(agg.column('prefixes')):
+        jobs.append((f'{testname}_interval_{int(p)}', overhead_plot,
+                     (agg.where(prefixes=p), 'interval', 'RIB exchange interval [s]',
+                      f'plots/{{t}}_{testname}_{{r}}_interval_{int(p)}.png')))
+    for i in np.unique(agg.column('interval')):
+        jobs.append((f'{testname}_prefixes_{param_key(i)}', overhead_plot,
+                     (agg.where(interval=i), 'prefixes', 'advertised prefixes',
+                      f'plots/{{t}}_{testname}_{{r}}_prefixes_{param_key(i)}.png')))
+    for column, _ in OVERHEAD_METRICS:
+        jobs.append((f'{testname}_{column}_summary', summary_table,
+                     (agg, aggregate.PARAMS['overhead'], column, f'plots/{{t}}_{testname}_{column}_summary.csv')))
+    return jobs
+
+
+def plot_overhead() -> List[Job]:
+    jobs: List[Job] = []
+    for testname in case_testnames('overhead'):
+        jobs += overhead_jobs(testname, load_overhead(testname))
+    return jobs
+
+
+def load_throughput(testname: str) -> aggregate.Aggregation:
+    """The rows of the runs in which routing converged, without the `ok` column."""
+    rows = load_results(testname, 8)
+    return aggregate.Aggregation(rows[rows[:, 7] == 1][:, :7], aggregate.COLUMNS['throughput'][:7])
+
+
+def size_colors(sizes: np.ndarray) -> List[str]:
+    return [mkcolor(i / max(len(sizes) - 1, 1), '#000000', '#ff0000') for i in range(len(sizes))]
+
+
+def throughput_plot(agg: aggregate.Aggregation, basename: str):
+    """Throughput over the number of consumers, and latency over throughput, one line per topology size."""
+    groups = agg.groupby('n', 'consumers')
+    sizes = np.unique(groups.keys[:, 0])
+    q25, q50, q75 = groups.percentile('throughput', [25, 50, 75])
+
+    plt.figure()
+    for n, color in zip(sizes, size_colors(sizes)):
+        m = groups.keys[:, 0] == n
+        plt.errorbar(groups.keys[m, 1], q50[m], yerr=[q50[m] - q25[m], q75[m] - q50[m]], color=color, marker='o',
+                     capsize=3, label=f'{int(n)} nodes')
+    plt.xscale('log')
+    consumers = np.unique(groups.keys[:, 1])
+    plt.xticks(consumers, [str(int(c)) for c in consumers])
+    plt.xlabel('consumers')
+    plt.ylabel('throughput [interests/s]')
+    plt.ylim(ymin=0)
+    plt.legend()
+    savefig(basename.format(t=now, r='consumers'))
+    plt.close()
+
+    p50, p99 = groups.median('p50'), groups.median('p99')
+    plt.figure()
+    for n, color in zip(sizes, size_colors(sizes)):
+        m = groups.keys[:, 0] == n
+        plt.plot(q50[m], p50[m], color=color, marker='o', label=f'{int(n)} nodes, median')
+        plt.plot(q50[m], p99[m], color=color, marker='x', linestyle='--', label=f'{int(n)} nodes, 99th percentile')
+    plt.xlabel('throughput [interests/s]')
+    plt.ylabel('latency [s]')
+    plt.yscale('log')
+    plt.legend(fontsize='small')
+    savefig(basename.format(t=now, r='latency'))
+    plt.close()
+
+
+def capacity(agg: aggregate.Aggregation) -> Tuple[List[str], np.ndarray]:
+    """
+    Per topology size, the highest median throughput of a number of consumers whose median loss stays within
+    LOSS_LIMIT, and the drop point: the smallest number of consumers at which the loss exceeds LOSS_LIMIT or the
+    throughput falls below that of fewer consumers (NaN if there is none).
+    """
+    groups = agg.groupby('n', 'consumers')
+    throughput, loss = groups.median('throughput'), groups.median('loss')
+    rows = []
+    for n in np.unique(groups.keys[:, 0]):
+        m = np.flatnonzero(groups.keys[:, 0] == n)
+        sustained = [throughput[i] for i in m if loss[i] <= LOSS_LIMIT]
+        drop, best = np.nan, 0.0
+        for i in m:
+            if loss[i] > LOSS_LIMIT or throughput[i] < best:
+                drop = groups.keys[i, 1]
+                break
+            best = throughput[i]
+        rows.append([n, max(sustained) if len(sustained) > 0 else np.nan, drop])
+    return ['n', 'max_throughput', 'drop_consumers'], np.array(rows).reshape(-1, 3)
+
+
+def capacity_table(agg: aggregate.Aggregation, filename: str):
+    header, rows = capacity(agg)
+    aggregate.write_table(filename.format(t=now), header, rows)
+    saved.append(filename.format(t=now))
+
+
+def capacity_plot(aggs: Dict[str, aggregate.Aggregation], filename: str):
+    """The maximum sustainable throughput over the topology size, one line per variant, e.g. with and without routing."""
+    plt.figure()
+    for label, agg in sorted(aggs.items()):
+        _, rows = capacity(agg)
+        plt.plot(rows[:, 0], rows[:, 1], marker='o', label=label)
+    plt.xlabel('nodes')
+    plt.ylabel('max. sustainable throughput [interests/s]')
+    plt.ylim(ymin=0)
+    plt.legend()
+    savefig(filename.format(t=now))
+    plt.close()
+
+
+def plot_throughput() -> List[Job]:
+    jobs: List[Job] = []
+    # Variants of the same topology, with and without routing
+    pairs: Dict[str, Dict[str, aggregate.Aggregation]] = dict()
+    for testname in case_testnames('throughput'):
+        agg = load_throughput(testname)
+        jobs.append((testname, throughput_plot, (agg, f'plots/{{t}}_{testname}_{{r}}.png')))
+        jobs.append((f'{testname}_capacity', capacity_table, (agg, f'plots/{{t}}_{testname}_capacity.csv')))
+        for column in ['throughput', 'p99', 'loss']:
+            jobs.append((f'{testname}_{column}_summary', summary_table,
+                         (agg, aggregate.PARAMS['throughput'], column,
+                          f'plots/{{t}}_{testname}_{column}_summary.csv')))
+        label = 'static routes' if '_static' in testname else 'routing'
+        pairs.setdefault(testname.replace('_static', ''), dict())[label] = agg
+    for base, aggs in pairs.items():
+        jobs.append((f'{base}_capacity_plot', capacity_plot, (aggs, f'plots/{{t}}_{base}_capacity.png')))
+    return jobs
+
+
+def load_failure(testname: str) -> aggregate.Aggregation:
+    """The rows of the runs in which the failure was injected, without the `ok` column."""
+    rows = load_results(testname, 8)
+    return aggregate.Aggregation(rows[rows[:, 7] == 1][:, :7], aggregate.COLUMNS['failure'][:7])
+
+
+def failure_plot(aggs: Dict[str, aggregate.Aggregation], basename: str):
+    """
+    One figure per metric: the median over the routing interval with the interquartile range, one line per RIB mode
+    and topology size.  Runs without an alternate path or recovery don't count towards those metrics.
+    """
+    for column, ylabel in FAILURE_METRICS:
+        plt.figure()
+        for j, (label, agg) in enumerate(sorted(aggs.items())):
+            groups = agg.groupby('n', 'interval')
+            sizes = np.unique(groups.keys[:, 0])
+            q25, q50, q75 = groups.percentile(column, [25, 50, 75])
+            for n, color in zip(sizes, size_colors(sizes)):
+                m = groups.keys[:, 0] == n
+                plt.errorbar(groups.keys[m, 1], q50[m], yerr=[q50[m] - q25[m], q75[m] - q50[m]], color=color,
+                             marker='ox'[j % 2], linestyle=['-', '--'][j % 2], capsize=3,
+                             label=f'{label}, {int(n)} nodes')
+        plt.xlabel('RIB exchange interval [s]')
+        plt.ylabel(ylabel)
+        plt.ylim(ymin=0)
+        plt.legend()
+        savefig(basename.format(t=now, r=column))
+        plt.close()
+
+
+def plot_failure() -> List[Job]:
+    jobs: List[Job] = []
+    # Variants of the same topology and failure, with the default and the tree RIB
+    pairs: Dict[str, Dict[str, aggregate.Aggregation]] = dict()
+    for testname in case_testnames('failure'):
+        agg = load_failure(testname)
+        for column in ['gap', 'withdrawal', 'lost']:
+            jobs.append((f'{testname}_{column}_summary', summary_table,
+                         (agg, aggregate.PARAMS['failure'], column, f'plots/{{t}}_{testname}_{column}_summary.csv')))
+        label = 'tree RIB' if '_treerib' in testname else 'default RIB'
+        pairs.setdefault(testname.replace('_treerib', ''), dict())[label] = agg
+    for base, aggs in pairs.items():
+        jobs.append((base, failure_plot, (aggs, f'plots/{{t}}_{base}_{{r}}.png')))
+    return jobs
+
+
+def job_hash(job: Job, code: bytes) -> str:
+    """Hash over the figure function, its input data and parameters, the plot name and the code of this file."""
+    _, func, args = job
+    h = hashlib.sha256(code)
+    h.update(pickle.dumps((now, func.__name__, args), protocol=4))
+    return h.hexdigest()
+
+
+def render_job(job: Tuple[str, str, str, tuple]) -> Tuple[str, str, List[str]]:
+    key, digest, func, args = job
+    del saved[:]
+    globals()[func](*args)
+    return key, digest, list(saved)
+
+
+def render(jobs: List[Job], processes: int = None, force: bool = False):
+    """
+    Render the figure jobs in a process pool.  A job is skipped if its hash matches the one recorded in the
+    manifest of its last render, and all files it wrote back then still exist.
+    """
+    manifest: Dict[str, Dict] = dict()
+    if os.path.exists(MANIFEST) and not force:
+        with open(MANIFEST, 'r') as f:
+            manifest = json.load(f)
+    with open(__file__, 'rb') as f:
+        code = f.read()
+    pending = list()
+    for job in jobs:
+        key, func, args = job
+        digest = job_hash(job, code)
+        entry = manifest.get(key)
+        if entry is not None and entry['hash'] == digest and all(os.path.exists(p) for p in entry['files']):
+            continue
+        pending.append((key, digest, func.__name__, args))
+    print(f'Rendering {len(pending)} of {len(jobs)} figure jobs')
+    if len(pending) > 0:
+        with multiprocessing.Pool(processes) as pool:
+            for key, digest, files in pool.imap_unordered(render_job, pending):
+                manifest[key] = {'hash': digest, 'files': files}
+    tmp = f'{MANIFEST}.{os.getpid()}'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, MANIFEST)
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print(f'{sys.argv[0]} <timestamp>')
-        exit(1)
-    now = sys.argv[1]
+    parser = argparse.ArgumentParser(sys.argv[0])
+    parser.add_argument('timestamps', nargs='+', metavar='timestamp')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Number of figures rendered in parallel, default: number of CPUs')
+    parser.add_argument('--force', action='store_true', help='Render all figures, even if unchanged')
+    args = parser.parse_args()
+    now = args.timestamps[0]
+    timestamps = args.timestamps
     os.makedirs('plots', exist_ok=True)
-    plot_scaling()
-    plot_hopping()
+    render(plot_scaling() + plot_hopping() + plot_overhead() + plot_throughput() + plot_failure(),
+           processes=args.jobs, force=args.force)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3.6
+
+"""
+Binary per-event result store.
+
+Next to the aggregate CSV files, each test case persists the raw events of every run in a directory
+`raw/<timestamp>_<testname>/`:
+
+- `manifest.json`: the test case and the record layout of each table
+- `runs.jsonl`: one JSON object per run, with its run ID, parameters and aggregate results
+- `<table>.bin`: fixed-size little-endian records, appended by each run
+
+The tables are plain arrays of fixed-size records, so they can be appended to by concurrent sweep workers and
+memory-mapped as NumPy structured arrays without parsing.  NumPy is only needed for loading.
+"""
+
+from typing import Any, Dict, List, Tuple
+
+import json
+import os
+import struct
+import sys
+
+
+# Record layouts of the test cases: table -> [(field, struct format character)]
+SCHEMAS: Dict[str, Dict[str, List[Tuple[str, str]]]] = {
+    'scaling': {
+        # hop -1 is the first successful data delivery, time is NaN if it never happened
+        'convergence': [('run_id', 'Q'), ('hop', 'i'), ('time', 'd')],
+    },
+    'repo_hopping': {
+        # status: 0 timed out, 1 content, 2 nack, 3 content after the interest timed out
+        'interests': [('run_id', 'Q'), ('seq', 'I'), ('send_time', 'd'), ('rtt', 'd'), ('status', 'B')],
+        'hops': [('run_id', 'Q'), ('time', 'd')],
+        # with the repository pool: the steps of each handover, NaN if not seen
+        'handovers': [('run_id', 'Q'), ('hop', 'I'), ('edge', 'I'), ('detach', 'd'), ('attach', 'd'),
+                      ('advertisement', 'd'), ('registration', 'd'), ('registered', 'd'), ('core', 'd')],
+    },
+    'failure': {
+        # send_time relative to the failure; status as in repo_hopping
+        'interests': [('run_id', 'Q'), ('seq', 'I'), ('send_time', 'd'), ('rtt', 'd'), ('status', 'B')],
+    },
+    'resources': {
+        # per forwarder: cpu is NaN if the forwarder has no processes of its own, rib and fib are -1 if unknown
+        'samples': [('run_id', 'Q'), ('time', 'd'), ('forwarder', 'I'), ('cpu', 'd'), ('rss', 'Q'),
+                    ('context_switches', 'Q'), ('routing_sent', 'Q'), ('routing_received', 'Q'), ('rib', 'i'),
+                    ('fib', 'i')],
+        # per forwarder and face address, the IPv4 address as a big-endian integer
+        'faces': [('run_id', 'Q'), ('time', 'd'), ('forwarder', 'I'), ('address', 'I'), ('port', 'H'),
+                  ('packets_in', 'Q'), ('bytes_in', 'Q'), ('packets_out', 'Q'), ('bytes_out', 'Q')],
+    },
+}
+
+_NUMPY_TYPES = {'Q': '<u8', 'I': '<u4', 'i': '<i4', 'H': '<u2', 'd': '<f8', 'B': 'u1'}
+
+
+class ResultStore(object):
+
+    def __init__(self, directory: str, schema: str):
+        self.directory = directory
+        self.schema = schema
+        self.tables = SCHEMAS[schema]
+        self._structs = {t: struct.Struct('<' + ''.join(c for _, c in fields)) for t, fields in self.tables.items()}
+        os.makedirs(directory, exist_ok=True)
+        manifest = os.path.join(directory, 'manifest.json')
+        if not os.path.exists(manifest):
+            tmp = f'{manifest}.{os.getpid()}'
+            with open(tmp, 'w') as f:
+                json.dump({'schema': schema, 'tables': self.tables}, f)
+            os.replace(tmp, manifest)
+
+    def new_run(self, params: Dict[str, Any], results: Dict[str, Any] = None) -> int:
+        """Record a run in the manifest and return its ID."""
+        run_id = int.from_bytes(os.urandom(8), 'little') >> 1
+        line = json.dumps({'run_id': run_id, 'params': params, 'results': results or dict()}) + '\n'
+        self._append('runs.jsonl', line.encode())
+        return run_id
+
+    def append(self, table: str, rows: List[tuple]):
+        s = self._structs[table]
+        self._append(f'{table}.bin', b''.join(s.pack(*row) for row in rows))
+
+    def _append(self, filename: str, data: bytes):
+        # A single write to a file opened with O_APPEND, so records of concurrent runs don't interleave.
+        fd = os.open(os.path.join(self.directory, filename), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+
+def load_events(directory: str):
+    """
+    Load a result store: returns the manifest, the list of runs, and for each table a read-only memory-mapped NumPy
+    structured array.
+    """
+    import numpy as np
+    with open(os.path.join(directory, 'manifest.json'), 'r') as f:
+        manifest = json.load(f)
+    runs = list()
+    runs_file = os.path.join(directory, 'runs.jsonl')
+    if os.path.exists(runs_file):
+        with open(runs_file, 'r') as f:
+            runs = [json.loads(l) for l in f if len(l.strip()) > 0]
+    tables = dict()
+    for table, fields in manifest['tables'].items():
+        dtype = np.dtype([(name, _NUMPY_TYPES[c]) for name, c in fields])
+        filename = os.path.join(directory, f'{table}.bin')
+        size = os.path.getsize(filename) if os.path.exists(filename) else 0
+        # Ignore a partially written record at the end, e.g. from a run that is still writing.
+        count = size // dtype.itemsize
+        if count == 0:
+            tables[table] = np.zeros(0, dtype=dtype)
+        else:
+            tables[table] = np.memmap(filename, dtype=dtype, mode='r', shape=(count,))
+    return manifest, runs, tables
+
+
+def _parse_field(field: str) -> float:
+    if field == '':
+        return float('nan')
+    if field in ['ok', 'fail']:
+        return 1.0 if field == 'ok' else 0.0
+    return float(field)
+
+
+def _parse_csv(text: bytes, columns: int):
+    """Returns the parsed rows, and the number of lines that were rejected as malformed."""
+    import numpy as np
+    # A single pass in C: map the ok/fail column and empty fields to numbers, then parse all fields at once.
+    lines = text.count(b'\n')
+    mapped = text.replace(b'fail', b'0').replace(b'ok', b'1').replace(b',,', b',nan,').replace(b',,', b',nan,')
+    mapped = mapped.replace(b',\n', b',nan\n').replace(b'\n', b',')
+    values = np.fromstring(mapped.decode(), dtype=np.float64, sep=',')
+    if len(values) == lines * columns:
+        return values.reshape(-1, columns), 0
+    # fromstring stops at the first field it can't parse, which would shift all rows after it.  Parse line by line
+    # instead, and reject the malformed lines.
+    rows = []
+    for line in text.decode().splitlines():
+        fields = line.split(',')
+        if len(fields) != columns:
+            continue
+        try:
+            rows.append([_parse_field(field.strip()) for field in fields])
+        except ValueError:
+            continue
+    return np.array(rows, dtype=np.float64).reshape(-1, columns), lines - len(rows)
+
+
+def load_csv(filename: str, columns: int):
+    """
+    Parse a numeric result CSV into a float64 array with one row per line; `ok` and `fail` are parsed as 1 and 0,
+    empty fields as NaN.  Lines that don't have `columns` numeric fields are skipped.  The parsed array is cached in
+    `<filename>.npz`, unless lines were skipped.  As the result files are only ever appended to, a cache that is older
+    than the CSV is extended by parsing only the lines appended since; it is rebuilt if the CSV shrank or the cache
+    doesn't match.
+    """
+    import numpy as np
+    cache = f'{filename}.npz'
+    st = os.stat(filename)
+    parsed = None
+    offset = 0
+    if os.path.exists(cache):
+        try:
+            with np.load(cache) as c:
+                if int(c['size']) == st.st_size and int(c['mtime_ns']) == st.st_mtime_ns:
+                    return c['data']
+                if int(c['size']) < st.st_size and c['data'].shape[1] == columns:
+                    parsed, offset = c['data'], int(c['size'])
+        except (OSError, KeyError, ValueError):
+            pass
+    with open(filename, 'rb') as f:
+        f.seek(offset)
+        text = f.read(st.st_size - offset)
+    # Only parse complete lines, a run may be appending right now.
+    text = text[:text.rfind(b'\n') + 1]
+    data, rejected = _parse_csv(text, columns)
+    if parsed is not None:
+        data = np.concatenate([parsed, data])
+    if rejected > 0:
+        # Not cached, so the rejected lines are reported again until the CSV is fixed.
+        print(f'{filename}: skipped {rejected} malformed lines', file=sys.stderr)
+        return data
+    tmp = f'{cache}.{os.getpid()}.npz'
+    np.savez(tmp, data=data, size=offset + len(text), mtime_ns=st.st_mtime_ns)
+    os.replace(tmp, cache)
+    return data
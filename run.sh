@@ -1,32 +1,16 @@
 #!/usr/bin/env bash
 
-timestamp="$(date -u +%s)"
+# Pass the timestamp of an interrupted sweep to resume it.
+timestamp="${1:-$(date -u +%s)}"
 
-for case in depth breadth depth_rand breadth_rand; do
-  for n in `seq 1 10`; do
-    for interval in 0.5 1.0 2.0; do
-      for run in `seq 1 20`; do
-        timeout -k 5s -s TERM "$((5+10*$n))s" env PYTHONPATH="$(realpath ./picn)" \
-                python3.6 picn-routing-measurements.py $timestamp $case $run $n $interval \
-            || echo Timeout
-      done
-    done
-  done
-done
-
-for case in repo_hopping repo_hopping_edge_traverse; do
-  for routing_interval in 0.1 1.0 2.0; do
-    for hopping_interval in 5.0 10.0 20.0; do
-      for lease_time in 0.5 0.9 1.0 1.1 2.0; do
-        for run in `seq 1 20`; do
-          timeout -k 5s -s TERM 70s env PYTHONPATH="$(realpath ./picn)" \
-                  python3.6 picn-routing-measurements.py $timestamp $case $run \
-                      $routing_interval $hopping_interval $(bc <<<"$hopping_interval*$lease_time") \
-              || echo Timeout
-        done
-      done
-    done
-  done
-done
+# Runs the whole parameter grid (5 to 20 runs per parameter point, stopping once the 95% confidence interval of a
+# point is within 10% of its mean) in long-lived worker processes, one run per core at most, leaving a quarter of
+# the CPU idle. Each run is killed after the same timeout as before: 5+10*n seconds
+# for the scaling cases, 70 seconds for repo hopping. A run that times out or crashes is attempted up to 3 times;
+# the state of every run is kept in raw/<timestamp>_sweep.sqlite. Only the scaling and repo hopping cases are run;
+# add e.g. --cases overhead throughput failure for the other grids. Nightly results are no longer 20 runs per point,
+# so they can't be compared run for run with the ones from before early stopping.
+env PYTHONPATH="$(realpath ./picn)" \
+    python3.6 picn-routing-measurements.py $timestamp sweep 20 --min-runs 5 --ci-width 0.1 --workers "$(nproc)" --headroom 0.25
 
 python3.6 plot.py $timestamp
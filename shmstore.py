@@ -0,0 +1,308 @@
+#!/usr/bin/env python3.6
+
+"""
+Shared-memory dicts as a stand-in for the dict proxies of a multiprocessing.Manager.
+
+TreeRoutingInformationBase and SimpleMemoryRepository keep their state in `manager.dict()` proxies, so every RIB
+update and every content lookup is a round trip to the manager's server process.  A SharedMemoryManager passed in
+place of the Manager creates ShmDicts instead, and delegates everything else (locks, lists, ...) to the Manager:
+
+- a ShmDict is an open addressing hash table over pickled keys and values, in a file in /dev/shm mapped by every
+  process that uses it; lookups read the mapping directly
+- writers are serialized by a lock on the file, and make their changes between two increments of a sequence
+  counter; readers retry if the counter was odd or changed while they read (a seqlock), so they don't block
+- a counter left odd by a writer that died in the middle of a change is repaired by the next writer, which rebuilds
+  the table from its slots; readers that see the counter odd for STALE_TIMEOUT seconds take the lock themselves, so
+  they either wait for a writer that is still alive or do the repair
+- updated and deleted records are reclaimed by rebuilding the table in place once the heap or the slots run full
+- a ShmDict is pickled by its path, so it can be stored in a forwarder's data_structs or sent through the Manager
+  like the proxy it replaces; unpickling maps the file once per process, and the mapping is released with the last
+  reference, so a long-lived Manager process doesn't keep the files of past runs mapped
+
+Python 3.6 has no multiprocessing.shared_memory, hence the plain files.  The files are removed by the creating
+manager's close(), or if the creating process was killed before, by unlink_dicts() with its pid.
+"""
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import collections.abc
+import fcntl
+import itertools
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import weakref
+import zlib
+from time import monotonic
+
+
+_SHM_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+# path -> ShmDict mapped in this process
+_attached: Dict[str, 'ShmDict'] = weakref.WeakValueDictionary()
+_counter = itertools.count()
+
+
+def _hash(data: bytes) -> int:
+    # Never 0 (empty slot) or 1 (deleted slot)
+    return zlib.crc32(data) | (1 << 32)
+
+
+def unlink_dicts(pid: int):
+    """Remove the files of all ShmDicts created by process `pid`, e.g. after it was killed before its close()."""
+    for name in os.listdir(_SHM_DIR):
+        if name.startswith(f'picn-{pid}-'):
+            try:
+                os.unlink(os.path.join(_SHM_DIR, name))
+            except FileNotFoundError:
+                pass
+
+
+def _attach(path: str) -> 'ShmDict':
+    d = _attached.get(path)
+    if d is None:
+        d = ShmDict(path, create=False)
+    return d
+
+
+class ShmDict(collections.abc.MutableMapping):
+
+    # sequence counter, live entries, deleted slots, bytes used of the heap, number of slots, heap size
+    HEADER = struct.Struct('=QQQQQQ')
+    # live entries, deleted slots and bytes used of the heap, following the sequence counter
+    COUNTS = struct.Struct('=QQQ')
+    # key hash (0 empty, 1 deleted), offset of the record in the heap, key length, value length
+    SLOT = struct.Struct('=QQII')
+    # Rebuild the table once this fraction of the slots is live or deleted
+    LOAD = 0.7
+    # Seconds a reader retries while the sequence counter is odd before it takes the writers' lock
+    STALE_TIMEOUT = 1.0
+
+    def __init__(self, path: str, slots: int = 1 << 16, heap: int = 1 << 26, create: bool = True):
+        self.path = path
+        if create:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+            os.ftruncate(fd, ShmDict.HEADER.size + slots * ShmDict.SLOT.size + heap)
+        else:
+            fd = os.open(path, os.O_RDWR)
+        self._fd = fd
+        self.mm = mmap.mmap(fd, 0)
+        if create:
+            ShmDict.HEADER.pack_into(self.mm, 0, 0, 0, 0, 0, slots, heap)
+        _, _, _, _, self.slots, self.heap = ShmDict.HEADER.unpack_from(self.mm, 0)
+        self._heap_offset = ShmDict.HEADER.size + self.slots * ShmDict.SLOT.size
+        # lockf() locks belong to the process, so threads of one process are serialized separately
+        self._thread_lock = threading.Lock()
+        _attached[path] = self
+
+    def __del__(self):
+        if getattr(self, '_fd', None) is not None:
+            os.close(self._fd)
+
+    def __reduce__(self):
+        return _attach, (self.path,)
+
+    # Reading
+
+    def _seq(self) -> int:
+        return struct.unpack_from('=Q', self.mm, 0)[0]
+
+    def _slot(self, i: int) -> Tuple[int, int, int, int]:
+        return ShmDict.SLOT.unpack_from(self.mm, ShmDict.HEADER.size + i * ShmDict.SLOT.size)
+
+    def _record(self, offset: int, key_len: int, value_len: int) -> Tuple[bytes, bytes]:
+        start = self._heap_offset + offset
+        return self.mm[start:start + key_len], self.mm[start + key_len:start + key_len + value_len]
+
+    def _find(self, key: bytes, h: int) -> Tuple[int, Optional[bytes]]:
+        """The slot of a key and its value, or the first free slot on its probe sequence and None."""
+        free = None
+        i = h % self.slots
+        for _ in range(self.slots):
+            sh, offset, key_len, value_len = self._slot(i)
+            if sh == 0:
+                return (free if free is not None else i), None
+            if sh == 1:
+                if free is None:
+                    free = i
+            elif sh == h and key_len == len(key):
+                k, v = self._record(offset, key_len, value_len)
+                if k == key:
+                    return i, v
+            i = (i + 1) % self.slots
+        return (free if free is not None else -1), None
+
+    def _read(self, fn, *args):
+        """Run a reading function until no write overlapped with it."""
+        stale = None
+        while True:
+            seq = self._seq()
+            if seq & 1:
+                if stale is None:
+                    stale = monotonic() + ShmDict.STALE_TIMEOUT
+                elif monotonic() > stale:
+                    # The writer may have died: wait for it if it's alive, or repair what it left behind.
+                    self._write(lambda: None)
+                    stale = None
+                else:
+                    os.sched_yield()
+                continue
+            try:
+                result = fn(*args)
+            except (struct.error, IndexError, ValueError):
+                # A torn read of a record that is being moved
+                result = None
+            if self._seq() == seq:
+                return result
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        return self._read(lambda: self._find(key, _hash(key))[1])
+
+    def __getitem__(self, key):
+        value = self._get(pickle.dumps(key, protocol=4))
+        if value is None:
+            raise KeyError(key)
+        return pickle.loads(value)
+
+    def __contains__(self, key) -> bool:
+        return self._get(pickle.dumps(key, protocol=4)) is not None
+
+    def _items(self) -> List[Tuple[bytes, bytes]]:
+        slots = self.mm[ShmDict.HEADER.size:self._heap_offset]
+        return [self._record(offset, key_len, value_len)
+                for sh, offset, key_len, value_len in ShmDict.SLOT.iter_unpack(slots) if sh > 1]
+
+    def __iter__(self) -> Iterator:
+        return iter([pickle.loads(k) for k, _ in self._read(self._items)])
+
+    def items(self) -> List[Tuple[Any, Any]]:
+        return [(pickle.loads(k), pickle.loads(v)) for k, v in self._read(self._items)]
+
+    def __len__(self) -> int:
+        return ShmDict.HEADER.unpack_from(self.mm, 0)[1]
+
+    # Writing
+
+    def _write(self, fn, *args):
+        with self._thread_lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                if self._seq() & 1:
+                    self._repair()
+                struct.pack_into('=Q', self.mm, 0, self._seq() + 1)
+                try:
+                    return fn(*args)
+                finally:
+                    struct.pack_into('=Q', self.mm, 0, self._seq() + 1)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    def _repair(self):
+        """
+        Called with the lock held if the sequence counter is odd, i.e. a writer died in the middle of a change.  The
+        slots only ever point to complete records, so rebuilding from them drops the change that was cut short (or
+        if that was a rebuild, the entries it hadn't moved yet), and recounts the entries.
+        """
+        self._rebuild()
+        struct.pack_into('=Q', self.mm, 0, self._seq() + 1)
+
+    def _header(self) -> List[int]:
+        return list(ShmDict.HEADER.unpack_from(self.mm, 0))
+
+    def _put(self, key: bytes, value: bytes, rebuilt: bool = False):
+        h = _hash(key)
+        header = self._header()
+        i, old = self._find(key, h)
+        full = header[3] + len(key) + len(value) > self.heap
+        if i < 0 or full or (old is None and header[1] + header[2] + 1 > self.slots * ShmDict.LOAD):
+            if rebuilt:
+                raise MemoryError(f'Shared dict {self.path} is full')
+            self._rebuild()
+            return self._put(key, value, rebuilt=True)
+        offset = header[3]
+        start = self._heap_offset + offset
+        self.mm[start:start + len(key)] = key
+        self.mm[start + len(key):start + len(key) + len(value)] = value
+        if old is None and self._slot(i)[0] == 1:
+            header[2] -= 1
+        ShmDict.SLOT.pack_into(self.mm, ShmDict.HEADER.size + i * ShmDict.SLOT.size, h, offset, len(key), len(value))
+        header[1] += 1 if old is None else 0
+        header[3] += len(key) + len(value)
+        ShmDict.COUNTS.pack_into(self.mm, 8, *header[1:4])
+
+    def _delete(self, key: bytes) -> bool:
+        i, old = self._find(key, _hash(key))
+        if old is None:
+            return False
+        ShmDict.SLOT.pack_into(self.mm, ShmDict.HEADER.size + i * ShmDict.SLOT.size, 1, 0, 0, 0)
+        header = self._header()
+        header[1] -= 1
+        header[2] += 1
+        ShmDict.COUNTS.pack_into(self.mm, 8, *header[1:4])
+        return True
+
+    def _rebuild(self):
+        """Drop the deleted slots and the records of updated and deleted entries."""
+        items = self._items()
+        self.mm[ShmDict.HEADER.size:self._heap_offset] = bytes(self._heap_offset - ShmDict.HEADER.size)
+        ShmDict.COUNTS.pack_into(self.mm, 8, 0, 0, 0)
+        for k, v in items:
+            self._put(k, v, rebuilt=True)
+
+    def __setitem__(self, key, value):
+        self._write(self._put, pickle.dumps(key, protocol=4), pickle.dumps(value, protocol=4))
+
+    def __delitem__(self, key):
+        if not self._write(self._delete, pickle.dumps(key, protocol=4)):
+            raise KeyError(key)
+
+    def clear(self):
+        self._write(self._clear)
+
+    def _clear(self):
+        self.mm[ShmDict.HEADER.size:self._heap_offset] = bytes(self._heap_offset - ShmDict.HEADER.size)
+        ShmDict.COUNTS.pack_into(self.mm, 8, 0, 0, 0)
+
+    def copy(self) -> dict:
+        return dict(self.items())
+
+    def close(self, unlink: bool = False):
+        _attached.pop(self.path, None)
+        self.mm.close()
+        os.close(self._fd)
+        self._fd = None
+        if unlink:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class SharedMemoryManager(object):
+    """
+    Creates ShmDicts in place of the dict proxies of `manager`, and delegates everything else to it.  The sizes are
+    the capacity of each dict: the number of slots, of which LOAD can be used, and the bytes of keys and values.
+    """
+
+    def __init__(self, manager, slots: int = 1 << 16, heap: int = 1 << 26):
+        self._manager = manager
+        self._slots = slots
+        self._heap = heap
+        self.dicts: List[ShmDict] = list()
+
+    def dict(self, *args, **kwargs) -> ShmDict:
+        d = ShmDict(os.path.join(_SHM_DIR, f'picn-{os.getpid()}-{next(_counter)}'), self._slots, self._heap)
+        d.update(*args, **kwargs)
+        self.dicts.append(d)
+        return d
+
+    def __getattr__(self, name):
+        return getattr(self._manager, name)
+
+    def close(self):
+        """Unmap and remove the dicts created by this manager."""
+        for d in self.dicts:
+            d.close(unlink=True)
+        del self.dicts[:]
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3.6
+
+"""
+Discrete-event model of the routing convergence test cases.
+
+The forwarders, their routing layers and the client's Fetch are modelled against a shared virtual clock, which
+jumps straight to the next scheduled event instead of waiting out the routing intervals.  The model follows the
+behaviour of PiCN's routing layer: every ageing interval, each forwarder requests the RIB of each of its peers and
+inserts the received routes with their distance incremented by one.  Packets sent to a forwarder that has not been
+started yet are buffered, like they are in the socket of a forwarder that is not running yet.
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+import heapq
+import random
+
+
+# One-way delay from one forwarder to the next, including the queues between the layer processes.
+HOP_DELAY = 0.002
+# Time it takes to start the processes of one forwarder.
+STARTUP_COST = 0.05
+# Number of routing intervals after which a route that was not refreshed is removed from the RIB.
+ROUTE_LIFETIME = 3
+# Pseudo forwarder index of the repository's face.
+REPO = -1
+
+
+class VirtualClock(object):
+
+    def __init__(self):
+        self.now: float = 0.0
+        self._events: List[Tuple[float, int, Callable, tuple]] = []
+        self._seq = 0
+
+    def schedule(self, delay: float, callback: Callable, *args):
+        heapq.heappush(self._events, (self.now + delay, self._seq, callback, args))
+        self._seq += 1
+
+    def advance(self, delay: float):
+        """Process all events scheduled within the next `delay` seconds."""
+        self.run_until(self.now + delay)
+
+    def run_until(self, t: float, stop: Callable[[], bool] = lambda: False):
+        while len(self._events) > 0 and self._events[0][0] <= t and not stop():
+            self.now, _, callback, args = heapq.heappop(self._events)
+            callback(*args)
+        if not stop():
+            self.now = max(self.now, t)
+
+
+class SimForwarder(object):
+
+    def __init__(self, network: 'SimNetwork', index: int, peers: List[int], ageing_interval: float):
+        self.network = network
+        self.index = index
+        self.peers = peers
+        self.ageing_interval = ageing_interval
+        self.started = False
+        self.alive = True
+        self.static: Dict[str, int] = dict()
+        # (prefix, next hop) -> (distance, expiry)
+        self.rib: Dict[Tuple[str, int], Tuple[int, float]] = dict()
+        # Called after the routes of a reply were inserted, like the FIB stores the ConvergenceProbe is woken by
+        self.on_routes: Optional[Callable[[], None]] = None
+        self._backlog: List[Tuple[Callable, tuple]] = list()
+
+    def start(self):
+        self.started = True
+        for callback, args in self._backlog:
+            callback(*args)
+        self._backlog = list()
+        self.ageing()
+
+    def deliver(self, callback: Callable, *args):
+        if not self.alive:
+            return
+        if not self.started:
+            self._backlog.append((callback, args))
+            return
+        callback(*args)
+
+    def ageing(self):
+        if not self.alive:
+            return
+        now = self.network.clock.now
+        self.rib = {k: v for k, v in self.rib.items() if v[1] > now}
+        for peer in self.peers:
+            self.network.send(peer, self.network.nodes[peer].on_route_request, self.index)
+        self.network.clock.schedule(self.ageing_interval, self.ageing)
+
+    def on_route_request(self, requester: int):
+        routes = [(prefix, 0) for prefix in self.static.keys()]
+        routes += [(prefix, distance) for (prefix, _), (distance, _) in self.rib.items()]
+        self.network.send(requester, self.network.nodes[requester].on_route_reply, self.index, routes)
+
+    def on_route_reply(self, peer: int, routes: List[Tuple[str, int]]):
+        expiry = self.network.clock.now + ROUTE_LIFETIME * self.ageing_interval
+        for prefix, distance in routes:
+            if prefix in self.static:
+                continue
+            self.rib[(prefix, peer)] = distance + 1, expiry
+        if self.on_routes is not None:
+            self.on_routes()
+
+    def nexthops(self, name: str) -> List[int]:
+        """The FIB entries for the longest prefix matching `name`, best route first."""
+        best: List[Tuple[int, int]] = []
+        best_len = -1
+        now = self.network.clock.now
+        candidates = [(prefix, nh, 0) for prefix, nh in self.static.items()]
+        candidates += [(prefix, nh, d) for (prefix, nh), (d, exp) in self.rib.items() if exp > now]
+        for prefix, nh, distance in candidates:
+            if name != prefix and not name.startswith(prefix + '/'):
+                continue
+            if len(prefix) > best_len:
+                best, best_len = [], len(prefix)
+            if len(prefix) == best_len:
+                best.append((distance, nh))
+        return [nh for _, nh in sorted(best)]
+
+
+class SimNetwork(object):
+
+    def __init__(self, peers: List[List[int]], ageing_interval: float, hop_delay: float = HOP_DELAY):
+        self.clock = VirtualClock()
+        self.hop_delay = hop_delay
+        self.nodes: List[SimForwarder] = [SimForwarder(self, i, p, ageing_interval) for i, p in enumerate(peers)]
+
+    def send(self, dst: int, callback: Callable, *args):
+        self.clock.schedule(self.hop_delay, self.nodes[dst].deliver, callback, *args)
+
+    def fetch(self, client: int, name: str, on_response: Callable[[bool], None]):
+        """Send an interest from a client attached to forwarder `client`.  Calls on_response(True) for content,
+        on_response(False) for a nack, and nothing if the interest is lost."""
+        self.clock.schedule(self.hop_delay, self.nodes[client].deliver, self._forward, client, name, [], on_response)
+
+    def _forward(self, node: int, name: str, path: List[int], on_response: Callable[[bool], None]):
+        path = path + [node]
+        nexthops = self.nodes[node].nexthops(name)
+        if len(nexthops) == 0 or len(path) > len(self.nodes):
+            self.clock.schedule(self.hop_delay * len(path), on_response, False)
+        elif nexthops[0] == REPO:
+            self.clock.schedule(self.hop_delay * (len(path) + 1), on_response, True)
+        else:
+            nh = nexthops[0]
+            self.send(nh, self._forward, nh, name, path, on_response)
+
+
+def depth_topology(n: int) -> Tuple[List[List[int]], int, int]:
+    """Peers, repo-facing forwarder and client-facing forwarder of the depth test case."""
+    return [[i + 1] if i < n - 1 else [] for i in range(n)], n - 1, 0
+
+
+def breadth_topology(n: int) -> Tuple[List[List[int]], int, int]:
+    """Peers, repo-facing forwarder and client-facing forwarder of the breadth test case."""
+    peers = [[n + 1] for _ in range(n)] + [list(range(n)), []]
+    return peers, n + 1, n
+
+
+SCENARIOS: Dict[str, Tuple[Callable[[int], Tuple[List[List[int]], int, int]], bool]] = {
+    'depth': (depth_topology, False),
+    'breadth': (breadth_topology, False),
+    'depth_rand': (depth_topology, True),
+    'breadth_rand': (breadth_topology, True),
+}
+
+
+def simulate_convergence(peers: List[List[int]], repo_node: int, client_node: int, ageing: float,
+                         timeout: float, random_startup_delay: bool,
+                         prefix: str = '/picn/routing/testrepo', hop_delay: float = HOP_DELAY) -> Tuple[float, bool]:
+    """
+    Simulate measure(): start the forwarders, wait until the route landed at the client's forwarder, then fetch until
+    the content arrives or the timeout expires.  Returns the convergence time in simulated seconds, and whether the
+    content was received.
+    """
+    net = SimNetwork(peers, ageing, hop_delay)
+    net.nodes[repo_node].static[prefix] = REPO
+    order = list(range(len(peers)))
+    if random_startup_delay:
+        random.shuffle(order)
+    for i in order:
+        if random_startup_delay:
+            net.clock.advance(random.uniform(0.1, 0.5))
+        net.nodes[i].start()
+        net.clock.advance(STARTUP_COST)
+
+    start_time = net.clock.now
+    state = {'done': False, 'ok': False, 'attempt': 0, 'fetching': False}
+
+    def fetch():
+        if not state['fetching']:
+            state['fetching'] = True
+            attempt()
+
+    def on_routes():
+        # ConvergenceProbe.wait_landed() returns as soon as the route is there.
+        if len(net.nodes[client_node].nexthops(prefix)) > 0:
+            fetch()
+
+    def attempt():
+        if net.clock.now >= start_time + timeout:
+            state['done'] = True
+            return
+        state['attempt'] += 1
+        # Fetch.fetch_data() gives up after 1 s without a response.
+        net.clock.schedule(1.0, on_timeout, state['attempt'])
+        net.fetch(client_node, prefix + '/testcontent', lambda ok, a=state['attempt']: on_response(a, ok))
+
+    def on_response(attempt_no: int, ok: bool):
+        if attempt_no != state['attempt'] or state['done']:
+            return
+        state['attempt'] += 1
+        if ok:
+            state['done'] = state['ok'] = True
+        else:
+            net.clock.schedule(0.01, attempt)
+
+    def on_timeout(attempt_no: int):
+        if attempt_no == state['attempt'] and not state['done']:
+            attempt()
+
+    net.nodes[client_node].on_routes = on_routes
+    on_routes()
+    # If the route doesn't land within the timeout, measure() doesn't fetch at all.
+    net.clock.schedule(timeout, fetch)
+    net.clock.run_until(start_time + timeout + 1.0, stop=lambda: state['done'])
+    return net.clock.now - start_time, state['ok']
+
+
+def simulate_scenario(scenario: str, n: int, ageing: float) -> Tuple[float, bool]:
+    """Simulate one run of a scaling test case, with the same timeout as the real measurement."""
+    topology, random_startup_delay = SCENARIOS[scenario]
+    peers, repo_node, client_node = topology(n)
+    return simulate_convergence(peers, repo_node, client_node, ageing, n * ageing * 3, random_startup_delay)
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3.6
+
+"""
+Forwarder topologies for the routing test cases.
+
+A Topology lists the forwarders of a test, and for each of them its routing peers (the forwarders whose RIB it
+requests every ageing interval, i.e. the direction routes travel in is from a peer to the node), its RIB type and
+static FIB entries.  It also names the forwarder the client is connected to, the one the repository is connected
+to, and the edge forwarders a repository can register with via autoconfig.
+
+Topologies are either generated or loaded from a declarative JSON file.  Both are selected with a spec string:
+
+- `chain:n=N`: the `depth` topology, each forwarder peers with the next one towards the repository
+- `breadth:n=N`: the `breadth` topology, N forwarders in parallel between client and repository
+- `star:n=N`: a hub with N leaves, the client at the hub
+- `tree:k=K,depth=D`: a K-ary tree, each node peers with its children, the client at the root
+- `fattree:k=K`: a K-ary fat-tree of (K/2)^2 core, K^2/2 aggregation and K^2/2 edge switches
+- `geometric:n=N,radius=R,seed=S`: N forwarders placed uniformly in the unit square, linked if closer than R
+- `edgelist:path=FILE`: one link per line, `a b` for a bidirectional link or `a -> b` if `a` peers with `b`
+- `FILE.json`: a declarative topology, see `load()`
+
+All generators accept `rib=default|tree`, the RIB type of the forwarders that are not edges.  Bidirectional links
+make both ends peer with each other.
+
+The generators don't need PiCN, so the topologies can be used by the simulation too; only build() does.
+"""
+
+from typing import Any, Dict, List, Optional
+
+import collections
+import json
+import math
+import os
+import random
+
+
+RIB_TYPES = ['default', 'tree']
+
+
+class Node(object):
+
+    def __init__(self, name: str, peers: List[int] = None, rib: str = 'default',
+                 routes: Dict[str, List[int]] = None):
+        """
+        :param name: The name of the node, unique within its topology
+        :param peers: Indices of the nodes whose RIBs this node requests
+        :param rib: One of RIB_TYPES
+        :param routes: Static FIB entries: prefix -> indices of the next hops
+        """
+        if rib not in RIB_TYPES:
+            raise ValueError(f'Unknown RIB type: {rib}')
+        self.name = name
+        self.peers: List[int] = peers if peers is not None else list()
+        self.rib = rib
+        self.routes: Dict[str, List[int]] = routes if routes is not None else dict()
+
+
+class Topology(object):
+
+    def __init__(self, name: str, nodes: List[Node], client: int, repo: int, edges: List[int] = None):
+        self.name = name
+        self.nodes = nodes
+        self.client = client
+        self.repo = repo
+        self.edges: List[int] = edges if edges is not None else [repo]
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    @property
+    def peers(self) -> List[List[int]]:
+        return [node.peers for node in self.nodes]
+
+    def index(self, name: str) -> int:
+        for i, node in enumerate(self.nodes):
+            if node.name == name:
+                return i
+        raise KeyError(f'No node {name} in topology {self.name}')
+
+    def neighbours(self) -> List[List[int]]:
+        """The peering relation as an undirected graph."""
+        neighbours: List[set] = [set() for _ in self.nodes]
+        for i, node in enumerate(self.nodes):
+            for p in node.peers:
+                neighbours[i].add(p)
+                neighbours[p].add(i)
+        return [sorted(n) for n in neighbours]
+
+    def distances(self, src: int, directed: bool = True) -> List[Optional[int]]:
+        """Hop distances from `src`, following the peers of each node or, if not `directed`, any link."""
+        graph = self.peers if directed else self.neighbours()
+        dist: List[Optional[int]] = [None] * len(self.nodes)
+        dist[src] = 0
+        pending = collections.deque([src])
+        while len(pending) > 0:
+            i = pending.popleft()
+            for p in graph[i]:
+                if dist[p] is None:
+                    dist[p] = dist[i] + 1
+                    pending.append(p)
+        return dist
+
+    def next_hops(self, src: int, dst: int) -> List[int]:
+        """The peers of `src` on the shortest paths to `dst` along the peering relation, i.e. its routes to `dst`."""
+        d = self.distances(src)[dst]
+        if d is None or d == 0:
+            return []
+        return [p for p in self.nodes[src].peers if self.distances(p)[dst] == d - 1]
+
+    def route_distance(self) -> int:
+        """The number of RIB exchanges a route needs to travel from the repository's forwarder to the client's."""
+        d = self.distances(self.client)[self.repo]
+        if d is None:
+            raise ValueError(f'Routes from {self.nodes[self.repo].name} never reach {self.nodes[self.client].name}')
+        return d
+
+    def add_edge_routes(self, prefix: str):
+        """
+        Add static FIB entries for `prefix` from each node to those of its peers that are farther away from the
+        client, i.e. in a tree to its children, so interests for the prefix traverse all edges.
+        """
+        dist = self.distances(self.client, directed=False)
+        for i, node in enumerate(self.nodes):
+            hops = [p for p in node.peers if dist[p] is not None and dist[i] is not None and dist[p] > dist[i]]
+            if len(hops) > 0:
+                node.routes.setdefault(prefix, list()).extend(hops)
+
+    def add_repo_routes(self, prefix: str):
+        """
+        Add static FIB entries for `prefix` from each node to those of its peers that are one hop closer to the
+        repository's node along the peering relation, i.e. the routes the routing layer would converge to.
+        """
+        reverse: List[List[int]] = [list() for _ in self.nodes]
+        for i, node in enumerate(self.nodes):
+            for p in node.peers:
+                reverse[p].append(i)
+        dist: List[Optional[int]] = [None] * len(self.nodes)
+        dist[self.repo] = 0
+        pending = collections.deque([self.repo])
+        while len(pending) > 0:
+            i = pending.popleft()
+            for p in reverse[i]:
+                if dist[p] is None:
+                    dist[p] = dist[i] + 1
+                    pending.append(p)
+        for i, node in enumerate(self.nodes):
+            hops = [p for p in node.peers if dist[i] is not None and dist[p] == dist[i] - 1]
+            if len(hops) > 0:
+                node.routes.setdefault(prefix, list()).extend(hops)
+
+    def to_dict(self) -> Dict[str, Any]:
+        names = [node.name for node in self.nodes]
+        return {
+            'name': self.name,
+            'nodes': [{'name': node.name, 'peers': [names[p] for p in node.peers], 'rib': node.rib,
+                       'routes': {prefix: [names[h] for h in hops] for prefix, hops in node.routes.items()}}
+                      for node in self.nodes],
+            'client': names[self.client],
+            'repo': names[self.repo],
+            'edges': [names[e] for e in self.edges],
+        }
+
+
+def _link(nodes: List[Node], a: int, b: int):
+    if b not in nodes[a].peers:
+        nodes[a].peers.append(b)
+    if a not in nodes[b].peers:
+        nodes[b].peers.append(a)
+
+
+def _set_rib(topology: Topology, rib: str) -> Topology:
+    for i, node in enumerate(topology.nodes):
+        if i not in topology.edges:
+            node.rib = rib
+    return topology
+
+
+def chain(n: int, rib: str = 'default') -> Topology:
+    nodes = [Node(str(i), [i + 1] if i < n - 1 else []) for i in range(n)]
+    return _set_rib(Topology('chain', nodes, 0, n - 1), rib)
+
+
+def breadth(n: int, rib: str = 'default') -> Topology:
+    """The middle layer first, then the client's and the repository's forwarder."""
+    nodes = [Node(str(i), [n + 1]) for i in range(n)]
+    nodes.append(Node('client', list(range(n))))
+    nodes.append(Node('repo'))
+    return _set_rib(Topology('breadth', nodes, n, n + 1), rib)
+
+
+def star(n: int, rib: str = 'default') -> Topology:
+    nodes = [Node('hub', list(range(1, n + 1)))] + [Node(str(i)) for i in range(1, n + 1)]
+    return _set_rib(Topology('star', nodes, 0, n, list(range(1, n + 1))), rib)
+
+
+def tree(k: int, depth: int, rib: str = 'default') -> Topology:
+    """
+    Nodes in breadth-first order.  A node is named after its path from the root, padded with zeros to `depth`
+    digits, e.g. `00`, `10`, `11` for k=3, depth=2 like the routers of the repo hopping test case, or dotted for
+    k >= 10.
+    """
+    def name(path: List[int]) -> str:
+        if k < 10:
+            return ''.join(str(c) for c in path).ljust(depth, '0')
+        return '.'.join(str(c) for c in path) or 'root'
+
+    nodes = [Node(name([]))]
+    level = [(0, [])]
+    for _ in range(depth):
+        next_level = []
+        for parent, path in level:
+            for c in range(1, k + 1):
+                nodes.append(Node(name(path + [c])))
+                nodes[parent].peers.append(len(nodes) - 1)
+                next_level.append((len(nodes) - 1, path + [c]))
+        level = next_level
+    leaves = [i for i, _ in level]
+    return _set_rib(Topology('tree', nodes, 0, leaves[0], leaves), rib)
+
+
+def fattree(k: int, rib: str = 'default') -> Topology:
+    """Core switches first, then aggregation and edge switches pod by pod.  Client and repo are in different pods."""
+    if k < 2 or k % 2 != 0:
+        raise ValueError('The fat-tree arity must be even')
+    half = k // 2
+    nodes = [Node(f'core{i}') for i in range(half * half)]
+    edges: List[int] = []
+    for pod in range(k):
+        aggregation = list(range(len(nodes), len(nodes) + half))
+        nodes += [Node(f'agg{pod}.{j}') for j in range(half)]
+        edge = list(range(len(nodes), len(nodes) + half))
+        nodes += [Node(f'edge{pod}.{j}') for j in range(half)]
+        for j, a in enumerate(aggregation):
+            for c in range(j * half, (j + 1) * half):
+                _link(nodes, a, c)
+            for e in edge:
+                _link(nodes, a, e)
+        edges += edge
+    return _set_rib(Topology('fattree', nodes, edges[0], edges[-1], edges), rib)
+
+
+def geometric(n: int, radius: float, seed: int = 0, rib: str = 'default') -> Topology:
+    """
+    A random geometric graph.  Components are joined by linking their closest nodes, so the graph is connected.
+    The client is the node closest to the origin, the repository the one farthest from it in hops; the edges are
+    the nodes with a single link.
+    """
+    rng = random.Random(seed)
+    pos = [(rng.random(), rng.random()) for _ in range(n)]
+
+    def dist(a: int, b: int) -> float:
+        return math.hypot(pos[a][0] - pos[b][0], pos[a][1] - pos[b][1])
+
+    nodes = [Node(str(i)) for i in range(n)]
+    for a in range(n):
+        for b in range(a + 1, n):
+            if dist(a, b) < radius:
+                _link(nodes, a, b)
+    client = min(range(n), key=lambda i: math.hypot(*pos[i]))
+    topo = Topology('geometric', nodes, client, client)
+    while True:
+        hops = topo.distances(client, directed=False)
+        outside = [i for i in range(n) if hops[i] is None]
+        if len(outside) == 0:
+            break
+        inside = [i for i in range(n) if hops[i] is not None]
+        _link(nodes, *min(((a, b) for a in inside for b in outside), key=lambda p: dist(*p)))
+    topo.repo = max(range(n), key=lambda i: hops[i])
+    topo.edges = [i for i in range(n) if len(nodes[i].peers) == 1] or [topo.repo]
+    return _set_rib(topo, rib)
+
+
+def edgelist(path: str, client: str = None, repo: str = None, rib: str = 'default') -> Topology:
+    """
+    Import links from a file: `a b` for a bidirectional link, `a -> b` if `a` peers with `b`.  Empty lines and
+    lines starting with `#` are ignored.  The client defaults to the first node, the repository to the node farthest
+    away from it; the edges are the nodes with a single link.
+    """
+    nodes: List[Node] = []
+    index: Dict[str, int] = dict()
+
+    def node(name: str) -> int:
+        if name not in index:
+            index[name] = len(nodes)
+            nodes.append(Node(name))
+        return index[name]
+
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if len(line) == 0:
+                continue
+            if '->' in line:
+                a, b = (s.strip() for s in line.split('->', 1))
+                if node(b) not in nodes[node(a)].peers:
+                    nodes[node(a)].peers.append(node(b))
+            else:
+                a, b = line.split()
+                _link(nodes, node(a), node(b))
+    topo = Topology(os.path.splitext(os.path.basename(path))[0], nodes, 0, 0)
+    topo.client = index[client] if client is not None else 0
+    if repo is not None:
+        topo.repo = index[repo]
+    else:
+        dist = topo.distances(topo.client)
+        topo.repo = max((i for i in range(len(nodes)) if dist[i] is not None), key=lambda i: dist[i])
+    topo.edges = [i for i, n in enumerate(topo.neighbours()) if len(n) == 1] or [topo.repo]
+    return _set_rib(topo, rib)
+
+
+def load(path: str) -> Topology:
+    """
+    Load a declarative topology from a JSON file:
+
+        {"nodes": [{"name": "a", "peers": ["b"], "rib": "tree", "routes": {"/edge": ["b"]}}, {"name": "b"}],
+         "client": "a", "repo": "b", "edges": ["b"]}
+
+    Only the node names are required.  `edges` defaults to the repository's forwarder.
+    """
+    with open(path, 'r') as f:
+        spec = json.load(f)
+    names = [n['name'] for n in spec['nodes']]
+    index = {name: i for i, name in enumerate(names)}
+    if len(index) != len(names):
+        raise ValueError(f'Duplicate node names in {path}')
+    nodes = [Node(n['name'], [index[p] for p in n.get('peers', [])], n.get('rib', 'default'),
+                  {prefix: [index[h] for h in hops] for prefix, hops in n.get('routes', dict()).items()})
+             for n in spec['nodes']]
+    edges = [index[e] for e in spec['edges']] if 'edges' in spec else None
+    name = spec.get('name', os.path.splitext(os.path.basename(path))[0])
+    return Topology(name, nodes, index[spec['client']], index[spec['repo']], edges)
+
+
+GENERATORS = {
+    'chain': chain,
+    'breadth': breadth,
+    'star': star,
+    'tree': tree,
+    'fattree': fattree,
+    'geometric': geometric,
+    'edgelist': edgelist,
+}
+
+
+# Spec arguments that are names rather than numbers, e.g. `client=2` names the node `2` of an edge list
+_NAME_ARGS = ['path', 'client', 'repo', 'rib']
+
+
+def _value(s: str):
+    for t in (int, float):
+        try:
+            return t(s)
+        except ValueError:
+            pass
+    return s
+
+
+def parse(spec: str) -> Topology:
+    """Build the topology described by a spec string, e.g. `tree:k=3,depth=2,rib=tree` or `topology.json`."""
+    if spec.endswith('.json'):
+        return load(spec)
+    generator, _, args = spec.partition(':')
+    if generator not in GENERATORS:
+        raise ValueError(f'Unknown topology generator: {generator}')
+    kwargs = dict()
+    for arg in args.split(',') if len(args) > 0 else []:
+        key, value = arg.split('=', 1)
+        kwargs[key] = value if key in _NAME_ARGS else _value(value)
+    return GENERATORS[generator](**kwargs)
+
+
+def build(topology: Topology, ageing: float, manager=None, port_base: int = None, autoconfig: bool = False,
+          static_faces: bool = False, routing: bool = True) -> List:
+    """
+    Create an ICNForwarder for each node of a topology and wire up its peers, RIB and static FIB entries.
+
+    :param ageing: The routing interval of all forwarders
+    :param manager: The multiprocessing Manager the tree RIBs are created with
+    :param port_base: Bind node i to port_base + i instead of a port assigned by the OS
+    :param autoconfig: Start an autoconfig layer on the edge forwarders
+    :param static_faces: Create a static face to each peer, so they never time out
+    :param routing: Start a routing layer on each forwarder; without it, only the static FIB entries are used
+    :return: The forwarders, in the order of topology.nodes
+    """
+    from PiCN.Layers.PacketEncodingLayer.Encoder import NdnTlvEncoder
+    from PiCN.Layers.RoutingLayer.RoutingInformationBase import TreeRoutingInformationBase
+    from PiCN.Packets import Name
+    from PiCN.ProgramLibs.ICNForwarder import ICNForwarder
+
+    forwarders = [ICNForwarder(port_base + i if port_base is not None else 0, encoder=NdnTlvEncoder(), routing=routing,
+                               peers=[], autoconfig=autoconfig and i in topology.edges)
+                  for i in range(len(topology))]
+    # Peers and faces are assigned after the OS assigned the UDP ports.
+    addresses = [f.linklayer.sock.getsockname() for f in forwarders]
+    for i, node in enumerate(topology.nodes):
+        f = forwarders[i]
+        if routing:
+            f.routinglayer._peers = [addresses[p] for p in node.peers]
+            f.routinglayer._ageing_interval = ageing
+        fids = {p: f.linklayer.get_or_create_fid(addresses[p], static=True) for p in node.peers} \
+            if static_faces else dict()
+        if len(node.routes) > 0:
+            fib = f.data_structs['fib']
+            for prefix, hops in node.routes.items():
+                for h in hops:
+                    if h not in fids:
+                        fids[h] = f.linklayer.get_or_create_fid(addresses[h], static=True)
+                    fib.add_fib_entry(Name(prefix), fids[h], static=True)
+            f.data_structs['fib'] = fib
+        if node.rib == 'tree':
+            f.data_structs['rib'] = TreeRoutingInformationBase(manager, shortest_only=False)
+    return forwarders
+
+
+def attach_repo(forwarder, address, prefix, static: bool = False):
+    """
+    Insert a route to a repository at `address` into the RIB of the forwarder it is connected to, or with `static`,
+    into its FIB, for forwarders without a routing layer.
+    """
+    fid = forwarder.linklayer.get_or_create_fid(address, static=True)
+    if static:
+        fib = forwarder.data_structs['fib']
+        fib.add_fib_entry(prefix, fid, static=True)
+        forwarder.data_structs['fib'] = fib
+        return
+    rib = forwarder.data_structs['rib']
+    rib.insert(prefix, fid, 1)
+    forwarder.data_structs['rib'] = rib
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3.6
+
+"""
+Per-layer latency tracing of the packets passing through LayerStacks.
+
+Every layer of a traced stack gets a shim around its data_from_lower()/data_from_higher(), which timestamps each call
+and the first item the layer puts into the neighbouring queues during it, and records them in a ring buffer in
+anonymous shared memory, one per layer, so the layer processes forked after tracing was set up can write their
+records and the measurement process can read them:
+
+- processing time: from the start of the call until it returned
+- queue dwell: from the time the neighbouring layer put the packet into the queue until the call started; both
+  records are matched when the trace is exported, by the packet's name, which is taken from the packet encoding
+  layer's record with the same CRC of the encoded packet for the link layer's records
+- the link layer's socket is wrapped as well, so a datagram received from another node is recorded from the time it
+  was read from the socket until it was passed up, and its dwell is the time since the other node's link layer
+  started sending it (the link transit)
+
+Each ring has a single writer, the process of its layer, so no locking is needed.  A full ring overwrites its oldest
+records.  Nothing is wrapped unless a Tracer is created, so there is no overhead when tracing is off.
+
+The trace of a run is exported as one row per recorded step of each named packet, and as a timeline in the Chrome
+trace event format, which can be opened in Perfetto or chrome://tracing and searched for the name of an interest.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import bisect
+import json
+import mmap
+import os
+import struct
+import zlib
+from time import monotonic
+
+
+# Direction of a call: from the lower layer (up), from the higher layer (down)
+UP = 0
+DOWN = 1
+# Queues the layer put an item into during a call
+TO_HIGHER = 1
+TO_LOWER = 2
+# Kinds of recorded data
+KIND_OTHER = 0
+KIND_INTEREST = 1
+KIND_CONTENT = 2
+KIND_NACK = 3
+KIND_WIRE = 4
+KINDS = ['other', 'interest', 'content', 'nack', 'wire']
+_KIND_OF_CLASS = {'Interest': KIND_INTEREST, 'Content': KIND_CONTENT, 'Nack': KIND_NACK}
+MAX_NAME = 64
+
+
+class TraceRing(object):
+    """Bounded ring buffer of the records of one layer: a write counter followed by the records."""
+
+    # direction, queues put into, kind, CRC of the encoded packet (0 if none), call start, first put (NaN if none),
+    # call end, name (UTF-8, truncated)
+    RECORD = struct.Struct(f'=BBBxIddd{MAX_NAME}s')
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.mm = mmap.mmap(-1, 8 + capacity * TraceRing.RECORD.size)
+        # Whether the layer is in a traced call, in the process of the layer
+        self.busy = False
+
+    def append(self, direction: int, out: int, kind: int, crc: int, start: float, put: float, end: float,
+               name: bytes):
+        n = struct.unpack_from('=Q', self.mm, 0)[0]
+        TraceRing.RECORD.pack_into(self.mm, 8 + (n % self.capacity) * TraceRing.RECORD.size,
+                                   direction, out, kind, crc, start, put, end, name)
+        struct.pack_into('=Q', self.mm, 0, n + 1)
+
+    def written(self) -> int:
+        return struct.unpack_from('=Q', self.mm, 0)[0]
+
+    def records(self) -> List[Tuple[int, int, int, int, float, float, float, str]]:
+        """The records still in the ring, oldest first, with the names decoded."""
+        n = self.written()
+        records = []
+        for k in range(max(0, n - self.capacity), n):
+            direction, out, kind, crc, start, put, end, name = \
+                TraceRing.RECORD.unpack_from(self.mm, 8 + (k % self.capacity) * TraceRing.RECORD.size)
+            records.append((direction, out, kind, crc, start, put, end,
+                            name.rstrip(b'\0').decode('utf-8', 'replace')))
+        return records
+
+
+def describe(data) -> Tuple[int, bytes, int]:
+    """Kind, name and CRC of the encoded packet of an item passed between layers, e.g. [fid, packet]."""
+    packet = data[1] if isinstance(data, (list, tuple)) and len(data) > 1 else data
+    if isinstance(packet, (bytes, bytearray)):
+        return KIND_WIRE, b'', zlib.crc32(packet)
+    name = getattr(packet, 'name', None)
+    if name is None:
+        return KIND_OTHER, b'', 0
+    try:
+        name = name.to_string()
+    except AttributeError:
+        name = str(name)
+    return _KIND_OF_CLASS.get(type(packet).__name__, KIND_OTHER), name.encode()[:MAX_NAME], 0
+
+
+class _Capture(object):
+    """Wraps a queue passed to a layer for one call, and keeps the first item put into it and the time."""
+
+    def __init__(self, q):
+        self._queue = q
+        self.item = None
+        self.time = float('nan')
+
+    def put(self, item, *args, **kwargs):
+        if self.item is None:
+            self.item = item
+            self.time = monotonic()
+        return self._queue.put(item, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._queue, name)
+
+
+def _record(ring: TraceRing, direction: int, start: float, end: float, data, lower: _Capture, higher: _Capture):
+    kind, name, crc = describe(data)
+    out = (TO_HIGHER if higher.item is not None else 0) | (TO_LOWER if lower.item is not None else 0)
+    # Name an encoded packet by what the layer made of it, and vice versa.
+    for q in [higher, lower]:
+        if q.item is not None:
+            k, n, c = describe(q.item)
+            if kind in [KIND_OTHER, KIND_WIRE] and k not in [KIND_OTHER, KIND_WIRE]:
+                kind = k
+            name = name or n
+            crc = crc or c
+    put = min(lower.time, higher.time) if out == TO_HIGHER | TO_LOWER else \
+        (higher.time if out == TO_HIGHER else lower.time)
+    ring.append(direction, out, kind, crc, start, put, end, name)
+
+
+def _trace_layer(layer, ring: TraceRing):
+    for direction, attr in [(UP, 'data_from_lower'), (DOWN, 'data_from_higher')]:
+        original = getattr(layer, attr)
+
+        def traced(to_lower, to_higher, data, original=original, direction=direction):
+            lower, higher = _Capture(to_lower), _Capture(to_higher)
+            ring.busy = True
+            start = monotonic()
+            try:
+                original(lower, higher, data)
+            finally:
+                _record(ring, direction, start, monotonic(), data, lower, higher)
+                ring.busy = False
+
+        setattr(layer, attr, traced)
+
+
+class TracingSocket(object):
+    """Wraps the socket of a link layer and notes when the last datagram was read from it."""
+
+    def __init__(self, sock):
+        self._sock = sock
+        self.received = float('nan')
+
+    def recvfrom(self, bufsize: int, flags: int = 0):
+        data, addr = self._sock.recvfrom(bufsize, flags)
+        self.received = monotonic()
+        return data, addr
+
+    def fileno(self) -> int:
+        return self._sock.fileno()
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+class _LinkUpQueue(object):
+    """
+    Wraps the queue a link layer passes received datagrams up with, and records each of them, unless the link layer
+    passed it up from a traced call.
+    """
+
+    def __init__(self, q, sock: TracingSocket, ring: TraceRing):
+        self._queue = q
+        self._sock = sock
+        self._ring = ring
+
+    def put(self, item, *args, **kwargs):
+        if not self._ring.busy:
+            put = monotonic()
+            kind, name, crc = describe(item)
+            self._ring.append(UP, TO_HIGHER, kind, crc, self._sock.received, put, put, name)
+        return self._queue.put(item, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._queue, name)
+
+
+# A recorded step: node, layer index (top to bottom) and name, direction, queues put into, kind, name, CRC, call
+# start, first put, call end, and the dwell before the call (NaN if the packet's sender wasn't traced)
+Step = Tuple[str, int, str, int, int, int, str, int, float, float, float, float]
+
+
+class Tracer(object):
+    """
+    Traces the layers of LayerStacks, keeping up to `capacity` records per layer.  Must be set up after the stacks
+    were attached to a MemoryLinkFabric or a ForwarderHost, if any, and before they are started.
+    """
+
+    def __init__(self, capacity: int = 8192):
+        self.capacity = capacity
+        self.start_time = monotonic()
+        # node, layer index, layer name, ring
+        self.layers: List[Tuple[str, int, str, TraceRing]] = list()
+
+    def add(self, node: str, stack):
+        """Trace every layer of a stack; its link layer is the one with a socket."""
+        for i, layer in enumerate(stack.layers):
+            ring = TraceRing(self.capacity)
+            self.layers.append((node, i, type(layer).__name__, ring))
+            _trace_layer(layer, ring)
+            if getattr(layer, 'sock', None) is not None:
+                layer.sock = TracingSocket(layer.sock)
+                layer.queue_to_higher = _LinkUpQueue(layer.queue_to_higher, layer.sock, ring)
+
+    def _bottom(self) -> Dict[str, int]:
+        """The index of the link layer of each node."""
+        return {node: i for node, i, _, _ in self.layers}
+
+    def overwritten(self) -> int:
+        """Records lost because a ring was full."""
+        return sum(max(0, ring.written() - ring.capacity) for _, _, _, ring in self.layers)
+
+    def steps(self) -> List[Step]:
+        """All records, named through the CRCs of the encoded packets, with the dwell before each, by start time."""
+        records = [(node, i, layer) + r for node, i, layer, ring in self.layers for r in ring.records()]
+        # The packet encoding layer sees both the name and the encoded packet.
+        names: Dict[int, Tuple[int, str]] = {r[6]: (r[5], r[10]) for r in records if r[6] != 0 and r[10] != ''}
+        named = []
+        for node, i, layer, direction, out, kind, crc, start, put, end, name in records:
+            if name == '' and crc in names:
+                kind, name = names[crc]
+            named.append((node, i, layer, direction, out, kind, name, crc, start, put, end))
+        # Put times into each layer's upper and lower queue, by packet, and send times of each encoded packet
+        puts: Dict[Tuple[str, int, int], Dict[str, List[float]]] = dict()
+        sent: Dict[int, List[Tuple[float, str]]] = dict()
+        bottom = self._bottom()
+        for node, i, _, direction, out, kind, name, crc, start, put, end in named:
+            if put == put:
+                for q in [TO_HIGHER, TO_LOWER]:
+                    if out & q:
+                        puts.setdefault((node, i, q), dict()).setdefault(name, []).append(put)
+            if i == bottom[node] and direction == DOWN and crc != 0:
+                # The datagram may be received before the sending call returned.
+                sent.setdefault(crc, []).append((start, node))
+        for d in list(puts.values()):
+            for times in d.values():
+                times.sort()
+        for times in sent.values():
+            times.sort()
+        steps = []
+        for node, i, layer, direction, out, kind, name, crc, start, put, end in named:
+            if i == bottom[node] and direction == UP:
+                # Sent by the link layer of another node
+                before = [t for t, n in sent.get(crc, []) if n != node and t <= start]
+                previous = before[-1] if len(before) > 0 else None
+            else:
+                feeder = (node, i + 1, TO_HIGHER) if direction == UP else (node, i - 1, TO_LOWER)
+                # By name only, as a layer may answer an Interest with a Content or a Nack
+                times = puts.get(feeder, dict()).get(name, [])
+                k = bisect.bisect_right(times, start)
+                previous = times[k - 1] if k > 0 else None
+            dwell = start - previous if previous is not None else float('nan')
+            steps.append((node, i, layer, direction, out, kind, name, crc, start, put, end, dwell))
+        steps.sort(key=lambda s: s[8])
+        return steps
+
+    def write(self, basename: str, params: List, run: int, start_time: Optional[float] = None):
+        """
+        Write the steps of all named packets to `<basename>_trace.csv`, and the timeline of the run to
+        `<basename>_trace/<params>_<run>.json`.  Times are relative to `start_time`, by default the Tracer's creation.
+        """
+        t0 = start_time if start_time is not None else self.start_time
+        steps = [s for s in self.steps() if s[6] != '']
+        prefix = ','.join(str(p) for p in params) + f',{run}'
+        filename = f'{basename}_trace.csv'
+        with open(filename, 'a') as f:
+            for node, i, layer, direction, _, kind, name, _, start, _, end, dwell in steps:
+                f.write(f'{prefix},{name},{KINDS[kind]},{node},{layer},{"up" if direction == UP else "down"},'
+                        f'{start - t0},{"" if dwell != dwell else dwell},{end - start}\n')
+        print(f'Wrote data to file {filename}')
+        overwritten = self.overwritten()
+        if overwritten > 0:
+            print(f'Trace rings overwrote {overwritten} records, increase the trace option to keep all')
+
+        bottom = self._bottom()
+        nodes = {node: pid for pid, node in enumerate(bottom)}
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': node}}
+                  for node, pid in nodes.items()]
+        for node, i, layer, _ in self.layers:
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': nodes[node], 'tid': 2 * i,
+                           'args': {'name': layer}})
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': nodes[node], 'tid': 2 * i + 1,
+                           'args': {'name': f'{layer} queue'}})
+        for node, i, layer, direction, _, kind, name, _, start, _, end, dwell in steps:
+            args = {'kind': KINDS[kind], 'direction': 'up' if direction == UP else 'down'}
+            events.append({'name': name, 'cat': 'process', 'ph': 'X', 'pid': nodes[node], 'tid': 2 * i,
+                           'ts': (start - t0) * 1e6, 'dur': (end - start) * 1e6, 'args': args})
+            if dwell == dwell:
+                events.append({'name': name, 'cat': 'link' if i == bottom[node] and direction == UP else 'queue',
+                               'ph': 'X', 'pid': nodes[node], 'tid': 2 * i + 1, 'ts': (start - dwell - t0) * 1e6,
+                               'dur': dwell * 1e6, 'args': args})
+        directory = f'{basename}_trace'
+        os.makedirs(directory, exist_ok=True)
+        filename = os.path.join(directory, '_'.join(str(p) for p in params) + f'_{run}.json')
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        print(f'Wrote timeline to {filename}')